@@ -2,4 +2,6 @@
 # eval "$(conda shell.bash hook)"
 # conda activate mpxradar
 source $CONDA_BASE/bin/activate mpxradar
+# full rebuild, "python data.py --incremental" only preprocesses samples
+# imported or modified (pathosonar property MODIFIED) since the last build
 python data.py
@@ -1,14 +1,17 @@
+import argparse
 from collections import defaultdict
-import csv
-from datetime import datetime
+from datetime import date
 import multiprocessing as mp
 import os
 from pathlib import Path
+import shutil
+import tempfile
 from time import perf_counter
 from urllib.parse import urlparse
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 from sqlalchemy import create_engine
 from sqlalchemy import exc
 
@@ -16,16 +19,78 @@ from pages.app_controller import calculate_mutation_sig
 from pages.app_controller import calculate_tri_mutation_sig
 from pages.app_controller import create_snp_table
 from pages.config import CACHE_DIR
+from pages.config import DB_CHUNK_SIZE
 from pages.config import DB_URL
 from pages.config import redis_manager
-from pages.utils import load_Cpickle
-from pages.utils import write_Cpickle
+from pages.config import SNAPSHOT_DIR
+from pages.config import SNAPSHOT_SHM_DIR
+from pages.utils_result_cache import remove_results
+from pages.utils_sample_index import create_sample_index
+from pages.utils_sample_index import group_sample_ids
+from pages.utils_sample_index import merge_sample_id_groups
+from pages.utils_sample_index import PROPERTY_INDEX_COLUMNS
+from pages.utils_sample_index import SAMPLE_ID_TYPE
+from pages.utils_sample_index import unique_sample_ids
+from pages.utils_sample_index import VARIANT_INDEX_COLUMNS
+from pages.utils_snapshot import iter_partitions
+from pages.utils_snapshot import load_snapshot
+from pages.utils_snapshot import partition_file_name
+from pages.utils_snapshot import publish_snapshot
+from pages.utils_snapshot import read_manifest
+from pages.utils_snapshot import read_partition
+from pages.utils_snapshot import to_nested_dict
+from pages.utils_snapshot import write_partition
+from pages.utils_snapshot import write_snapshot
+from pages.utils_worldMap_explorer import DATE_ORDINAL_COLUMN
 
 tables = ["propertyView", "variantView"]
 
 # pandas normally uses python strings, which have about 50 bytes overhead. that's catastrophic!
 STRINGTYPE = "string[pyarrow]"
 INTTYPE = "int32"
+# column types of the Arrow files written while streaming tables from DB
+ARROW_TYPES = {STRINGTYPE: pa.string(), INTTYPE: pa.int32(), "float32": pa.float32()}
+# property.name values stored in value_date / value_integer instead of value_text
+DATE_PROPERTIES = ["COLLECTION_DATE", "RELEASE_DATE", "IMPORTED"]
+# set by pathosonar when data of an imported sample changes, only used by incremental rebuilds
+MODIFIED_PROPERTY = "MODIFIED"
+INTEGER_PROPERTIES = ["LENGTH"]
+# date.toordinal() of 1970-01-01, day 0 of datetime64[D]
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# property columns of the processed propertyView, also if no loaded sample has the property
+PROPERTY_COLUMNS = [
+    "COLLECTION_DATE",
+    "COUNTRY",
+    "GENOME_COMPLETENESS",
+    "GEO_LOCATION",
+    "HOST",
+    "IMPORTED",
+    "ISOLATE",
+    "LENGTH",
+    "RELEASE_DATE",
+    "SEQ_TECH",
+]
+# samples with same values are collected into one row of the world_map,
+# rows are sorted by date first -> a date interval is a slice of the world_map
+WORLD_MAP_GROUP_COLUMNS = [
+    "COLLECTION_DATE",
+    "COUNTRY",
+    "variant.label",
+    "SEQ_TECH",
+    "element.symbol",
+]
+# one row per sample and reference in the profiles table
+PROFILE_KEY_COLUMNS = [
+    "sample.id",
+    "sample.name",
+    "reference.id",
+    "reference.accession",
+]
+# {seq_type: (variant column, profile column)}
+PROFILE_COLUMNS = {
+    "cds": ("gene:variant", "AA_PROFILE"),
+    "source": ("variant.label", "NUC_PROFILE"),
+}
 
 column_dtypes = {
     "propertyView": {
@@ -147,10 +212,10 @@ class DataFrameLoader:
     """
     connect to DB and loading of DB entires into panda dataframes
     loaded are the column of tables (defined in table) -> defined in variable needed_columns
-    data types used for download from DB and reading from csv -> defined in variable column_dtypes
+    data types used for download from DB and Arrow files -> defined in variable column_dtypes
     two different download funtions for test DB and normal DB
     parallel loading of different tables (not for test DBs)
-    writes downloaded tables as csv to .cache (not for test DBs)
+    streams downloaded tables as Arrow files to .cache (not for test DBs)
 
     ...
     Attributes
@@ -163,17 +228,24 @@ class DataFrameLoader:
         dict{table_name: list of needed columns for website}
     column_dtypes: dict(dict)
         dict{table_name: dict{column name: data type}}
+    chunk_size: int
+        number of rows fetched from DB per round trip while streaming a table
 
     """
 
-    def __init__(self, db_name: str):
+    def __init__(self, db_name: str, chunk_size: int = DB_CHUNK_SIZE):
         self.db_name = db_name
+        self.chunk_size = chunk_size
         self.tables = tables
         self.needed_columns = needed_columns
         self.column_dtypes = column_dtypes
 
-    def define_sql_query_and_get_dtypes(self, table_name: str) -> (str, dict):
+    def define_sql_query_and_get_dtypes(
+        self, table_name: str, high_water_mark: dict = None
+    ) -> (str, dict):
         """
+        :param high_water_mark: only query samples imported or modified since the high water mark,
+            see get_high_water_mark
         :return: SQL query for table with selection of needed columns and added correct quoting
         :return: dict for data types of selected columns
         """
@@ -199,52 +271,102 @@ class DataFrameLoader:
                 column: self.column_dtypes[table_name][column] for column in columns
             }
             queried_columns = "*"
-        query = f"SELECT {queried_columns} FROM {table_name};"
+        query = f"SELECT {queried_columns} FROM {table_name}"
+        if high_water_mark:
+            query += f" WHERE {self.define_high_water_mark_condition(high_water_mark)}"
+        query += ";"
         return query, types
 
-    def load_db_from_sql(self, table_name: str) -> (str, dict):
+    @staticmethod
+    def define_high_water_mark_condition(high_water_mark: dict) -> str:
+        """
+        new samples have a higher sample.id,
+        pathosonar sets MODIFIED of changed samples (updated properties, imported again)
+        -> changed samples were modified at or after the date of the last build
+        MODIFIED is a date: samples modified on the day of the last build are queried again
+
+        :return: SQL condition selecting new and changed samples
+        """
+        condition = f"`sample.id` > {int(high_water_mark['sample.id'])}"
+        if high_water_mark.get(MODIFIED_PROPERTY):
+            modified = date.fromisoformat(
+                high_water_mark[MODIFIED_PROPERTY]
+            ).isoformat()
+            condition += (
+                " OR `sample.id` IN (SELECT `sample.id` FROM propertyView"
+                f" WHERE `property.name` = '{MODIFIED_PROPERTY}'"
+                f" AND value_date >= '{modified}')"
+            )
+        return condition
+
+    def load_sample_ids(self) -> np.ndarray:
         """
-        download table of DB and write .csv into .cache
+        ids of all samples in DB, samples missing in the DB were deleted since the last build
+
+        :return: sorted array of sample ids
+        """
+        df = pd.read_sql_query(
+            "SELECT DISTINCT `sample.id` FROM propertyView;",
+            con=get_database_connection(self.db_name),
+        )
+        return np.sort(df["sample.id"].to_numpy(dtype=SAMPLE_ID_TYPE))
+
+    def load_db_from_sql(
+        self, table_name: str, high_water_mark: dict = None
+    ) -> (str, dict):
+        """
+        stream table of DB into an Arrow IPC file in .cache
+        rows are fetched with a server-side cursor in chunks of chunk_size rows and written
+        as typed record batches -> memory usage does not depend on the number of rows
 
         :param table_name: name of the DB table to query
-        :return: (path to csv, dtypes dict {column_name: dtype (from column_dtypes)})
+        :param high_water_mark: only load samples imported or modified since the high water mark
+        :return: (path to arrow file, dtypes dict {column_name: dtype (from column_dtypes)})
         """
-        # cpu_number=  mp.current_process().name.split("-")[-1]  # Get the CPU number
-        # print(cpu_number)
         start = perf_counter()
-        db_connection = get_database_connection(self.db_name)
+        path_to_file = os.path.join(CACHE_DIR, f"{table_name}.arrow")
         try:
-            query, types = self.define_sql_query_and_get_dtypes(table_name)
-            # we cannot use read_sql_table because it doesn't allow defining dtypes
-            path_to_csv = f".cache/{table_name}.csv"
-            if table_name == "variantView":
-                with open(path_to_csv, "w") as tmpfile:
-                    outcsv = csv.writer(tmpfile, lineterminator="\n")
-                    engine = db_connection
-                    connection = engine.connect()
-                    cursor = connection.execute(query)
-                    headers = []
-                    for columns in cursor.keys():
-                        headers.append(columns)
-                    # dump column titles
-                    outcsv.writerows([headers])
-                    # dump rows
-                    outcsv.writerows(cursor.fetchall())
-            else:
-                df = pd.read_sql_query(
-                    query,
-                    con=db_connection,
-                    dtype=types,
+            query, types = self.define_sql_query_and_get_dtypes(
+                table_name, high_water_mark
+            )
+            schema = pa.schema(
+                [(column, ARROW_TYPES[dtype]) for column, dtype in types.items()]
+            )
+            engine = get_database_connection(self.db_name)
+            with engine.connect() as connection:
+                result = connection.execution_options(stream_results=True).execute(
+                    query
                 )
-                # FIXME: should put , doublequote=True, or
-                df.to_csv(path_to_csv, index=False)
+                nb_rows = 0
+                with pa.OSFile(path_to_file, "wb") as sink:
+                    with pa.ipc.new_file(sink, schema) as writer:
+                        while rows := result.fetchmany(self.chunk_size):
+                            writer.write_batch(self.rows_to_record_batch(rows, schema))
+                            nb_rows += len(rows)
+                            duration = perf_counter() - start
+                            print(
+                                f"{table_name}: {nb_rows} rows streamed "
+                                f"({nb_rows / duration:.0f} rows/sec)"
+                            )
         # missing table
         except exc.ProgrammingError:
             print(f"table {table_name} not in database.")
         print(f"Loading time {table_name}: {(perf_counter() - start):.4f} sec.")
-        return path_to_csv, types
+        return path_to_file, types
+
+    @staticmethod
+    def rows_to_record_batch(rows: list, schema: pa.Schema) -> pa.RecordBatch:
+        """
+        convert fetched rows into columns of the schema types,
+        e.g. integer ids of the DB are cast into strings for STRINGTYPE columns
+        """
+        arrays = [
+            pa.array(values).cast(field.type)
+            for values, field in zip(zip(*rows), schema)
+        ]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
 
-    def load_from_sql_db(self) -> dict:
+    def load_from_sql_db(self, high_water_mark: dict = None) -> dict:
         # NOTE: WARN:
         """
         Avoid shifting large amounts of data between processes.
@@ -252,15 +374,16 @@ class DataFrameLoader:
         to distribute the tasks between the workers and retrieve their results.
         If an object larger than the buffer is pushed trough the pipe,
         there are chances the logic might hang. We can dump the job result to files
-        (e.g., using pickle) and return/send the filename.
+        (here Arrow IPC files) and return/send the filename.
         We can prevent logic from getting stuck and pipe becomes a severe bottleneck.
         (Hopefully notice speed improvements as well)
 
+        :param high_water_mark: only load samples imported or modified since the high water mark
         :return: df_dict {table_name: pandas dataframe}
         """
         pool = mp.Pool(mp.cpu_count())
-        path_to_csv_types_list = pool.starmap(
-            self.load_db_from_sql, [[table] for table in self.tables]
+        path_types_list = pool.starmap(
+            self.load_db_from_sql, [[table, high_water_mark] for table in self.tables]
         )
         pool.close()  # tells the pool not to accept any new job.
         pool.terminate()
@@ -268,23 +391,30 @@ class DataFrameLoader:
         # blocking the parent process is just a side effect of what pool.join is doing.
 
         # NOTE: HARD CODE
-        # read results back.
+        # read results back, arrow strings are kept as string[pyarrow] without conversion
         df_dict = {}
-        for path, types in path_to_csv_types_list:
-            df_dict[Path(path).stem] = pd.read_csv(path, dtype=types)
+        for path, types in path_types_list:
+            with pa.memory_map(path, "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            df_dict[Path(path).stem] = table.to_pandas(
+                types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get
+            )
         return df_dict
 
-    def load_db_from_test_db(self) -> dict:
+    def load_db_from_test_db(self, high_water_mark: dict = None) -> dict:
         """
-        loading of test db without writing csv to cache
+        loading of test db without writing Arrow files to cache
 
+        :param high_water_mark: only load samples imported or modified since the high water mark
         :return: df_dict {table_name: pandas dataframe}
         """
         db_connection = get_database_connection(self.db_name)
         df_dict = {}
         for table in self.needed_columns.keys():
             try:
-                query, types = self.define_sql_query_and_get_dtypes(table)
+                query, types = self.define_sql_query_and_get_dtypes(
+                    table, high_water_mark
+                )
                 df = pd.read_sql_query(
                     sql=query,
                     con=db_connection,
@@ -312,34 +442,38 @@ def create_property_view(df: pd.DataFrame) -> pd.DataFrame:
         ['sample.id', 'sample.name', 'property.name', 'value_integer', 'value_text', 'value_date']
     :return: df with columns
         ['sample.id', 'sample.name', 'COLLECTION_DATE', 'COUNTRY', 'GENOME_COMPLETENESS',
-        'GEO_LOCATION', 'HOST', 'IMPORTED', 'ISOLATE', 'LENGTH', 'RELEASE_DATE', 'SEQ_TECH']
-    """
-    #  all dates and integer values into value_date column for unstacking
-    df["value_text"] = df.apply(
-        lambda row: row["value_date"]
-        if row["property.name"] in ["COLLECTION_DATE", "RELEASE_DATE", "IMPORTED"]
-        else row["value_text"],
-        axis=1,
-    )
-    df = df.drop(columns=["value_date"], axis=1)
-    df["value_text"] = df.apply(
-        lambda row: row["value_integer"]
-        if row["property.name"] in ["LENGTH"]
-        else row["value_text"],
-        axis=1,
-    )
-    df = df.drop(columns=["value_integer"], axis=1)
+        'GEO_LOCATION', 'HOST', 'IMPORTED', 'ISOLATE', 'LENGTH', 'RELEASE_DATE', 'SEQ_TECH',
+        DATE_ORDINAL_COLUMN]
+    """
+    # MODIFIED is set by updates only, it would be missing in full builds of unchanged samples
+    df = df[df["property.name"] != MODIFIED_PROPERTY]
+    # all dates and integer values into value_text column for unstacking
+    # masks are evaluated once per category instead of once per row
+    property_name = df["property.name"].astype("category")
+    date_mask = property_name.isin(DATE_PROPERTIES).to_numpy()
+    integer_mask = property_name.isin(INTEGER_PROPERTIES).to_numpy()
+    value_text = df["value_text"].to_numpy(dtype=object)
+    value_text[date_mask] = df["value_date"].to_numpy(dtype=object)[date_mask]
+    value_text[integer_mask] = df["value_integer"].to_numpy(dtype=object)[integer_mask]
     cols = ["sample.id", "sample.name"]
-    df = df.set_index(["property.name"] + cols).unstack("property.name")
-    df = df.value_text.rename_axis([None], axis=1).reset_index()
+    df = df[cols + ["property.name"]].assign(value_text=value_text)
+    df = df.set_index(["property.name"] + cols)["value_text"].unstack("property.name")
+    # small deltas of incremental rebuilds may lack properties or samples
+    columns = df.columns.union(
+        pd.Index(PROPERTY_COLUMNS, dtype=df.columns.dtype), sort=False
+    )
+    df = df.reindex(columns=columns).rename_axis(None, axis=1).reset_index()
     df["COLLECTION_DATE"].fillna(df["RELEASE_DATE"], inplace=True)
     # delete entries without collection and release date else nan errors:
     df = df.dropna(subset=["COLLECTION_DATE"])
-    # delete entries without collection and release date else nan errors:
-    df = df.dropna(subset=["COLLECTION_DATE"])
-    df["COLLECTION_DATE"] = df["COLLECTION_DATE"].apply(
-        lambda d: datetime.strptime(d, "%Y-%m-%d").date()
-    )
+    # dates are parsed once per distinct value, samples share the date objects
+    date_codes, date_values = pd.factorize(df["COLLECTION_DATE"])
+    dates = pd.to_datetime(date_values.astype(object), format="%Y-%m-%d")
+    df["COLLECTION_DATE"] = dates.date[date_codes]
+    # integer days for the date filters, the date objects are kept for display
+    df[DATE_ORDINAL_COLUMN] = (
+        dates.to_numpy(dtype="datetime64[D]").astype(INTTYPE) + EPOCH_ORDINAL
+    )[date_codes]
     df["SEQ_TECH"] = df["SEQ_TECH"].replace([np.nan, ""], "undefined")
     df["COUNTRY"] = df["COUNTRY"].replace([np.nan, ""], "undefined")
     df["LENGTH"] = df["LENGTH"].astype(float).astype("Int64")
@@ -380,7 +514,7 @@ def create_world_map_df(
     """
     created df used for explorer tool by following steps:
     1. merge propertyView and variatView df
-    2. concat all strain_ids into one comma separated string list if they have the same
+    2. collect all strain_ids into one sorted int array if they have the same
     location_ID, date, amino_acid-variant --> new column sample_id_list
     3. count samples with same properties --> new column number_sequences
     4. combine element.symbol:variant.label to new column gene:variant
@@ -403,23 +537,20 @@ def create_world_map_df(
             "element.symbol",
         ]
     ]
-    # same location_ID, date, amino_acid --> concat all strain_ids into comma separated string list
-    df = (
-        df.groupby(
-            [
-                "COUNTRY",
-                "COLLECTION_DATE",
-                "variant.label",
-                "SEQ_TECH",
-                "element.symbol",
-            ],
-            dropna=False,
-        )["sample.id"]
-        .apply(lambda x: ",".join([str(y) for y in set(x)]))
-        .reset_index(name="sample_id_list")
-    )
+    # same location_ID, date, amino_acid --> sorted array of all distinct sample ids
+    df = group_sample_ids(df, WORLD_MAP_GROUP_COLUMNS)
+    return add_world_map_columns(df)
+
+
+def add_world_map_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    add columns number_sequences and gene:variant to grouped world_df
+
+    :param df: df of group_sample_ids with WORLD_MAP_GROUP_COLUMNS
+    :return: world_df
+    """
     # add sequence count
-    df["number_sequences"] = df["sample_id_list"].apply(lambda x: len(x.split(",")))
+    df["number_sequences"] = df["sample_id_list"].map(len)
     df["gene:variant"] = (
         df["element.symbol"].astype(str) + ":" + df["variant.label"].astype(str)
     )
@@ -439,6 +570,78 @@ def create_world_map_df(
     return df
 
 
+def create_mutation_cube(
+    variantView: pd.DataFrame, propertyView: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    precomputed mutation frequencies for the mutation filter of the explore tool:
+    number of variantView rows (= samples) per gene, mutation, seq tech and country
+
+    :param variantView: cds variantView of one reference
+    :return: df with columns ["element.symbol", "gene:variant", "SEQ_TECH", "COUNTRY", "count"]
+    """
+    df = pd.merge(
+        propertyView[["sample.id", "SEQ_TECH", "COUNTRY"]],
+        variantView[["sample.id", "element.symbol", "gene:variant"]],
+        how="inner",
+        on="sample.id",
+    )
+    return (
+        df.groupby(
+            ["element.symbol", "gene:variant", "SEQ_TECH", "COUNTRY"], dropna=False
+        )
+        .size()
+        .reset_index(name="count")
+    )
+
+
+def create_profiles(variantViews: dict) -> pd.DataFrame:
+    """
+    precomputed mutation profiles of the explore and compare tables:
+    all variants of a sample combined into one comma separated string,
+    profiles are stored as categoricals, samples with equal profiles share one string
+
+    :param variantViews: {seq_type: variantView} of one completeness and reference
+    :return: df with columns ["sample.id", "sample.name", "reference.id",
+        "REFERENCE_ACCESSION", "AA_PROFILE", "NUC_PROFILE"], one row per sample with variants
+    """
+    profiles = []
+    for seq_type, (variant_column, profile_column) in PROFILE_COLUMNS.items():
+        df = variantViews[seq_type][PROFILE_KEY_COLUMNS + [variant_column]]
+        profiles.append(
+            df.drop_duplicates()
+            .astype({variant_column: str})
+            .groupby(PROFILE_KEY_COLUMNS, dropna=False, sort=False)[variant_column]
+            .agg(",".join)
+            .rename(profile_column)
+            .reset_index()
+        )
+    df = pd.merge(*profiles, how="outer", on=PROFILE_KEY_COLUMNS)[
+        PROFILE_KEY_COLUMNS
+        + [profile_column for _, profile_column in PROFILE_COLUMNS.values()]
+    ]
+    return encode_profiles(
+        df.rename(columns={"reference.accession": "REFERENCE_ACCESSION"})
+    )
+
+
+def encode_profiles(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param df: profiles of create_profiles, e.g. concatenated profiles of an incremental rebuild
+    :return: df sorted by sample id, profile columns as categoricals
+    """
+    return (
+        df.astype(
+            {
+                profile_column: "category"
+                for _, profile_column in PROFILE_COLUMNS.values()
+            }
+        )
+        .sort_values("sample.id")
+        .reset_index(drop=True)
+    )
+
+
 def remove_seq_errors_and_add_gene_var_column(
     variantView: pd.DataFrame, reference_id: int, seq_type: str
 ) -> pd.DataFrame:
@@ -482,43 +685,564 @@ def create_empty_processed_df(reference_ids: list[int]) -> dict:
     for completeness in ["complete", "partial"]:
         processed_df_dict["variantView"][completeness] = {}
         processed_df_dict["world_map"][completeness] = {}
+        processed_df_dict["mutation_cube"][completeness] = {}
+        processed_df_dict["profiles"][completeness] = {}
+        processed_df_dict["property_index"][completeness] = {}
+        processed_df_dict["variant_index"][completeness] = {}
         for reference_id in reference_ids:
             processed_df_dict["variantView"][completeness][reference_id] = {}
+            processed_df_dict["variant_index"][completeness][reference_id] = {
+                "source": {},
+                "cds": {},
+            }
     return processed_df_dict
 
 
+def get_reference_ids(loaded_df_dict: dict) -> list[int]:
+    """
+    :return: ids of all references of the loaded variantView
+    """
+    # TODO why NaN in reference --> database error?
+    return [
+        int(ref)
+        for ref in loaded_df_dict["variantView"]["reference.id"].dropna().unique()
+    ]
+
+
+def preprocess_partition(
+    propertyView: pd.DataFrame, variantView: pd.DataFrame, reference_id: int
+) -> (dict, dict):
+    """
+    create all tables of one completeness and reference partition,
+    partitions are independent of each other
+
+    :param propertyView: propertyView of one completeness
+    :param variantView: variantView of create_variant_view with variants of reference_id
+    :return: {"variantView": {seq_type: df}, "world_map": df, "mutation_cube": df,
+        "profiles": df, "variant_index": {seq_type: {column: df}}}
+    :return: {stage: duration in sec}
+    """
+    timings = {}
+    start = perf_counter()
+    variantView = variantView[variantView["sample.id"].isin(propertyView["sample.id"])]
+    partition = {
+        "variantView": {
+            seq_type: remove_seq_errors_and_add_gene_var_column(
+                variantView, reference_id, seq_type
+            )
+            for seq_type in ["source", "cds"]
+        }
+    }
+    timings["variantView"] = perf_counter() - start
+    start = perf_counter()
+    partition["world_map"] = create_world_map_df(
+        partition["variantView"]["cds"], propertyView
+    )
+    timings["world_map"] = perf_counter() - start
+    # mutation frequencies of AA variants
+    start = perf_counter()
+    partition["mutation_cube"] = create_mutation_cube(
+        partition["variantView"]["cds"], propertyView
+    )
+    timings["mutation_cube"] = perf_counter() - start
+    start = perf_counter()
+    partition["profiles"] = create_profiles(partition["variantView"])
+    timings["profiles"] = perf_counter() - start
+    start = perf_counter()
+    partition["variant_index"] = {
+        seq_type: {
+            column: create_sample_index(partition["variantView"][seq_type], column)
+            for column in columns
+        }
+        for seq_type, columns in VARIANT_INDEX_COLUMNS.items()
+    }
+    timings["variant_index"] = perf_counter() - start
+    return partition, timings
+
+
+def preprocess_partition_files(
+    work_dir: str, completeness: str, reference_id: int
+) -> (list, dict):
+    """
+    worker of the process pool of preprocess_tables:
+    inputs and results are passed as Arrow files in work_dir, not pickled through the pipe
+
+    :return: [(keys of partition in processed_df_dict, file name)]
+    :return: {stage: duration in sec}
+    """
+    partition, timings = preprocess_partition(
+        read_partition(os.path.join(work_dir, f"propertyView.{completeness}.arrow")),
+        read_partition(os.path.join(work_dir, f"variantView.{reference_id}.arrow")),
+        reference_id,
+    )
+    start = perf_counter()
+    files = []
+    for keys, df in iter_partitions(partition):
+        keys = (keys[0], completeness, reference_id) + keys[1:]
+        file_name = partition_file_name(keys)
+        write_partition(df, os.path.join(work_dir, file_name))
+        files.append((keys, file_name))
+    timings["write results"] = perf_counter() - start
+    return files, timings
+
+
+def preprocess_tables(  # noqa: C901
+    loaded_df_dict: dict, reference_ids: list[int], jobs: int = 1
+) -> dict:
+    """
+    create all tables of processed_df_dict from the loaded DB tables
+    completeness and reference partitions are processed by a pool of jobs processes
+
+    :param loaded_df_dict: {"propertyView": df, "variantView": df} of DataFrameLoader,
+        tables are deleted from the dict after processing
+    :param reference_ids: references of processed_df_dict
+    :param jobs: number of processes, 1 -> all partitions in this process
+    :return: processed_df_dict
+    """
+    timings = defaultdict(float)
+    processed_df_dict = create_empty_processed_df(reference_ids)
+    # propertyView
+    start = perf_counter()
+    processed_propertyView = create_property_view(loaded_df_dict["propertyView"])
+    for completeness in ["complete", "partial"]:
+        processed_df_dict["propertyView"][completeness] = processed_propertyView[
+            processed_propertyView["GENOME_COMPLETENESS"] == completeness
+        ].reset_index(drop=True)
+    del processed_propertyView
+    del loaded_df_dict["propertyView"]
+    timings["propertyView"] = perf_counter() - start
+    # variantView, split by reference
+    start = perf_counter()
+    processed_variantView = create_variant_view(
+        loaded_df_dict["variantView"],
+        set(processed_df_dict["propertyView"]["complete"]["sample.id"]).union(
+            processed_df_dict["propertyView"]["partial"]["sample.id"]
+        ),
+    )
+    del loaded_df_dict["variantView"]
+    reference_variantViews = {
+        reference_id: processed_variantView[
+            processed_variantView["reference.id"] == reference_id
+        ].reset_index(drop=True)
+        for reference_id in reference_ids
+    }
+    del processed_variantView
+    timings["split variantView"] = perf_counter() - start
+    # worldMap, mutation frequencies and indexes of variants
+    start = perf_counter()
+    partition_keys = [
+        (completeness, reference_id)
+        for completeness in ["complete", "partial"]
+        for reference_id in reference_ids
+    ]
+    if jobs > 1:
+        results = preprocess_partitions_in_pool(
+            processed_df_dict["propertyView"],
+            reference_variantViews,
+            partition_keys,
+            jobs,
+            timings,
+        )
+    else:
+        results = []
+        for completeness, reference_id in partition_keys:
+            partition, partition_timings = preprocess_partition(
+                processed_df_dict["propertyView"][completeness],
+                reference_variantViews[reference_id],
+                reference_id,
+            )
+            results.append(
+                (
+                    [
+                        ((keys[0], completeness, reference_id) + keys[1:], df)
+                        for keys, df in iter_partitions(partition)
+                    ],
+                    partition_timings,
+                )
+            )
+    for partition, partition_timings in results:
+        for keys, df in partition:
+            parent = processed_df_dict
+            for key in keys[:-1]:
+                parent = parent[key]
+            parent[keys[-1]] = df
+        for stage, duration in partition_timings.items():
+            timings[stage] += duration
+    timings["partitions (wall time)"] = perf_counter() - start
+    # sample indexes of properties
+    start = perf_counter()
+    for completeness in ["complete", "partial"]:
+        for column in PROPERTY_INDEX_COLUMNS:
+            processed_df_dict["property_index"][completeness][
+                column
+            ] = create_sample_index(
+                processed_df_dict["propertyView"][completeness], column
+            )
+    timings["property_index"] = perf_counter() - start
+    for stage, duration in timings.items():
+        print(f"Preprocessing time {stage}: {duration:.4f} sec.")
+    return processed_df_dict
+
+
+def preprocess_partitions_in_pool(
+    propertyViews: dict,
+    reference_variantViews: dict,
+    partition_keys: list,
+    jobs: int,
+    timings: dict,
+) -> list:
+    """
+    write inputs of all partitions as Arrow files, preprocess them with a process pool and
+    memory-map the results, see load_from_sql_db why results are not sent through the pipe
+
+    :param propertyViews: {completeness: propertyView}
+    :param reference_variantViews: {reference_id: variantView of reference}
+    :param partition_keys: [(completeness, reference_id)]
+    :param timings: {stage: duration in sec}, durations of writing inputs are added
+    :return: [([(keys, df)], {stage: duration in sec})] for every partition
+    """
+    start = perf_counter()
+    work_dir = tempfile.mkdtemp(prefix="preprocessing-", dir=CACHE_DIR)
+    for completeness, df in propertyViews.items():
+        write_partition(
+            df, os.path.join(work_dir, f"propertyView.{completeness}.arrow")
+        )
+    for reference_id, df in reference_variantViews.items():
+        write_partition(df, os.path.join(work_dir, f"variantView.{reference_id}.arrow"))
+    timings["write inputs"] = perf_counter() - start
+    try:
+        pool = mp.Pool(min(jobs, len(partition_keys)))
+        file_results = pool.starmap(
+            preprocess_partition_files,
+            [
+                [work_dir, completeness, reference_id]
+                for completeness, reference_id in partition_keys
+            ],
+        )
+        pool.close()
+        pool.join()
+        # mapped files stay readable after deleting work_dir
+        return [
+            (
+                [
+                    (keys, read_partition(os.path.join(work_dir, file_name)))
+                    for keys, file_name in files
+                ],
+                partition_timings,
+            )
+            for files, partition_timings in file_results
+        ]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def get_cached_sample_ids(processed_df_dict: dict) -> np.ndarray:
+    """
+    :return: sorted array of the sample ids in propertyView of processed_df_dict
+    """
+    return unique_sample_ids(
+        processed_df_dict["propertyView"][completeness]["sample.id"].to_numpy(
+            dtype=SAMPLE_ID_TYPE
+        )
+        for completeness in ["complete", "partial"]
+    )
+
+
+def get_deleted_sample_ids(
+    processed_df_dict: dict, db_sample_ids: np.ndarray
+) -> np.ndarray:
+    """
+    :param db_sample_ids: ids of all samples in DB, see DataFrameLoader.load_sample_ids
+    :return: sorted array of the sample ids of processed_df_dict missing in DB
+    """
+    return np.setdiff1d(get_cached_sample_ids(processed_df_dict), db_sample_ids).astype(
+        SAMPLE_ID_TYPE
+    )
+
+
+def get_high_water_mark(processed_df_dict: dict, build_date: date = None) -> dict:
+    """
+    last samples of processed_df_dict, used to query only new and changed samples
+    during the next incremental rebuild
+
+    :param build_date: date the DB was queried, samples modified afterwards are changed
+    :return: {"sample.id": highest sample id, "MODIFIED": build_date as YYYY-MM-DD}
+    """
+    sample_ids = get_cached_sample_ids(processed_df_dict)
+    return {
+        "sample.id": int(sample_ids.max()) if len(sample_ids) else 0,
+        MODIFIED_PROPERTY: build_date.isoformat() if build_date else None,
+    }
+
+
+def create_empty_delta_df_dict(processed_df_dict: dict) -> dict:
+    """
+    delta of an incremental rebuild without new or changed samples
+
+    :return: dict with same structure and columns as processed_df_dict, all tables without rows
+    """
+    delta_df_dict = {}
+    for keys, df in iter_partitions(processed_df_dict):
+        parent = delta_df_dict
+        for key in keys[:-1]:
+            parent = parent.setdefault(key, {})
+        parent[keys[-1]] = df.iloc[:0]
+    return delta_df_dict
+
+
+def update_processed_df_dict(
+    processed_df_dict: dict,
+    loaded_df_dict: dict,
+    deleted_sample_ids: np.ndarray = None,
+) -> dict:
+    """
+    incremental rebuild: changed and deleted samples are removed from all tables
+    of processed_df_dict, afterwards the tables of the new and changed samples
+    in loaded_df_dict are appended
+    the result equals preprocess_tables on all samples, but only the new samples are preprocessed
+
+    :param processed_df_dict: processed_df_dict of all previous samples, e.g. loaded snapshot
+    :param loaded_df_dict: DB tables with only new and changed samples,
+        all references have to be contained in processed_df_dict
+    :param deleted_sample_ids: ids of samples deleted from DB, see get_deleted_sample_ids
+    :return: updated processed_df_dict
+    """
+    reference_ids = list(processed_df_dict["variantView"]["complete"].keys())
+    # rows of changed and deleted samples are removed
+    delta_sample_ids = np.union1d(
+        np.union1d(
+            loaded_df_dict["propertyView"]["sample.id"].unique(),
+            loaded_df_dict["variantView"]["sample.id"].unique(),
+        ),
+        deleted_sample_ids if deleted_sample_ids is not None else [],
+    ).astype(SAMPLE_ID_TYPE)
+    if loaded_df_dict["propertyView"].empty:
+        # only deleted samples, nothing to preprocess
+        delta_df_dict = create_empty_delta_df_dict(processed_df_dict)
+    else:
+        delta_df_dict = preprocess_tables(loaded_df_dict, reference_ids)
+    updated_df_dict = create_empty_processed_df(reference_ids)
+    for completeness in ["complete", "partial"]:
+        # propertyView: replace rows of changed samples
+        propertyView = processed_df_dict["propertyView"][completeness]
+        old_propertyView = propertyView[
+            propertyView["sample.id"].isin(delta_sample_ids)
+        ]
+        updated_df_dict["propertyView"][completeness] = (
+            pd.concat(
+                [
+                    propertyView[~propertyView["sample.id"].isin(delta_sample_ids)],
+                    delta_df_dict["propertyView"][completeness].reindex(
+                        columns=propertyView.columns
+                    ),
+                ],
+                ignore_index=True,
+                axis=0,
+            )
+            .sort_values(["sample.id", "sample.name"])
+            .reset_index(drop=True)
+        )
+        for column in PROPERTY_INDEX_COLUMNS:
+            updated_df_dict["property_index"][completeness][
+                column
+            ] = merge_sample_id_groups(
+                processed_df_dict["property_index"][completeness][column],
+                delta_df_dict["property_index"][completeness][column],
+                [column],
+                delta_sample_ids,
+            )
+        for reference_id in reference_ids:
+            # variantView: replace rows of changed samples
+            for seq_type, columns in VARIANT_INDEX_COLUMNS.items():
+                variantView = processed_df_dict["variantView"][completeness][
+                    reference_id
+                ][seq_type]
+                updated_df_dict["variantView"][completeness][reference_id][
+                    seq_type
+                ] = pd.concat(
+                    [
+                        variantView[~variantView["sample.id"].isin(delta_sample_ids)],
+                        delta_df_dict["variantView"][completeness][reference_id][
+                            seq_type
+                        ],
+                    ],
+                    ignore_index=True,
+                    axis=0,
+                )
+                for column in columns:
+                    updated_df_dict["variant_index"][completeness][reference_id][
+                        seq_type
+                    ][column] = merge_sample_id_groups(
+                        processed_df_dict["variant_index"][completeness][reference_id][
+                            seq_type
+                        ][column],
+                        delta_df_dict["variant_index"][completeness][reference_id][
+                            seq_type
+                        ][column],
+                        [column],
+                        delta_sample_ids,
+                    )
+            # profiles: replace rows of changed samples
+            profiles = processed_df_dict["profiles"][completeness][reference_id]
+            updated_df_dict["profiles"][completeness][reference_id] = encode_profiles(
+                pd.concat(
+                    [
+                        profiles[~profiles["sample.id"].isin(delta_sample_ids)],
+                        delta_df_dict["profiles"][completeness][reference_id],
+                    ],
+                    ignore_index=True,
+                    axis=0,
+                )
+            )
+            # worldMap
+            updated_df_dict["world_map"][completeness][
+                reference_id
+            ] = add_world_map_columns(
+                merge_sample_id_groups(
+                    processed_df_dict["world_map"][completeness][reference_id],
+                    delta_df_dict["world_map"][completeness][reference_id],
+                    WORLD_MAP_GROUP_COLUMNS,
+                    delta_sample_ids,
+                )
+            )
+            # mutation frequencies: subtract previous counts of changed samples
+            variantView = processed_df_dict["variantView"][completeness][reference_id][
+                "cds"
+            ]
+            old_mutation_cube = create_mutation_cube(
+                variantView[variantView["sample.id"].isin(delta_sample_ids)],
+                old_propertyView,
+            )
+            old_mutation_cube["count"] = -old_mutation_cube["count"]
+            mutation_cube = (
+                pd.concat(
+                    [
+                        processed_df_dict["mutation_cube"][completeness][reference_id],
+                        delta_df_dict["mutation_cube"][completeness][reference_id],
+                        old_mutation_cube,
+                    ],
+                    ignore_index=True,
+                    axis=0,
+                )
+                .groupby(
+                    ["element.symbol", "gene:variant", "SEQ_TECH", "COUNTRY"],
+                    dropna=False,
+                )["count"]
+                .sum()
+                .reset_index()
+            )
+            updated_df_dict["mutation_cube"][completeness][
+                reference_id
+            ] = mutation_cube[mutation_cube["count"] > 0].reset_index(drop=True)
+    return updated_df_dict
+
+
+def load_published_snapshot():
+    """
+    with SNAPSHOT_SHM_DIR the snapshot is published once into shared memory,
+    every worker maps the same pages read-only instead of loading a private copy
+
+    :return: lazily loaded snapshot, see load_snapshot, None if the snapshot is incomplete
+    """
+    if SNAPSHOT_SHM_DIR and publish_snapshot(SNAPSHOT_DIR, SNAPSHOT_SHM_DIR):
+        df_dict = load_snapshot(SNAPSHOT_SHM_DIR)
+        if df_dict is not None:
+            return df_dict
+    return load_snapshot(SNAPSHOT_DIR)
+
+
 def load_all_sql_files(  # noqa: C901
-    db_name: str = None, test_db: bool = False
+    db_name: str = None, test_db: bool = False, incremental: bool = False, jobs: int = 1
 ) -> dict:
     """
     load SQL DB into dict of pandas dfs
     to handle big db size: DB tables are splitted into multiple tables in processed_df_dict:
         processed_df_dict["propertyView"]["complete" OR "partial"]
         processed_df_dict["variantView"]["complete" OR "partial"][reference_id][seq_type]
+        processed_df_dict["world_map"]["complete" OR "partial"][reference_id]
+        processed_df_dict["mutation_cube"]["complete" OR "partial"][reference_id]
+        processed_df_dict["profiles"]["complete" OR "partial"][reference_id]
+    inverted indexes {value: sample ids} used by the filters:
+        processed_df_dict["property_index"]["complete" OR "partial"][column]
+        processed_df_dict["variant_index"]["complete" OR "partial"][reference_id][seq_type][column]
+    every table is stored as one partition of the snapshot in SNAPSHOT_DIR,
+    a valid snapshot is loaded lazily instead of querying the DB
+    incremental rebuild: only samples imported or modified since the high water mark
+    of the snapshot are queried and merged into the snapshot, samples missing in the DB
+    are removed from the snapshot
 
     for website running db_name is parsed from env var DB_URL, for test DB params are used
 
     :param db_name: for test databases name is given
     :param test_db: for tests databases test_db=True
+    :param incremental: update the existing snapshot instead of rebuilding it
+    :param jobs: number of processes preprocessing the partitions
     :return: complete pre processed DB dictionary
     """
     if not db_name:
         db_name = urlparse(DB_URL).path.replace("/", "")
-    path_to_cache = CACHE_DIR
     loader = DataFrameLoader(db_name)
+    manifest = read_manifest(SNAPSHOT_DIR) if not test_db else None
+    # samples modified while loading are modified at or after the build date
+    # -> they are queried again by the next incremental rebuild
+    build_date = date.today()
 
-    # NOTE:
-    # TODO automated update of pickle file with new database
-    # 1. Using Pickle should only be used on 100% trusted data
-    # 2. msgpack can be other options.
-    # check if df_dict is load or not?
-    if redis_manager and redis_manager.exists("df_dict") and not test_db:
-        # if True:
+    # the snapshot is valid as long as the redis key exists (23 hours)
+    # partitions are memory-mapped at first access, workers only read what callbacks request
+    if (
+        redis_manager
+        and redis_manager.exists("df_dict")
+        and manifest
+        and not incremental
+    ):
         print("Load data from cache...")
-        # df_dict = decompress_pickle(os.path.join(CACHE_DIR,"df_dict.pbz2"))
-        # df_dict = pickle.loads(redis_manager.get("df_dict"))
-        processed_df_dict = load_Cpickle(os.path.join(path_to_cache, "df_dict.pickle"))
+        snapshot = load_published_snapshot()
+        if snapshot is not None:
+            return snapshot
+        print("Snapshot incomplete, full rebuild")
+        incremental = False
+
+    # snapshots of older versions have no MODIFIED date -> full rebuild
+    high_water_mark = manifest.get("high_water_mark") if manifest else None
+    if incremental and high_water_mark and high_water_mark.get(MODIFIED_PROPERTY):
+        snapshot = load_snapshot(SNAPSHOT_DIR)
+    else:
+        snapshot = None
+    if snapshot is not None:
+        print(f"Load data changed since {high_water_mark} from database...")
+        loaded_df_dict = loader.load_from_sql_db(high_water_mark)
+        processed_df_dict = to_nested_dict(snapshot)
+        del snapshot
+        deleted_sample_ids = get_deleted_sample_ids(
+            processed_df_dict, loader.load_sample_ids()
+        )
+        if loaded_df_dict["propertyView"].empty and not len(deleted_sample_ids):
+            print("No changed samples")
+            snapshot = load_published_snapshot()
+            if snapshot is not None:
+                del processed_df_dict
+                if redis_manager:
+                    redis_manager.set("df_dict", 1, ex=3600 * 23)
+                return snapshot
+        new_reference_ids = set(get_reference_ids(loaded_df_dict)) - set(
+            processed_df_dict["variantView"]["complete"].keys()
+        )
+        if not new_reference_ids:
+            print(
+                "Data preprocessing of changed samples, "
+                f"{len(deleted_sample_ids)} deleted samples..."
+            )
+            processed_df_dict = update_processed_df_dict(
+                processed_df_dict, loaded_df_dict, deleted_sample_ids
+            )
+        else:
+            print(f"New references {new_reference_ids}, full rebuild")
+            del processed_df_dict
+            incremental = False
     else:
+        incremental = False
+
+    if not incremental:
         if test_db:
             print("Load data from test database")
             loaded_df_dict = loader.load_db_from_test_db()
@@ -528,76 +1252,46 @@ def load_all_sql_files(  # noqa: C901
 
         # df preprocessing
         print("Data preprocessing...")
-        # TODO why NaN in reference --> database error?
-        reference_ids = [
-            int(ref)
-            for ref in loaded_df_dict["variantView"]["reference.id"].dropna().unique()
-        ]
-        processed_df_dict = create_empty_processed_df(reference_ids)
-        # propertyView
-        processed_propertyView = create_property_view(loaded_df_dict["propertyView"])
-        for completeness in ["complete", "partial"]:
-            processed_df_dict["propertyView"][completeness] = processed_propertyView[
-                processed_propertyView["GENOME_COMPLETENESS"] == completeness
-            ].reset_index(drop=True)
-        del processed_propertyView
-        del loaded_df_dict["propertyView"]
-        # variantView
-        for completeness in ["complete", "partial"]:
-            processed_variantView = create_variant_view(
-                loaded_df_dict["variantView"],
-                set(processed_df_dict["propertyView"][completeness]["sample.id"]),
-            )
-            for reference_id in reference_ids:
-                for seq_type in ["source", "cds"]:
-                    processed_df_dict["variantView"][completeness][reference_id][
-                        seq_type
-                    ] = remove_seq_errors_and_add_gene_var_column(
-                        processed_variantView, reference_id, seq_type
-                    )
-            del processed_variantView
-        del loaded_df_dict["variantView"]
-        # worldMap
-        for completeness in ["complete", "partial"]:
-            for reference_id in reference_ids:
-                processed_df_dict["world_map"][completeness][
-                    reference_id
-                ] = create_world_map_df(
-                    processed_df_dict["variantView"][completeness][reference_id]["cds"],
-                    processed_df_dict["propertyView"][completeness],
-                )
-
-        if redis_manager:
-            # NOTE: set pickle cache, however the limitation of redis
-            # is.... the tool can store data size up to 512MB
-            # 1 sec
-            # redis_manager.set("df_dict", pickle.dumps(df_dict), ex=3600 * 23)
-
-            # HACK: 1. SpaceSaving, so we use the another method, using Cpickle + BZ2 compression.
-            # WARN: the performance is limited by compression algorithm and stroage I/O type.
-            # 40 secs, 40 MB
-            # redis_manager.set("df_dict", "1", ex=3600 * 23)
-            # compressed_pickle(os.path.join(CACHE_DIR,"df_dict.pbz2"),df_dict)
-
-            # HACK: 2. Using Cpickle only
-            # 30 secs, 419 MB
-            if not test_db:
-                print("Create a new cache")
-                write_Cpickle(
-                    os.path.join(path_to_cache, "df_dict.pickle"), processed_df_dict
-                )
-                redis_manager.set("df_dict", 1, ex=3600 * 23)
+        processed_df_dict = preprocess_tables(
+            loaded_df_dict, get_reference_ids(loaded_df_dict), jobs
+        )
 
-            # df_dict["propertyView"].to_pickle(".cache/propertyView.pkl")
-            # df_dict["variantView"].to_pickle(".cache/variantView.pkl")
-            # df_dict["referenceView"].to_pickle(".cache/referenceView.pkl")
+    if redis_manager and not test_db:
+        # one Arrow file per partition + manifest, replaces the former 419 MB df_dict.pickle
+        print("Create a new cache")
+        start = perf_counter()
+        version = write_snapshot(
+            processed_df_dict,
+            SNAPSHOT_DIR,
+            get_high_water_mark(processed_df_dict, build_date),
+        )
+        if SNAPSHOT_SHM_DIR:
+            publish_snapshot(SNAPSHOT_DIR, SNAPSHOT_SHM_DIR)
+        print(f"Writing time snapshot: {(perf_counter() - start):.4f} sec.")
+        # results of callbacks computed on previous versions are never used again
+        print(f"Removed {remove_results(redis_manager, version)} cached results")
+        redis_manager.set("df_dict", 1, ex=3600 * 23)
 
     return processed_df_dict
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="build cache of MPXRadar")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only preprocess samples imported or modified since the last build, "
+        "deleted samples are removed from the cache",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=mp.cpu_count(),
+        help="number of processes preprocessing the completeness/reference partitions",
+    )
+    args = parser.parse_args()
     print("Build a new cache")
-    load_all_sql_files()
+    load_all_sql_files(incremental=args.incremental, jobs=args.jobs)
     create_snp_table()
     calculate_tri_mutation_sig()
     calculate_mutation_sig()
@@ -243,43 +243,23 @@ class DBManager(object):
         _rows = self.cursor.fetchall()
         return _rows
 
-    def get_raw_mutation_signature(self):
-
-        sql = (
-            "SELECT  "
-            "`reference.accession`, `variant.ref`, `variant.alt`, "
-            "`variant.start`, `variant.end` "
-            "FROM  variantView "
-            "WHERE (`variant.ref` = 'C' AND `variant.alt` = 'A') "
-            "OR (`variant.ref` = 'C' AND `variant.alt` = 'G') "
-            "OR (`variant.ref` = 'C' AND `variant.alt` = 'T') "
-            "OR (`variant.ref` = 'T' AND `variant.alt` = 'A') "
-            "OR (`variant.ref` = 'T' AND `variant.alt` = 'C') "
-            "OR (`variant.ref` = 'T' AND `variant.alt` = 'G');"
-        )
-        self.cursor.execute(sql)
-        _rows = self.cursor.fetchall()
-        return _rows
-
-    def get_raw_snp_1(self):
+    def get_snp_counts(self, ref_nts=("A", "C", "G", "T")):
         """
-        This function tries to get all possible one-base substitutions.
+        Read the single-base substitution counts per reference and trinucleotide
+        context, maintained by the pathosonar import in the snp_context table
+        (at most 12 substitutions x 5 x 5 flanking bases per reference).
+
+        :param ref_nts: reference bases of the substitutions, e.g. ("C", "T") for the
+            96 trinucleotide types of the mutation signature
         """
+        ref_values = ", ".join(f"'{nt}'" for nt in ref_nts)
         sql = (
-            "SELECT `reference.accession`, `variant.ref`, `variant.alt`, `variant.start`, `variant.end` "
-            "FROM  variantView "
-            "WHERE (`variant.ref` = 'C' AND `variant.alt` = 'A') "
-            "OR (`variant.ref` = 'C' AND `variant.alt` = 'G') "
-            "OR (`variant.ref` = 'C' AND `variant.alt` = 'T') "
-            "OR (`variant.ref` = 'T' AND `variant.alt` = 'A') "
-            "OR (`variant.ref` = 'T' AND `variant.alt` = 'C') "
-            "OR (`variant.ref` = 'T' AND `variant.alt` = 'G') "
-            "OR (`variant.ref` = 'G' AND `variant.alt` = 'A') "
-            "OR (`variant.ref` = 'G' AND `variant.alt` = 'T') "
-            "OR (`variant.ref` = 'G' AND `variant.alt` = 'C') "
-            "OR (`variant.ref` = 'A' AND `variant.alt` = 'T') "
-            "OR (`variant.ref` = 'A' AND `variant.alt` = 'G') "
-            "OR (`variant.ref` = 'A' AND `variant.alt` = 'C'); "
+            "SELECT reference.accession AS `reference.accession`, "
+            "snp_context.ref AS `variant.ref`, snp_context.alt AS `variant.alt`, "
+            "snp_context.nt_before, snp_context.nt_after, snp_context.count "
+            "FROM snp_context "
+            "JOIN reference ON reference.id = snp_context.reference_id "
+            f"WHERE snp_context.ref IN ({ref_values}) AND snp_context.count > 0;"
         )
         self.cursor.execute(sql)
         _rows = self.cursor.fetchall()
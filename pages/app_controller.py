@@ -11,10 +11,10 @@ from typing import List
 import pandas as pd
 
 from pages.config import DB_URL
-from pages.config import logging_radar
 from pages.config import redis_manager
 from pages.DBManager import DBManager
-from pages.utils import generate_96_mutation_types
+from pages.utils_mutation_signature import count_tri_mutation_types
+from pages.utils_mutation_signature import create_snp_type_counts
 from .libs.pathosonar.src.pathosonar.dbm import sonarDBManager
 from .libs.pathosonar.src.pathosonar.utils import sonarUtils
 
@@ -337,77 +337,53 @@ def count_unique_MutRef():
     return return_string
 
 
-def calculate_tri_mutation_sig():  # noqa: C901
+def get_snp_counts() -> pd.DataFrame:
+    """
+    single-base substitution counts per reference and trinucleotide context,
+    shared by the trinucleotide signature and the SNP table
+
+    :return: df of DBManager.get_snp_counts
+    """
+    if redis_manager and redis_manager.exists("data_snp_counts"):
+        data_ = json.loads(redis_manager.get("data_snp_counts"))
+    else:
+        with DBManager() as dbm:
+            data_ = dbm.get_snp_counts()
+        if redis_manager:
+            # Convert the list to a JSON string
+            redis_manager.set("data_snp_counts", json.dumps(data_), ex=3600 * 23)
+    return pd.DataFrame(
+        data_,
+        columns=[
+            "reference.accession",
+            "variant.ref",
+            "variant.alt",
+            "nt_before",
+            "nt_after",
+            "count",
+        ],
+    )
+
+
+def calculate_tri_mutation_sig():
     """
     List all 96 possible mutation types
     (e.g. A[C>A]A, A[C>A]T, etc.).
     """
     start = time.time()
 
-    if (
-        redis_manager
-        and redis_manager.exists("data_tri_mutation_sig")
-        and redis_manager.exists("total_tri_mutation_sig")
-    ):
-        data_ = json.loads(redis_manager.get("data_tri_mutation_sig"))
+    if redis_manager and redis_manager.exists("total_tri_mutation_sig"):
         total_ = json.loads(redis_manager.get("total_tri_mutation_sig"))
-        with DBManager() as dbm:
-            all_references_dict = {
-                x["accession"]: x["sequence"] for x in dbm.references
-            }
     else:
         with DBManager() as dbm:
-            data_ = dbm.get_raw_mutation_signature()
             total_ = dbm.count_unique_NT_Mut_Ref()
-            all_references_dict = {
-                x["accession"]: x["sequence"] for x in dbm.references
-            }
-            # Convert the list to a JSON string
-            redis_manager.set("data_tri_mutation_sig", json.dumps(data_), ex=3600 * 23)
+        if redis_manager:
             redis_manager.set(
                 "total_tri_mutation_sig", json.dumps(total_), ex=3600 * 23
             )
 
-    final_dict = {}
     # calculate freq.
-    for mutation in data_:
-        accession = mutation["reference.accession"]
-
-        if accession not in final_dict:
-            final_dict[accession] = generate_96_mutation_types()
-
-        ref = mutation["variant.ref"]
-        alt = mutation["variant.alt"]
-        mutation_pos_before = mutation["variant.start"] - 1
-        mutation_pos_after = mutation["variant.end"]
-
-        # get NT from position.
-        ref_seq = all_references_dict[accession]
-        try:
-            nt_before = ref_seq[mutation_pos_before]
-            nt_after = ref_seq[mutation_pos_after]
-        except IndexError:
-            logging_radar.error("IndexError")
-            print(mutation)
-            print(
-                "IndexError:",
-                nt_before,
-                mutation_pos_before,
-                nt_after,
-                mutation_pos_after,
-            )
-            print("---------")
-            continue
-        mutation_type = f"{ref}>{alt}"
-        _type = f"{nt_before}{ref}>{alt}{nt_after}"
-
-        try:
-            final_dict[accession][mutation_type][_type] += 1
-        except KeyError:
-            print("mutation_type:", mutation_type)
-            print("_type:", _type)
-            print("final_dict ->", final_dict[accession][mutation_type][_type])
-            raise
+    final_dict = count_tri_mutation_types(get_snp_counts())
     # normalize the total number of mutations for each reference accession
     total_mutations = {x["reference.accession"]: x["Freq"] for x in total_}
     # Calculate the mutation signature for each reference accession
@@ -480,152 +456,12 @@ def calculate_mutation_sig():
     return mutation_signature
 
 
-def create_snp_table():  # noqa: C901
+def create_snp_table():
+    """
+    table of all single-base substitutions with their 2 and 3 NTs context per reference
+    """
     start = time.time()
-
-    if redis_manager and redis_manager.exists("data_snp_table"):
-        data_ = json.loads(redis_manager.get("data_snp_table"))
-
-        with DBManager() as dbm:
-            all_references_dict = {
-                x["accession"]: x["sequence"] for x in dbm.references
-            }
-    else:
-        with DBManager() as dbm:
-            data_ = dbm.get_raw_snp_1()
-            all_references_dict = {
-                x["accession"]: x["sequence"] for x in dbm.references
-            }
-            # Convert the list to a JSON string
-            redis_manager.set("data_snp_table", json.dumps(data_), ex=3600 * 23)
-
-    final_dict = {}
-    # calculate freq.
-    for mutation in data_:
-        accession = mutation["reference.accession"]
-        ref_seq = all_references_dict[accession]
-
-        if accession not in final_dict:
-            final_dict[accession] = {}
-
-        ref = mutation["variant.ref"]
-        alt = mutation["variant.alt"]
-        mutation_pos_before = mutation["variant.start"] - 1
-        mutation_pos_after = mutation["variant.end"]
-
-        # get NT from position.
-        # FIXME: There will be a problem if the end position is out of bound.
-        """
-        for example,
-        MPXRadar:2023-04-11 14:58:06 ERROR: IndexError
-        {'reference.accession': 'NC_063383.1', 'variant.ref': 'T',
-          'variant.alt': 'A', 'variant.start': 197208, 'variant.end': 197209}
-        IndexError: A 197207 A 197209
-        """
-        try:
-            nt_before = ref_seq[mutation_pos_before]
-
-        except IndexError:
-            logging_radar.warning("IndexError")
-            print(mutation)
-            print(
-                "IndexError before:",
-                nt_before,
-                mutation_pos_before,
-            )
-            print("---------")
-            nt_before = ""
-
-        try:
-            nt_after = ref_seq[mutation_pos_after]
-        except IndexError:
-            # logging_radar.warning("IndexError")
-            # print(mutation)
-            # print(
-            #    "IndexError after:",
-            #    nt_after,
-            #    mutation_pos_after,
-            # )
-            # print("---------")
-            nt_after = ""
-
-        # single NT
-        # C > T
-        try:
-            mutation_type = f"{ref}>{alt}"
-            _type = f"{ref}>{alt}"
-
-            if _type not in final_dict[accession]:
-                final_dict[accession][_type] = 0
-
-            final_dict[accession][_type] += 1
-        except KeyError:
-            print("mutation_type:", mutation_type)
-            print("single NT: _type:", _type)
-            print("final_dict ->", final_dict[accession][_type])
-            raise
-
-        # 2 NTs: End changes
-        # GC > GT
-        try:
-            mutation_type = f"{ref}>{alt}"
-            _type = f"{nt_before}{ref}>{nt_before}{alt}"
-
-            if _type not in final_dict[accession]:
-                final_dict[accession][_type] = 0
-
-            final_dict[accession][_type] += 1
-        except KeyError:
-            print("mutation_type:", mutation_type)
-            print("2 NTs: End changes:", _type)
-            print("final_dict ->", final_dict[accession][_type])
-            raise
-
-        # 2 NTs: Begin changes
-        # CA > TA
-        try:
-            mutation_type = f"{ref}>{alt}"
-            _type = f"{ref}{nt_after}>{alt}{nt_after}"
-
-            if _type not in final_dict[accession]:
-                final_dict[accession][_type] = 0
-
-            final_dict[accession][_type] += 1
-        except KeyError:
-            print("mutation_type:", mutation_type)
-            print("2 NTs: Begin changes:", _type)
-            print("final_dict ->", final_dict[accession][_type])
-            raise
-
-        # 3 NTs: middle changes
-        # CA > TA
-        try:
-            mutation_type = f"{ref}>{alt}"
-            _type = f"{nt_before}{ref}>{alt}{nt_after}"
-
-            if _type not in final_dict[accession]:
-                final_dict[accession][_type] = 0
-
-            final_dict[accession][_type] += 1
-        except KeyError:
-            print("mutation_type:", mutation_type)
-            print("3 NTs: Middle changes:", _type)
-            print("final_dict ->", final_dict[accession][_type])
-            raise
-
-    # Convert the dictionary to a dataframe
-    df = pd.DataFrame.from_dict(final_dict, orient="index")
-    # Add a column for genome assembly
-    df["genome_assembly"] = df.index
-    # Reset the index and add a column for the mutation
-    df = df.reset_index()
-    df = pd.melt(
-        df,
-        id_vars=["index", "genome_assembly"],
-        var_name="mutation",
-        value_name="count",
-    )
-    df.drop(columns=["index"], inplace=True)
+    df = create_snp_type_counts(get_snp_counts())
     end = time.time()
     print("create_snp_table", round(end - start, 4))
     return df
@@ -12,7 +12,12 @@ from pages.utils_filters import actualize_filters
 from pages.utils_tables import OverviewTable
 
 
-def get_compare_callbacks(df_dict, color_dict):  # noqa: C901
+def get_compare_callbacks(df_dict, color_dict, result_cache):  # noqa: C901
+    """
+    function contains all callbacks used in compare tool page (in tool.py file)
+    results of the filter state are cached in result_cache
+    """
+
     @callback(
         [
             Output("mutation_dropdown_left", "options"),
@@ -66,7 +71,6 @@ def get_compare_callbacks(df_dict, color_dict):  # noqa: C901
         ],
         prevent_initial_call=True,
     )
-    @cache.memoize()
     def actualize_mutation_filter(
         compare_button,
         select_all_mutations_left,
@@ -144,22 +148,38 @@ def get_compare_callbacks(df_dict, color_dict):  # noqa: C901
                 max_freq_nb_left,
                 max_freq_nb_right,
                 max_freq_nb_both,
-            ) = find_unique_and_shared_variants(
-                df_dict,
-                color_dict,
-                complete_partial_radio,
-                reference_value,
-                aa_nt_radio,
-                gene_value_1,
-                seqtech_value_1,
-                country_value_1,
-                start_date_1,
-                end_date_1,
-                gene_value_2,
-                seqtech_value_2,
-                country_value_2,
-                start_date_2,
-                end_date_2,
+            ) = result_cache.get_or_compute(
+                "compare_mutation_options",
+                lambda: find_unique_and_shared_variants(
+                    df_dict,
+                    color_dict,
+                    complete_partial_radio,
+                    reference_value,
+                    aa_nt_radio,
+                    gene_value_1,
+                    seqtech_value_1,
+                    country_value_1,
+                    start_date_1,
+                    end_date_1,
+                    gene_value_2,
+                    seqtech_value_2,
+                    country_value_2,
+                    start_date_2,
+                    end_date_2,
+                ),
+                reference=reference_value,
+                completeness=complete_partial_radio,
+                aa_nt=aa_nt_radio,
+                genes_left=gene_value_1,
+                seqtechs_left=seqtech_value_1,
+                countries_left=country_value_1,
+                start_date_left=start_date_1,
+                end_date_left=end_date_1,
+                genes_right=gene_value_2,
+                seqtechs_right=seqtech_value_2,
+                countries_right=country_value_2,
+                start_date_right=start_date_2,
+                end_date_right=end_date_2,
             )
             text_freq_1 = f"Select minimum variant frequency. Highest frequency in selection: {max_freq_nb_left}"
             text_freq_2 = f"Select minimum variant frequency. Highest frequency in selection:  {max_freq_nb_right}"
@@ -219,7 +239,6 @@ def get_compare_callbacks(df_dict, color_dict):  # noqa: C901
         ],
         prevent_initial_call=True,
     )
-    @cache.memoize()
     def actualize_tables(
         mut_value_left,
         mut_value_right,
@@ -241,22 +260,39 @@ def get_compare_callbacks(df_dict, color_dict):  # noqa: C901
             table_df_2,
             table_df_3,
             variantView_df_both,
-        ) = create_comparison_tables(
-            df_dict,
-            complete_partial_radio,
-            aa_nt_radio,
-            mut_value_left,
-            reference_value,
-            seqtech_value_1,
-            country_value_1,
-            start_date_1,
-            end_date_1,
-            mut_value_right,
-            seqtech_value_2,
-            country_value_2,
-            start_date_2,
-            end_date_2,
-            mut_value_both,
+        ) = result_cache.get_or_compute(
+            "compare_tables",
+            lambda: create_comparison_tables(
+                df_dict,
+                complete_partial_radio,
+                aa_nt_radio,
+                mut_value_left,
+                reference_value,
+                seqtech_value_1,
+                country_value_1,
+                start_date_1,
+                end_date_1,
+                mut_value_right,
+                seqtech_value_2,
+                country_value_2,
+                start_date_2,
+                end_date_2,
+                mut_value_both,
+            ),
+            reference=reference_value,
+            completeness=complete_partial_radio,
+            aa_nt=aa_nt_radio,
+            seqtechs_left=seqtech_value_1,
+            countries_left=country_value_1,
+            start_date_left=start_date_1,
+            end_date_left=end_date_1,
+            mutations_left=mut_value_left,
+            seqtechs_right=seqtech_value_2,
+            countries_right=country_value_2,
+            start_date_right=start_date_2,
+            end_date_right=end_date_2,
+            mutations_right=mut_value_right,
+            mutations_both=mut_value_both,
         )
         table_df_1_records = table_df_1.to_dict("records")
         table_df_2_records = table_df_2.to_dict("records")
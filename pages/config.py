@@ -20,13 +20,21 @@ SERVER = os.getenv("SERVER")
 DEBUG = os.getenv("DEBUG")
 DB_URL = os.getenv("DB_URL")
 LOG_LEVEL = os.getenv("LOG_LEVEL")
+# number of rows fetched per round trip when streaming DB tables into .cache
+DB_CHUNK_SIZE = int(os.getenv("DB_CHUNK_SIZE", "100000"))
+# size of the in-process tier of the result cache of explore and compare callbacks
+RESULT_CACHE_SIZE_MB = int(os.getenv("RESULT_CACHE_SIZE_MB", "256"))
 # REDIS_URL =  os.getenv("REDIS_URL")
 REDIS_BACKEND_URL = os.path.join(os.getenv("REDIS_URL"), os.getenv("REDIS_DB_BACKEND"))
 REDIS_BROKER_URL = os.path.join(os.getenv("REDIS_URL"), os.getenv("REDIS_DB_BROKER"))
 CACHE_DIR = ".cache"
+# partitioned snapshot of the preprocessed dataframes, written by data.py
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, "snapshot")
+# tmpfs directory, e.g. /dev/shm/mpxradar: workers share one copy of the snapshot in RAM
+SNAPSHOT_SHM_DIR = os.getenv("SNAPSHOT_SHM_DIR")
 # create .cache dir.
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
+if not os.path.exists(SNAPSHOT_DIR):
+    os.makedirs(SNAPSHOT_DIR)
 
 
 def get_module_logger(mod_name):
@@ -1,22 +1,62 @@
 from dash import callback
 from dash import ctx
+from dash import dcc
 from dash import Input
 from dash import Output
 from dash import State
 
 from pages.utils_filters import actualize_filters
 from pages.utils_filters import get_frequency_sorted_cds_mutation_by_filters
+from pages.utils_result_cache import date_range
+from pages.utils_result_cache import ResultCache
 from pages.utils_tables import TableFilter
 from pages.utils_worldMap_explorer import DateSlider
 from pages.utils_worldMap_explorer import DetailPlots
 from pages.utils_worldMap_explorer import WorldMap
 
 
+def get_cds_mutation_options(
+    result_cache: ResultCache,
+    df_dict: dict,
+    seqtech_value: list[str],
+    country_value: list[str],
+    gene_value: list[str],
+    complete_partial_radio: str,
+    reference_value: int,
+    color_dict: dict,
+    min_nb_freq: int,
+) -> (list[dict], int, int):
+    """
+    cached get_frequency_sorted_cds_mutation_by_filters, shared by the start condition
+    of tool.py and the mutation filter of the explore tool
+    """
+    return result_cache.get_or_compute(
+        "cds_mutation_options",
+        lambda: get_frequency_sorted_cds_mutation_by_filters(
+            df_dict,
+            seqtech_value,
+            country_value,
+            gene_value,
+            complete_partial_radio,
+            reference_value,
+            color_dict,
+            min_nb_freq,
+        ),
+        reference=reference_value,
+        completeness=complete_partial_radio,
+        genes=gene_value,
+        seqtechs=seqtech_value,
+        countries=country_value,
+        min_nb_freq=min_nb_freq,
+    )
+
+
 def get_explore_callbacks(  # noqa: C901
-    df_dict, date_slider, color_dict, location_coordinates
+    df_dict, date_slider, color_dict, location_coordinates, result_cache
 ):
     """
     function contains all callbacks used in explore tool page (in tool.py file)
+    results of the filter state are cached in result_cache
     """
 
     @callback(
@@ -61,11 +101,8 @@ def get_explore_callbacks(  # noqa: C901
             max_select = len(mut_options)
 
         else:
-            (
-                mut_options,
-                max_nb_freq,
-                min_nb_freq,
-            ) = get_frequency_sorted_cds_mutation_by_filters(
+            mut_options, max_nb_freq, min_nb_freq = get_cds_mutation_options(
+                result_cache,
                 df_dict,
                 seqtech_value,
                 country_value,
@@ -177,7 +214,6 @@ def get_explore_callbacks(  # noqa: C901
         ],
         prevent_initial_call=True,
     )
-    # @cache.memoize()
     def update_world_map_explorer(
         mutation_list,
         reference_id,
@@ -189,20 +225,30 @@ def get_explore_callbacks(  # noqa: C901
         complete_partial_radio,
         layout,
     ):
-        world_map_instance = WorldMap(
-            df_dict,
-            date_slider,
-            reference_id,
-            complete_partial_radio,
-            countries,
-            seqtech_list,
-            mutation_list,
-            dates,
-            interval,
-            color_dict,
-            location_coordinates,
+        fig = result_cache.get_or_compute(
+            "world_map",
+            lambda: WorldMap(
+                df_dict,
+                date_slider,
+                reference_id,
+                complete_partial_radio,
+                countries,
+                seqtech_list,
+                mutation_list,
+                dates,
+                interval,
+                color_dict,
+                location_coordinates,
+            ).get_world_map(method),
+            reference=reference_id,
+            completeness=complete_partial_radio,
+            seqtechs=seqtech_list,
+            countries=countries,
+            dates=dates,
+            interval=interval,
+            mutations=mutation_list,
+            method=method,
         )
-        fig = world_map_instance.get_world_map(method)
         # layout: {'geo.projection.rotation.lon': -99.26450411962647,
         #          'geo.center.lon': -99.26450411962647,
         #           'geo.center.lat': 39.65065298875763,
@@ -384,8 +430,8 @@ def get_explore_callbacks(  # noqa: C901
         title_text = f"Detailed look at the sequences with the chosen mutations for the selected \
                      country: {detail_plot_instance.location_name}"
         info_header = f"Number sequences for country {detail_plot_instance.location_name} and \
-            selected properties between {detail_plot_instance.dates[0]} - \
-            {detail_plot_instance.dates[-1]}: {detail_plot_instance.number_selected_sequences} of \
+            selected properties between {detail_plot_instance.date_range[0]} - \
+            {detail_plot_instance.date_range[1]}: {detail_plot_instance.number_selected_sequences} of \
              which {detail_plot_instance.seq_with_mut} sequences carry at least one of the \
             selected mutations."
         # 1. plot
@@ -450,11 +496,77 @@ def get_explore_callbacks(  # noqa: C901
         fig_develop = detail_plot_instance.get_frequency_development_scatter_plot()
         return fig_develop
 
+    def get_explore_samples(
+        mutation_list,
+        reference_id,
+        seq_tech_list,
+        dates,
+        countries,
+        complete_partial_radio,
+    ):
+        """
+        samples of the explore table, kept server-side by filter state
+        so that paging and sorting only materialize the requested rows
+        """
+        return result_cache.get_or_compute(
+            "explore_samples",
+            lambda: TableFilter("explorer", mutation_list).get_explore_samples(
+                df_dict,
+                complete_partial_radio,
+                seq_tech_list,
+                reference_id,
+                dates,
+                countries,
+            ),
+            reference=reference_id,
+            completeness=complete_partial_radio,
+            seqtechs=seq_tech_list,
+            countries=countries,
+            dates=date_range(dates),
+            mutations=mutation_list,
+        )
+
+    def get_table_samples(
+        mutation_list,
+        reference_id,
+        seq_tech_list,
+        interval,
+        dates,
+        countries,
+        complete_partial_radio,
+    ):
+        """
+        :return: mutation_list, reference_id (defaults for empty selections)
+        :return: sample ids of the explore table
+        """
+        interval_dates = date_slider.get_date_range_in_interval(dates, interval)
+        if mutation_list is None:
+            mutation_list = []
+        if seq_tech_list is None:
+            seq_tech_list = []
+        if interval_dates is None:
+            interval_dates = []
+        if countries is None:
+            countries = []
+        if reference_id is None:
+            reference_id = sorted(list(df_dict["variantView"]["complete"].keys()))[0]
+        samples = get_explore_samples(
+            mutation_list,
+            reference_id,
+            seq_tech_list,
+            interval_dates,
+            countries,
+            complete_partial_radio,
+        )
+        return mutation_list, reference_id, samples
+
     # fill table
     @callback(
         [
             Output(component_id="table_explorer", component_property="data"),
             Output(component_id="table_explorer", component_property="columns"),
+            Output(component_id="table_explorer", component_property="page_count"),
+            Output(component_id="table_explorer", component_property="page_current"),
         ],
         [
             Input("mutation_dropdown_0", "value"),
@@ -464,10 +576,13 @@ def get_explore_callbacks(  # noqa: C901
             Input("date_slider", "value"),
             Input("country_dropdown_0", "value"),
             Input("complete_partial_radio_explore", "value"),
+            Input("table_explorer", "page_current"),
+            Input("table_explorer", "page_size"),
+            Input("table_explorer", "sort_by"),
+            Input("table_explorer", "filter_query"),
         ],
         prevent_initial_call=False,
     )
-    # @cache.memoize()
     def update_table_filter(
         mutation_list,
         reference_id,
@@ -476,28 +591,85 @@ def get_explore_callbacks(  # noqa: C901
         dates,
         countries,
         complete_partial_radio,
+        page_current,
+        page_size,
+        sort_by,
+        filter_query,
     ):
-        date_list = date_slider.get_all_dates_in_interval(dates, interval)
-        if mutation_list is None:
-            mutation_list = []
-        if seq_tech_list is None:
-            seq_tech_list = []
-        if date_list is None:
-            date_list = []
-        if countries is None:
-            countries = []
-        if reference_id is None:
-            reference_id = sorted(list(df_dict["variantView"]["complete"].keys()))[0]
-
+        # a new selection, sorting or filter starts on the first page
+        if "table_explorer.page_current" not in ctx.triggered_prop_ids:
+            page_current = 0
+        mutation_list, reference_id, samples = get_table_samples(
+            mutation_list,
+            reference_id,
+            seq_tech_list,
+            interval,
+            dates,
+            countries,
+            complete_partial_radio,
+        )
         table_explorer = TableFilter("explorer", mutation_list)
-        table_df = table_explorer.create_explore_table(
+        table_df, page_count = table_explorer.create_explore_table_page(
             df_dict,
             complete_partial_radio,
-            seq_tech_list,
             reference_id,
-            date_list,
+            samples,
+            page_current or 0,
+            page_size,
+            sort_by,
+            filter_query,
+        )
+        return (
+            table_df.to_dict("records"),
+            [{"name": i, "id": i} for i in table_df.columns],
+            page_count,
+            page_current or 0,
+        )
+
+    # the table only holds the current page, the csv contains all rows of the table
+    @callback(
+        Output("table_download_explorer", "data"),
+        Input("table_export_explorer", "n_clicks"),
+        [
+            State("mutation_dropdown_0", "value"),
+            State("reference_radio_0", "value"),
+            State("seq_tech_dropdown_0", "value"),
+            State("selected_interval", "value"),
+            State("date_slider", "value"),
+            State("country_dropdown_0", "value"),
+            State("complete_partial_radio_explore", "value"),
+            State("table_explorer", "sort_by"),
+            State("table_explorer", "filter_query"),
+        ],
+        prevent_initial_call=True,
+    )
+    def export_table(
+        n_clicks,
+        mutation_list,
+        reference_id,
+        seq_tech_list,
+        interval,
+        dates,
+        countries,
+        complete_partial_radio,
+        sort_by,
+        filter_query,
+    ):
+        mutation_list, reference_id, samples = get_table_samples(
+            mutation_list,
+            reference_id,
+            seq_tech_list,
+            interval,
+            dates,
             countries,
+            complete_partial_radio,
+        )
+        table_df = TableFilter("explorer", mutation_list).create_explore_table_export(
+            df_dict,
+            complete_partial_radio,
+            reference_id,
+            samples,
+            sort_by,
+            filter_query,
         )
-        return table_df.to_dict("records"), [
-            {"name": i, "id": i} for i in table_df.columns
-        ]
+        return dcc.send_data_frame(table_df.to_csv, "Data.csv", index=False)
@@ -268,8 +268,35 @@ def html_disclaimer_seq_errors(tool, only_cds=False):
     return disclaimer
 
 
-def html_table(df, title, tool):
-
+def html_table(df, title, tool, server_side=False):
+    """
+    :param server_side: paging, sorting and filtering by callback,
+        only the rows of the current page are sent to the browser
+        -> the csv of all rows is built by a callback of button table_export_{tool}
+    """
+    table_options = {"export_format": "csv"}
+    export_elements = []
+    if server_side:
+        export_elements = [
+            dbc.Button(
+                "Export",
+                id=f"table_export_{tool}",
+                size="sm",
+                color="secondary",
+                className="mb-1",
+                n_clicks=0,
+            ),
+            dcc.Download(id=f"table_download_{tool}"),
+        ]
+        table_options = {
+            "page_action": "custom",
+            "page_count": 1,
+            "sort_action": "custom",
+            "sort_mode": "multi",
+            "sort_by": [],
+            "filter_action": "custom",
+            "filter_query": "",
+        }
     Output_table_standard = dbc.Card(
         [
             html.H3(title),
@@ -279,7 +306,8 @@ def html_table(df, title, tool):
                         [
                             html.Div(id=f"filter-table-output_{tool}", children=""),
                             html.Div(
-                                [
+                                export_elements
+                                + [
                                     dash_table.DataTable(
                                         data=df.to_dict("records"),
                                         columns=[
@@ -312,7 +340,7 @@ def html_table(df, title, tool):
                                         style_table={
                                             "overflowX": "auto",
                                         },
-                                        export_format="csv",
+                                        **table_options,
                                     ),
                                 ]
                             ),
@@ -1,23 +1,33 @@
 #!/usr/bin/env python3
 # Author: K2.
 # Step in this File
-# 1. Search query term and then get total count
-# 2. load with batch size and save into tmp file.
-# 3. Parse the record and save into tsv and fasta
+# 1. Search query term, keep the IDs of new samples in .download.ids
+# 2. load batches concurrently with adaptive batch size and save into tmp files.
+# 3. Parse the records in parallel and save into tsv and fasta
+#    while the download is running
 # ----
-# 4. log.log file to keep track process
+# 4. MPX.<start>-<end>.GB files to keep track process
 # 5. .success to indicate this folder is ready to import.
 
 import argparse
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 import datetime
 import logging
+import multiprocessing
 import os
-import random
+import re
 import sys
+import threading
 import time
-import traceback
 from urllib.error import HTTPError
+from urllib.error import URLError
+from urllib.parse import urlencode
 from urllib.parse import urlparse
+from urllib.request import Request
+from urllib.request import urlopen
 
 from Bio import Entrez
 from Bio import SeqIO
@@ -47,6 +57,69 @@ Entrez.email = os.getenv("NCBI_EMAIL", "")  # Always tell NCBI who you are
 URI = urlparse(os.getenv("DB_URL", ""))
 # connection parameters
 
+# nucleotide nuccore
+DB = "nucleotide"
+QUERY = "Monkeypox virus[Organism]"
+EUTILS_URL = os.getenv(
+    "NCBI_EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+)
+# NCBI allows 3 requests per second without and 10 with an API key
+REQUESTS_PER_SECOND = float(
+    os.getenv("NCBI_REQUESTS_PER_SECOND", 10 if Entrez.api_key else 3)
+)
+DOWNLOAD_WORKERS = int(os.getenv("NCBI_DOWNLOAD_WORKERS", 3))
+PARSE_WORKERS = int(os.getenv("NCBI_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+# records per efetch request, adapted to the server responses within the limits
+BATCH_SIZE = 50
+MIN_BATCH_SIZE = 10
+MAX_BATCH_SIZE = 500
+# responses slower than this (seconds) reduce the batch size
+SLOW_RESPONSE = 30
+REQUEST_TIMEOUT = 300
+MAX_TRIES = 3
+# seconds, doubled with every attempt if the server sends no Retry-After
+RETRY_DELAY = 10
+RETRY_HTTP_CODES = {400, 429, 500, 502, 503, 504}
+BATCH_FILE_PATTERN = re.compile(r"^MPX\.(\d+)-(\d+)\.GB$")
+
+
+class DownloadError(Exception):
+    pass
+
+
+class RateLimiter:
+    """Spread the requests of all download threads to requests_per_second."""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second
+        self.next_request = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_request - now
+            self.next_request = max(now, self.next_request) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class BatchSizer:
+    """Batch size of the next efetch requests, doubled after fast responses
+    and halved after slow or failed ones."""
+
+    def __init__(self, size=BATCH_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+
+    def update(self, seconds=None):
+        """seconds: response time of a successful request, None for a failed one."""
+        with self.lock:
+            if seconds is not None and seconds < SLOW_RESPONSE:
+                self.size = min(MAX_BATCH_SIZE, self.size * 2)
+            else:
+                self.size = max(MIN_BATCH_SIZE, self.size // 2)
+
 
 def get_existing_sample_list():
     try:
@@ -75,145 +148,310 @@ def get_existing_sample_list():
     return db_sample_list
 
 
-def download(save_path):  # noqa: C901
-    # nucleotide nuccore
-    DB = "nucleotide"
-    QUERY = "Monkeypox virus[Organism]"
-    BATCH_SIZE = 10
+def eutils_request(cgi, limiter, **params):
+    """POST a request to the E-utilities within the requests-per-second budget."""
+    for key in ["api_key", "tool", "email"]:
+        if getattr(Entrez, key):
+            params[key] = getattr(Entrez, key)
+    limiter.wait()
+    request = Request(f"{EUTILS_URL}/{cgi}", data=urlencode(params).encode())
+    return urlopen(request, timeout=REQUEST_TIMEOUT)
+
+
+def search_ids(limiter):
     # 1
-    # retmax=1 just returns first result of possibly many.
-    attempt = 0
-    success = False
-    while attempt < 3 and not success:
-        attempt += 1
+    for attempt in range(1, MAX_TRIES + 1):
         try:
-            handle = Entrez.esearch(
-                db=DB,
-                term=QUERY,
-                usehistory="y",
-                idtype="acc",
-            )
-
-            record = Entrez.read(handle)
-            total_count = record["Count"]
+            with eutils_request(
+                "esearch.fcgi", limiter, db=DB, term=QUERY, idtype="acc"
+            ) as handle:
+                total_count = Entrez.read(handle)["Count"]
             logging.info("All samples are found: %s " % (total_count))
 
-            handle = Entrez.esearch(
+            with eutils_request(
+                "esearch.fcgi",
+                limiter,
                 db=DB,
                 term=QUERY,
                 retmax=total_count,
-                usehistory="y",
                 idtype="acc",
-            )
-            record = Entrez.read(handle)
-            # setup cache
-            time.sleep(random.randint(3, 6))
-            # print(record)
-            id_list = record["IdList"]
-            db_sample_list = get_existing_sample_list()
-            id_list = list(set(id_list) - set(db_sample_list))
-            total_count = len(id_list)
-
-            logging.info("Remaining samples after check: %s " % (total_count))
-            search_results = Entrez.read(Entrez.epost(DB, id=",".join(id_list)))
-            webenv = search_results["WebEnv"]
-            query_key = search_results["QueryKey"]
-
-            success = True
+            ) as handle:
+                return list(Entrez.read(handle)["IdList"])
         except Exception as e:
             logging.error("Error at %s", "getting ID", exc_info=e)
-            logging.info("Reties to reconnect...")
-            time.sleep(random.randint(10, 20))
-    handle.close()
-    if attempt == 3 and not success:
-        return False
-
-    if not os.path.exists(os.path.join(save_path, ".download.log")):
-        file_log_handler = open(os.path.join(save_path, ".download.log"), "w+")
-    else:
-        file_log_handler = open(os.path.join(save_path, ".download.log"), "r+")
+            if attempt < MAX_TRIES:
+                logging.info("Reties to reconnect...")
+                time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+    raise DownloadError("Cannot get the sample IDs")
+
+
+def load_id_list(save_path, limiter):
+    """
+    IDs of all samples to download, ordered to give every batch file a fixed range.
+    The list is kept in .download.ids to resume an interrupted download.
+    """
+    ids_file = os.path.join(save_path, ".download.ids")
+    if os.path.exists(ids_file):
+        with open(ids_file) as handle:
+            id_list = handle.read().split()
+        logging.info(f"Resume previous download of {len(id_list)} samples")
+        return id_list
+
+    # batch files of an older download do not belong to the new ID list
+    for path in downloaded_batches(save_path).values():
+        os.remove(path)
+    id_list = search_ids(limiter)
+    db_sample_list = get_existing_sample_list()
+    id_list = sorted(set(id_list) - set(db_sample_list))
+    logging.info("Remaining samples after check: %s " % (len(id_list)))
+    with open(ids_file + ".tmp", "w") as handle:
+        handle.write("\n".join(id_list))
+    os.replace(ids_file + ".tmp", ids_file)
+    return id_list
+
+
+def downloaded_batches(save_path):
+    """
+    Returns:
+        {(start, end): path} of all completely downloaded batch files
+    """
+    batches = {}
+    for x in os.listdir(save_path):
+        match = BATCH_FILE_PATTERN.match(x)
+        if match:
+            batches[int(match[1]), int(match[2])] = os.path.join(save_path, x)
+    return dict(sorted(batches.items()))
+
+
+def missing_ranges(total_count, batches):
+    """Ranges of [0, total_count) not covered by the (start, end) keys of batches."""
+    ranges = deque()
+    position = 0
+    for start, end in batches:
+        if start > position:
+            ranges.append((position, start))
+        position = max(position, end)
+    if position < total_count:
+        ranges.append((position, total_count))
+    return ranges
+
+
+def fetch_batch(ids, limiter, sizer):
+    """Fetch the GenBank records of ids, retried up to MAX_TRIES times."""
+    for attempt in range(1, MAX_TRIES + 1):
+        delay = RETRY_DELAY * 2 ** (attempt - 1)
+        request_start = time.monotonic()
+        try:
+            with eutils_request(
+                "efetch.fcgi",
+                limiter,
+                db=DB,
+                id=",".join(ids),
+                rettype="gb",
+                retmode="text",
+                idtype="acc",
+            ) as handle:
+                data = handle.read().decode()
+            # NCBI sometimes closes the connection in the middle of a response.
+            if not data.rstrip().endswith("//"):
+                raise ValueError("Incomplete GenBank response")
+            sizer.update(time.monotonic() - request_start)
+            return data
+        except HTTPError as err:
+            if err.code not in RETRY_HTTP_CODES:
+                raise
+            retry_after = err.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = int(retry_after)
+            error = err
+        except (URLError, OSError, ValueError) as err:
+            error = err
+        sizer.update()
+        logging.warning(f"Received error from server {error}")
+        logging.warning(f"Attempt {attempt} of {MAX_TRIES}")
+        if attempt < MAX_TRIES:
+            time.sleep(delay)
+    raise DownloadError(f"Cannot download {ids[0]} to {ids[-1]}")
+
+
+def download_batch(save_path, id_list, start, end, limiter, sizer):
+    data = fetch_batch(id_list[start:end], limiter, sizer)
+    save_filename = os.path.join(save_path, f"MPX.{start}-{end}.GB")
+    # complete files only, the file names are the resume state
+    with open(save_filename + ".tmp", "w") as file_handler:
+        file_handler.write(data)
+    os.replace(save_filename + ".tmp", save_filename)
+    logging.info("Downloaded record %i to %i" % (start + 1, end))
+    return save_filename
 
-    try:
-        _start = int(file_log_handler.read())
-        logging.info(f"Resume previous download: start at {_start}")
-    except Exception:
-        logging.warning(
-            "Cannot resume previous download, we will start a new download."
-        )
-        _start = 0
-    # 2
-    for start in range(_start, int(total_count), BATCH_SIZE):
-        end = min(int(total_count), start + BATCH_SIZE)
-        logging.info("Going to download record %i to %i" % (start + 1, end))
-
-        save_filename = os.path.join(save_path, f"MPX.{start}-{end}.GB")
-        file_handler = open(save_filename, "w")
-        attempt = 0
-        success = False
-        while attempt < 3 and not success:
-            attempt += 1
-            try:
-                fetch_handle = Entrez.efetch(
-                    db=DB,
-                    rettype="gb",
-                    retmode="text",
-                    retstart=start,
-                    retmax=BATCH_SIZE,
-                    webenv=webenv,
-                    query_key=query_key,
-                    idtype="acc",
-                )
-                success = True
-            except HTTPError as err:
-                if 500 <= err.code <= 599:
-                    logging.warning(f"Received error from server {err}")
-                    logging.warning(f"Attempt {attempt} of 3")
-                    time.sleep(random.randint(60, 100))
-                if 400 == err.code:
-                    logging.warning(f"Received error from server {err}")
-                    logging.warning(f"fAttempt {attempt} of 3")
-                    time.sleep(random.randint(60, 100))
-                else:
-                    raise
-            except Exception as e:
-                logging.error("Error at %s", "download sample", exc_info=e)
-                time.sleep(random.randint(10, 20))
-
-        if attempt == 3 and not success:
-            fetch_handle.close()
-            file_handler.close()
-            file_log_handler.close()
-            return False
 
-        data = fetch_handle.read()
-        fetch_handle.close()
+def download(save_path):
+    """
+    Download the GenBank records of all new samples, DOWNLOAD_WORKERS requests
+    run concurrently within REQUESTS_PER_SECOND.
+    Failed batches are split and requeued, a rerun resumes with the missing batches.
 
-        file_handler.write(data)
-        file_handler.close()
-        # save  end .log
-        file_log_handler.seek(0)
-        file_log_handler.write(str(end))
-        file_log_handler.truncate()
-        time.sleep(random.randint(3, 6))
+    Yields:
+        path of every batch file, previously downloaded ones first
+
+    Raises:
+        DownloadError: a batch of MIN_BATCH_SIZE records cannot be downloaded
+    """
+    limiter = RateLimiter(REQUESTS_PER_SECOND)
+    id_list = load_id_list(save_path, limiter)
+    batches = downloaded_batches(save_path)
+    yield from batches.values()
+
+    # 2
+    pending = missing_ranges(len(id_list), batches)
+    sizer = BatchSizer()
+    with ThreadPoolExecutor(DOWNLOAD_WORKERS) as executor:
+        running = {}
+        while pending or running:
+            while pending and len(running) < DOWNLOAD_WORKERS:
+                start, end = pending.popleft()
+                if end - start > sizer.size:
+                    pending.appendleft((start + sizer.size, end))
+                    end = start + sizer.size
+                future = executor.submit(
+                    download_batch, save_path, id_list, start, end, limiter, sizer
+                )
+                running[future] = (start, end)
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                start, end = running.pop(future)
+                try:
+                    yield future.result()
+                except DownloadError:
+                    if end - start <= MIN_BATCH_SIZE:
+                        executor.shutdown(cancel_futures=True)
+                        raise
+                    middle = (start + end) // 2
+                    pending.extendleft([(middle, end), (start, middle)])
 
     with open(os.path.join(save_path, ".download.success"), "w") as f:
         f.writelines("done")
+    logging.info("Download completed")
+
+
+def parse_record(seq_record):
+    """
+    Returns:
+        fasta entry and meta.tsv line of the GenBank record
+    """
+    _isolate = ""
+    _country = ""
+    _geo_location = ""
+    _NCBI_release_date = ""
+    _collection_date = ""
+    _seq_tech = ""
+    _nuc_completeness = ""
+    _host = ""
+
+    fasta = ">%s |%s\n%s\n" % (seq_record.id, seq_record.description, seq_record.seq)
+
+    # assume all keys are exit.
+    if "partial" in seq_record.description:
+        _nuc_completeness = "partial"
+    elif "complete" in seq_record.description:
+        _nuc_completeness = "complete"
+    if "host" in seq_record.features[0].qualifiers:
+        _host = seq_record.features[0].qualifiers["host"][0]
+    if "isolate" in seq_record.features[0].qualifiers:
+        _isolate = seq_record.features[0].qualifiers["isolate"][0]
+    if "country" in seq_record.features[0].qualifiers:
+        _geo_location = seq_record.features[0].qualifiers["country"][0]
+        # extract country only
+        _country = _geo_location.split(":")[0]
+
+    if "collection_date" in seq_record.features[0].qualifiers:
+        _collection_date = seq_record.features[0].qualifiers["collection_date"][0]
+        # Step
+        # 1.) Fix date;
+        # * Nov-2017 -> 2017-11-01, 09-Nov-2017 -> 2017-11-09
+        # * 1995 -> 1995-01-01 set default value with first day of
+        # the month and first month of the year
+        # 2.) Year needs to be present in the format.
+
+        d = dateparser.parse(
+            _collection_date,
+            settings={
+                "PREFER_DAY_OF_MONTH": "first",
+                "DATE_ORDER": "YMD",
+                "REQUIRE_PARTS": ["year"],
+                "RELATIVE_BASE": datetime.datetime(2022, 1, 1),
+            },
+        )
+        _collection_date = d.strftime("%Y-%m-%d")
+
+    if (
+        "structured_comment" in seq_record.annotations
+        and "Assembly-Data" in seq_record.annotations["structured_comment"]
+        and "Sequencing Technology"
+        in seq_record.annotations["structured_comment"]["Assembly-Data"]
+    ):
+        _seq_tech = seq_record.annotations["structured_comment"]["Assembly-Data"][
+            "Sequencing Technology"
+        ]
+
+    if "date" in seq_record.annotations:
+        _NCBI_release_date = seq_record.annotations["date"]
+        # Fix date; 18-NOV-2022 -> 2022-11-18
+        d = dateparser.parse(
+            _NCBI_release_date,
+            settings={"PREFER_DAY_OF_MONTH": "first", "DATE_ORDER": "YMD"},
+        )
+        _NCBI_release_date = d.strftime("%Y-%m-%d")
+
+    meta = "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (
+        seq_record.id,
+        _isolate,
+        len(seq_record),
+        _country,
+        _geo_location,
+        _NCBI_release_date,
+        _collection_date,
+        _seq_tech,
+        _host,
+        _nuc_completeness,
+    )
+    return fasta, meta
+
+
+def parse_genbank_file(_file):
+    """
+    Returns:
+        fasta entries and meta.tsv lines of all records in the GenBank file
+    """
+    fasta_entries = []
+    meta_lines = []
+    for seq_record in SeqIO.parse(_file, "genbank"):
+        # remove reference genome from the list.
+        if seq_record.id in IGNORE_LIST:
+            continue
+        try:
+            fasta, meta = parse_record(seq_record)
+        except Exception as e:
+            raise ValueError(f"Error in {seq_record.id} of {_file} !!") from e
+        fasta_entries.append(fasta)
+        meta_lines.append(meta)
+    return "".join(fasta_entries), "".join(meta_lines)
 
-    file_log_handler.close()
-    return True
 
+def generate_outputfiles(list_of_GB, save_final_path):
+    """
+    Parse the GenBank files in PARSE_WORKERS processes, the records are written
+    as soon as a file is parsed.
 
-def generate_outputfiles(save_download_path, save_final_path):  # noqa: C901
+    Args:
+        list_of_GB: iterable of GenBank files, e.g. the running download
 
-    list_of_GB = []
-    for x in os.listdir(save_download_path):
-        if x.endswith(".GB"):
-            # Prints only text file present in My Folder
-            list_of_GB.append(os.path.join(save_download_path, x))
+    Returns:
+        bool: True if all records are written
 
-    # fasta & meta
-    fasta_out_handler = open(os.path.join(save_final_path, "seq.fasta"), "w")
-    meta_out_handler = open(os.path.join(save_final_path, "meta.tsv"), "w")
+    Raises:
+        DownloadError: of the download in list_of_GB
+    """
     header = [
         "ID",
         "ISOLATE",
@@ -226,110 +464,22 @@ def generate_outputfiles(save_download_path, save_final_path):  # noqa: C901
         "HOST",
         "GENOME_COMPLETENESS",
     ]
-    meta_out_handler.write("\t".join(header) + "\n")  # Write the header line
-    try:
-        for _file in list_of_GB:
-            logging.info("Load:" + _file)
-            seq_GBrecords = list(SeqIO.parse(_file, "genbank"))
-            for seq_record in seq_GBrecords:
-                # remove reference genome from the list.
-                if seq_record.id in IGNORE_LIST:
-                    continue
-
-                _isolate = ""
-                _country = ""
-                _geo_location = ""
-                _NCBI_release_date = ""
-                _collection_date = ""
-                _seq_tech = ""
-                _nuc_completeness = ""
-                _host = ""
-                # print("Dealing with GenBank record %s" % seq_record.id)
-
-                fasta_out_handler.write(
-                    ">%s |%s\n%s\n"
-                    % (seq_record.id, seq_record.description, seq_record.seq)
-                )
-
-                # assume all keys are exit.
-                if "partial" in seq_record.description:
-                    _nuc_completeness = "partial"
-                elif "complete" in seq_record.description:
-                    _nuc_completeness = "complete"
-                if "host" in seq_record.features[0].qualifiers:
-                    _host = seq_record.features[0].qualifiers["host"][0]
-                if "isolate" in seq_record.features[0].qualifiers:
-                    _isolate = seq_record.features[0].qualifiers["isolate"][0]
-                if "country" in seq_record.features[0].qualifiers:
-                    _geo_location = seq_record.features[0].qualifiers["country"][0]
-                    # extract country only
-                    _country = _geo_location.split(":")[0]
-
-                if "collection_date" in seq_record.features[0].qualifiers:
-                    _collection_date = seq_record.features[0].qualifiers[
-                        "collection_date"
-                    ][0]
-                    # Step
-                    # 1.) Fix date;
-                    # * Nov-2017 -> 2017-11-01, 09-Nov-2017 -> 2017-11-09
-                    # * 1995 -> 1995-01-01 set default value with first day of
-                    # the month and first month of the year
-                    # 2.) Year needs to be present in the format.
-
-                    d = dateparser.parse(
-                        _collection_date,
-                        settings={
-                            "PREFER_DAY_OF_MONTH": "first",
-                            "DATE_ORDER": "YMD",
-                            "REQUIRE_PARTS": ["year"],
-                            "RELATIVE_BASE": datetime.datetime(2022, 1, 1),
-                        },
-                    )
-                    _collection_date = d.strftime("%Y-%m-%d")
-
-                if (
-                    "structured_comment" in seq_record.annotations
-                    and "Assembly-Data" in seq_record.annotations["structured_comment"]
-                    and "Sequencing Technology"
-                    in seq_record.annotations["structured_comment"]["Assembly-Data"]
-                ):
-                    _seq_tech = seq_record.annotations["structured_comment"][
-                        "Assembly-Data"
-                    ]["Sequencing Technology"]
-
-                if "date" in seq_record.annotations:
-                    _NCBI_release_date = seq_record.annotations["date"]
-                    # Fix date; 18-NOV-2022 -> 2022-11-18
-                    d = dateparser.parse(
-                        _NCBI_release_date,
-                        settings={"PREFER_DAY_OF_MONTH": "first", "DATE_ORDER": "YMD"},
-                    )
-                    _NCBI_release_date = d.strftime("%Y-%m-%d")
-
-                meta_out_handler.write(
-                    "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n"
-                    % (
-                        seq_record.id,
-                        _isolate,
-                        len(seq_record),
-                        _country,
-                        _geo_location,
-                        _NCBI_release_date,
-                        _collection_date,
-                        _seq_tech,
-                        _host,
-                        _nuc_completeness,
-                    )
-                )
-    except Exception:
-        fasta_out_handler.close()
-        meta_out_handler.close()
-        logging.exception(f"Error in {seq_record.id} !!")
-        traceback.print_exc()
-        return False
-
-    fasta_out_handler.close()
-    meta_out_handler.close()
+    # fasta & meta
+    fasta_path = os.path.join(save_final_path, "seq.fasta")
+    meta_path = os.path.join(save_final_path, "meta.tsv")
+    with multiprocessing.Pool(PARSE_WORKERS) as pool, open(
+        fasta_path, "w"
+    ) as fasta_out_handler, open(meta_path, "w") as meta_out_handler:
+        meta_out_handler.write("\t".join(header) + "\n")  # Write the header line
+        try:
+            for fasta, meta in pool.imap_unordered(parse_genbank_file, list_of_GB):
+                fasta_out_handler.write(fasta)
+                meta_out_handler.write(meta)
+        except DownloadError:
+            raise
+        except Exception:
+            logging.exception("Cannot process the GenBank files !!")
+            return False
     return True
 
 
@@ -358,7 +508,7 @@ def run(args):
             logging.StreamHandler(),
         ],
     )
-    logging.info("Script version: 1.1")
+    logging.info("Script version: 1.2")
     logging.info("Save output to:" + SAVE_PATH)
 
     save_download_path = os.path.join(SAVE_PATH, "GB")
@@ -371,19 +521,20 @@ def run(args):
     #
     logging.info("--- Download samples ---")
     if not os.path.exists(os.path.join(SAVE_PATH, "GB", ".download.success")):
-        if download(save_download_path):
-            logging.info("Download completed")
-        else:
-            logging.error("Download stop before it is finished")
-            sys.exit("Please rerun it again later.")
+        list_of_GB = download(save_download_path)
     else:
         logging.info("Download completed, continue to process on GeneBank files.")
+        list_of_GB = downloaded_batches(save_download_path).values()
 
     # 3
     logging.info("--- Convert GeneBank to fasta and meta file ---")
     # if not os.path.exists(os.path.join(SAVE_PATH, ".success")):
-    if generate_outputfiles(save_download_path, save_final_path):
-
+    try:
+        success = generate_outputfiles(list_of_GB, save_final_path)
+    except DownloadError:
+        logging.exception("Download stop before it is finished")
+        sys.exit("Please rerun it again later.")
+    if success:
         logging.info("Processing completed")
     else:
         logging.error("Process stop before it is finished")
@@ -7,9 +7,11 @@ import os
 import pickle
 import re
 import sys
+import tempfile
 
 from Bio.Align.Applications import MafftCommandline
 from Bio.Emboss.Applications import StretcherCommandline
+import numpy as np
 import pandas as pd
 import parasail
 import psutil
@@ -32,6 +34,8 @@ class sonarAligner(object):
         self.outdir = TMP_CACHE if not cache_outdir else os.path.abspath(cache_outdir)
         self.logfile = open(os.path.join(self.outdir, "align.debug.log"), "a")
         self.method = method
+        self._lift_tables = {}
+        self._translation_tables = {}
 
     def read_seqcache(self, fname):
         with open(fname, "r") as handle:
@@ -136,53 +140,80 @@ class sonarAligner(object):
 
         return qry, ref
 
-    def process_cached_sample(self, fname):
-        if self.method == 1:  # MAFFT
-            process_flag = self.process_cached_v1(fname)
-        elif self.method == 2:  # Parasail
-            process_flag = self.process_cached_v2(fname)
-        return process_flag
+    @staticmethod
+    def load_cached_sample(sample):
+        """
+        :param sample: path of a .sample file or an already loaded sample dict
+            (from the packed sample cache, including the query "sequence")
+        :return: sample dict
+        """
+        if isinstance(sample, dict):
+            return sample
+        with open(sample, "rb") as handle:
+            return pickle.load(handle, encoding="bytes")
 
-    def process_cached_v1(self, fname):
+    @staticmethod
+    def is_packed(data):
         """
-        Work with: Emboss Stretcher, Mafft
-        This function takes a sample file and processes it.
-        create var file with NT and AA mutations
+        Samples of the packed cache carry their sequence, their variants are
+        returned to the caching process instead of being written to a var file.
         """
-        with open(fname, "rb") as handle:
-            data = pickle.load(handle, encoding="bytes")
+        return "sequence" in data
+
+    def get_query_sequence(self, data):
+        if self.is_packed(data):
+            return data["sequence"]
+        return self.read_seqcache(data["seq_file"])
 
+    def is_profiled(self, data):
+        """
+        :return: whether the sample needs no profiling, i.e. has an unchanged
+            sequence or a complete var file of a former run
+        """
         if data["var_file"] is None:
             return True
-        elif os.path.isfile(data["var_file"]):
-            with open(data["var_file"], "r") as handle:
-                for line in handle:
-                    pass
-            if line == "//":
-                return True
+        if self.is_packed(data) or not os.path.isfile(data["var_file"]):
+            return False
+        line = ""
+        with open(data["var_file"], "r") as handle:
+            for line in handle:
+                pass
+        return line == "//"
 
-        sourceid = str(data["source_acc"])
+    def process_cached_sample(self, fname):
+        """
+        Align a cached sample, check that its sequence can be restored from the
+        extracted variants and write the var file of verified samples.
+
+        Return:
+            {} if the sample passed, else the dict of paranoid_check;
+            samples of the packed cache that passed return
+            {"var_file": ..., "variants": [...]} for sonarCache.cache_variants
+        """
+        data = self.load_cached_sample(fname)
+        if self.is_profiled(data):
+            return {}
         self.log("data:" + str(data))
-        # alignment = self.align(data["seq_file"], data["ref_file"])
-        alignment = self.align_MAFFT(data["mafft_seqfile"])
-        # print(alignment[0][0:20]) qry
-        # print(alignment[1][0:20]) ref
-        nuc_vars = [x for x in self.extract_vars(*alignment, elem_acc=sourceid)]
-        vars = "\n".join(["\t".join(x) for x in nuc_vars])
+
+        if self.method == 1:  # MAFFT
+            nuc_vars = self.process_cached_v1(data)
+        elif self.method == 2:  # Parasail
+            nuc_vars = self.process_cached_v2(data)
+
+        paranoid_dict = self.paranoid_check(data, nuc_vars)
+        if paranoid_dict:
+            return paranoid_dict
+
+        variants = list(nuc_vars)
         if nuc_vars:
             # create AA mutation
-            aa_vars = "\n".join(
-                [
-                    "\t".join(x)
-                    for x in self.lift_vars(
-                        nuc_vars, data["lift_file"], data["tt_file"]
-                    )
-                ]
+            variants.extend(
+                self.lift_vars(nuc_vars, data["lift_file"], data["tt_file"])
             )
-            if aa_vars:
-                # concatinate to the same file of NT variants
-                vars += "\n" + aa_vars
-            vars += "\n"
+        if self.is_packed(data):
+            return {"var_file": data["var_file"], "variants": variants}
+
+        vars = "".join(["\t".join(x) + "\n" for x in variants])
         try:
             with open(data["var_file"], "w") as handle:
                 handle.write(vars + "//")
@@ -190,28 +221,49 @@ class sonarAligner(object):
             os.makedirs(os.path.dirname(data["var_file"]), exist_ok=True)
             with open(data["var_file"], "w") as handle:
                 handle.write(vars + "//")
-        return True
+        return {}
 
-    def process_cached_v2(self, fname):
+    def write_mafft_input(self, data):
         """
-        Work with: Cigar format
-        This function takes a sample file and processes it.
-        create var file with NT and AA mutations
+        Write a temporary fasta file with the reference and the query sequence
+        as MAFFT input, only the MAFFT method needs the sequences in one file.
+        """
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.outdir, suffix=".fasta", delete=False
+        ) as handle:
+            handle.write(">" + data["refmol"] + "\n")
+            handle.write(self.read_seqcache(data["ref_file"]) + "\n")
+            handle.write(">" + data["seqhash"] + "\n")
+            handle.write(self.get_query_sequence(data) + "\n")
+        return handle.name
+
+    def process_cached_v1(self, data):
         """
+        Work with: Emboss Stretcher, Mafft
+        This function takes a sample dict and processes it.
 
-        with open(fname, "rb") as handle:
-            data = pickle.load(handle, encoding="bytes")
+        Return:
+            NT variants
+        """
+        sourceid = str(data["source_acc"])
+        # alignment = self.align(data["seq_file"], data["ref_file"])
+        mafft_input = self.write_mafft_input(data)
+        try:
+            alignment = self.align_MAFFT(mafft_input)
+        finally:
+            os.remove(mafft_input)
+        # print(alignment[0][0:20]) qry
+        # print(alignment[1][0:20]) ref
+        return [x for x in self.extract_vars(*alignment, elem_acc=sourceid)]
 
-        if data["var_file"] is None:
-            return True
-        elif os.path.isfile(data["var_file"]):
-            with open(data["var_file"], "r") as handle:
-                for line in handle:
-                    pass
-            if line == "//":
-                return True
+    def process_cached_v2(self, data):
+        """
+        Work with: Cigar format
+        This function takes a sample dict and processes it.
 
-        self.log("data:" + str(data))
+        Return:
+            NT variants
+        """
         # sourceid = str(data["sourceid"])
         # alignment = self.align(data["seq_file"], data["ref_file"])
         # self.cal_seq_length(alignment[0][0:20], msg="qry")
@@ -220,39 +272,74 @@ class sonarAligner(object):
 
         # elemid = str(data["sourceid"])
         source_acc = str(data["source_acc"])
-        qryseq = self.read_seqcache(data["seq_file"])
+        qryseq = self.get_query_sequence(data)
         refseq = self.read_seqcache(data["ref_file"])
         _, __, cigar = self.align(qryseq, refseq)
-        nuc_vars = [
+        return [
             x
             for x in self.extract_vars_from_cigar(
                 qryseq, refseq, cigar, source_acc, data["cds_file"]
             )
         ]
 
-        vars = "\n".join(["\t".join(x) for x in nuc_vars])
-        if nuc_vars:
-            # create AA mutation
-            aa_vars = "\n".join(
-                [
-                    "\t".join(x)
-                    for x in self.lift_vars(
-                        nuc_vars, data["lift_file"], data["tt_file"]
-                    )
-                ]
-            )
-            if aa_vars:
-                # concatenate to the same file of NT variants
-                vars += "\n" + aa_vars
-            vars += "\n"
-        try:
-            with open(data["var_file"], "w") as handle:
-                handle.write(vars + "//")
-        except OSError:
-            os.makedirs(os.path.dirname(data["var_file"]), exist_ok=True)
-            with open(data["var_file"], "w") as handle:
-                handle.write(vars + "//")
-        return True
+    def paranoid_check(self, data, nuc_vars):  # noqa: C901
+        """
+        Restore the query sequence from the reference and the extracted nucleotide
+        variants and compare it to the cached sequence, before anything is imported.
+        Failing samples are written to the error directory of the cache.
+
+        Return:
+            {} if the sequence was restored, else
+            dict with sample_name, qryfile, reffile and output_paranoid
+        """
+        with open(data["ref_file"], "r") as handle:
+            seq = list(handle.read())
+        prefix = ""
+        gaps = {".", " "}
+        for vardata in nuc_vars:
+            start, end, alt = int(vardata[1]), int(vardata[2]), vardata[3]
+            if alt in gaps:
+                for i in range(start, end):
+                    seq[i] = ""
+            elif start >= 0:
+                seq[start] = alt
+            else:
+                prefix = alt
+        # seq is now a restored version from the variants.
+        seq = prefix + "".join(seq)
+        if self.is_packed(data):
+            orig_seq = data["sequence"]
+        else:
+            with open(data["seq_file"], "r") as handle:
+                orig_seq = handle.read()
+        if seq == orig_seq:
+            return {}
+
+        sample_name = data["name"]
+        self.log("[Paranoid-test] Fail sample:" + sample_name)
+        logging.warn(
+            f"Failure in sanity check: This {sample_name} sample will not be inserted to the database."
+        )
+        error_dir = os.path.join(self.outdir, "error")
+        os.makedirs(error_dir, exist_ok=True)
+        with open(os.path.join(error_dir, f"{sample_name}.error.var"), "w+") as handle:
+            for vardata in nuc_vars:
+                handle.write("\t".join(vardata) + "\n")
+        qryfile = os.path.join(error_dir, sample_name + ".error.restored_sam.fa")
+        reffile = os.path.join(error_dir, sample_name + ".error.original_sam.fa")
+        with open(qryfile, "w+") as handle:
+            handle.write(seq)
+        with open(reffile, "w+") as handle:
+            handle.write(orig_seq)
+        return {
+            "sample_name": sample_name,
+            "qryfile": qryfile,
+            "reffile": reffile,
+            "output_paranoid": os.path.join(
+                self.outdir,
+                f"{sample_name}.withref.{data['refmol']}.fail-paranoid.fna",
+            ),
+        }
 
     def extract_vars(self, qry_seq, ref_seq, elem_acc):
         """
@@ -383,75 +470,34 @@ class sonarAligner(object):
             aa.append(tt[codon])
         return "".join(aa)
 
-    def lift_vars(self, nuc_vars, lift_file, tt_file):  # noqa: C901
-        df = pd.read_pickle(lift_file)
-        # print(df)
-        with open(tt_file, "rb") as handle:
-            tt = pickle.load(handle, encoding="bytes")
-        for nuc_var in nuc_vars:
-            if nuc_var[3] == ".":
-                continue  # ignore uncovered terminal regions
-            for i in range(int(nuc_var[1]), int(nuc_var[2])):
-                alt = "-" if nuc_var[3] == " " else nuc_var[3]
-                df.loc[df["nucPos1"] == i, "alt1"] = alt
-                df.loc[df["nucPos2"] == i, "alt2"] = alt
-                df.loc[df["nucPos3"] == i, "alt3"] = alt
-        # what if it is empty
-        df = df.loc[
-            (df["ref1"] != df["alt1"])
-            | (df["ref2"] != df["alt2"])
-            | (df["ref3"] != df["alt3"])
-        ]
-        prev_row = None
-        if not df.empty:
-            df["altAa"] = df.apply(
-                lambda x: self.translate(x["alt1"] + x["alt2"] + x["alt3"], tt), axis=1
-            )
-            df = df.loc[df["aa"] != df["altAa"]]
-
-            # snps or inserts
-            for index, row in df.loc[
-                (df["altAa"] != "-") & (df["altAa"] != "")
-            ].iterrows():
-                pos = row["aaPos"] + 1
-                label = row["aa"] + str(pos) + row["altAa"]
-                yield row["aa"], str(pos - 1), str(pos), row["altAa"], str(
-                    row["accession"]
-                ), label, "cds"
+    def get_lift_table(self, lift_file):
+        """
+        codon table of a reference, loaded once per aligner (= once per worker)
+        and reloaded only if the lift file was rewritten
+        """
+        key = (lift_file, os.path.getmtime(lift_file))
+        if key not in self._lift_tables:
+            self._lift_tables[key] = sonarLiftTable(lift_file)
+        return self._lift_tables[key]
+
+    def get_translation_table(self, tt_file):
+        if tt_file not in self._translation_tables:
+            with open(tt_file, "rb") as handle:
+                self._translation_tables[tt_file] = pickle.load(
+                    handle, encoding="bytes"
+                )
+        return self._translation_tables[tt_file]
 
-            # deletions
-            for index, row in (
-                df.loc[(df["altAa"] == "-")].sort_values(["elemid", "aaPos"]).iterrows()
-            ):
-                if prev_row is None:
-                    prev_row = row
-                elif (
-                    prev_row["elemid"] == row["elemid"]
-                    and abs(prev_row["aaPos"] - row["aaPos"]) == 1
-                ):
-                    prev_row["aa"] += row["aa"]
-                else:
-                    start = prev_row["aaPos"]
-                    end = prev_row["aaPos"] + len(prev_row["aa"])
-                    if end - start == 1:
-                        label = "del:" + str(start + 1)
-                    else:
-                        label = "del:" + str(start + 1) + "-" + str(end)
-                    yield prev_row["aa"], str(start), str(end), " ", str(
-                        prev_row["accession"]
-                    ), label, "cds"
-                    prev_row = row
-
-        if prev_row is not None:
-            start = prev_row["aaPos"]
-            end = prev_row["aaPos"] + len(prev_row["aa"])
-            if end - start == 1:
-                label = "del:" + str(start + 1)
-            else:
-                label = "del:" + str(start + 1) + "-" + str(end)
-            yield prev_row["aa"], str(start), str(end), " ", str(
-                prev_row["accession"]
-            ), label, "cds"
+    def lift_vars(self, nuc_vars, lift_file, tt_file):
+        """
+        lift nucleotide variants to amino acid variants of all CDS of the reference
+
+        yields (ref aa, start, end, alt aa, cds accession, label, "cds"),
+        first snps and inserts, then deletions ordered by element and position
+        """
+        lift_table = self.get_lift_table(lift_file)
+        tt = self.get_translation_table(tt_file)
+        yield from lift_table.lift_vars(nuc_vars, lambda seq: self.translate(seq, tt))
 
     def extract_vars_from_cigar(
         self, qryseq, refseq, cigar, elemid, cds_file
@@ -647,3 +693,104 @@ class sonarAligner(object):
                 pos = i - offset + 1
                 yield ref, str(pos - 1), str(pos), alt, elemid, ref + str(pos) + alt
             i += 1
+
+
+class sonarLiftTable(object):
+    """
+    codon table of a reference (lift file of sonarCache.cache_lift) kept as NumPy arrays
+    with an index from nucleotide position to codon slots.
+    Nucleotide variants are written directly into the touched slots and only
+    the touched codons are translated.
+    """
+
+    # position of padded codon slots, never matched by a variant
+    NO_POSITION = np.iinfo(np.int64).min
+
+    def __init__(self, lift_file):
+        df = pd.read_pickle(lift_file)
+        self.elemid = df["elemid"].to_numpy()
+        self.accession = df["accession"].to_numpy()
+        self.aa_pos = df["aaPos"].to_numpy()
+        self.aa = df["aa"].to_numpy()
+        self.ref = df[["ref1", "ref2", "ref3"]].to_numpy(dtype=object)
+        self.alt = df[["alt1", "alt2", "alt3"]].to_numpy(dtype=object)
+        positions = (
+            df[["nucPos1", "nucPos2", "nucPos3"]]
+            .replace("", self.NO_POSITION)
+            .to_numpy(dtype=np.int64)
+            .ravel()
+        )
+        # codon slots (row * 3 + slot) sorted by nucleotide position
+        self.slot_order = np.argsort(positions, kind="stable")
+        self.sorted_positions = positions[self.slot_order]
+        # codons already differing in the lift file
+        self.changed_rows = set(np.flatnonzero((self.ref != self.alt).any(axis=1)))
+
+    def write_nuc_vars(self, nuc_vars):
+        """
+        :return: {codon slot: alt nucleotide(s)} of all slots covered by nuc_vars,
+            later variants overwrite earlier ones
+        """
+        slot_alts = {}
+        for nuc_var in nuc_vars:
+            if nuc_var[3] == ".":
+                continue  # ignore uncovered terminal regions
+            alt = "-" if nuc_var[3] == " " else nuc_var[3]
+            first, last = np.searchsorted(
+                self.sorted_positions, [int(nuc_var[1]), int(nuc_var[2])]
+            )
+            for slot in self.slot_order[first:last]:
+                slot_alts[slot] = alt
+        return slot_alts
+
+    def lift_vars(self, nuc_vars, translate):
+        """
+        same output as the former row-wise lift of sonarAligner.lift_vars
+
+        :param translate: function translating a nucleotide sequence
+        """
+        slot_alts = self.write_nuc_vars(nuc_vars)
+        rows = sorted(self.changed_rows.union(slot // 3 for slot in slot_alts))
+        changed = []
+        for row in rows:
+            alts = [slot_alts.get(row * 3 + i, self.alt[row, i]) for i in range(3)]
+            if alts == list(self.ref[row]):
+                continue
+            alt_aa = translate("".join(alts))
+            if alt_aa != self.aa[row]:
+                changed.append((row, alt_aa))
+
+        # snps or inserts
+        for row, alt_aa in changed:
+            if alt_aa != "-" and alt_aa != "":
+                pos = self.aa_pos[row] + 1
+                label = self.aa[row] + str(pos) + alt_aa
+                yield self.aa[row], str(pos - 1), str(pos), alt_aa, str(
+                    self.accession[row]
+                ), label, "cds"
+
+        # deletions, consecutive positions are merged as in the former implementation:
+        # a run is extended while the position is next to the first position of the run
+        deletions = sorted(
+            (row for row, alt_aa in changed if alt_aa == "-"),
+            key=lambda row: (self.elemid[row], self.aa_pos[row]),
+        )
+        prev = None
+        for row in deletions:
+            if prev is None:
+                prev = [self.elemid[row], self.aa_pos[row], self.aa[row], row]
+            elif prev[0] == self.elemid[row] and abs(prev[1] - self.aa_pos[row]) == 1:
+                prev[2] += self.aa[row]
+            else:
+                yield self.deletion(*prev)
+                prev = [self.elemid[row], self.aa_pos[row], self.aa[row], row]
+        if prev is not None:
+            yield self.deletion(*prev)
+
+    def deletion(self, elemid, start, aa, row):
+        end = start + len(aa)
+        if end - start == 1:
+            label = "del:" + str(start + 1)
+        else:
+            label = "del:" + str(start + 1) + "-" + str(end)
+        return aa, str(start), str(end), " ", str(self.accession[row]), label, "cds"
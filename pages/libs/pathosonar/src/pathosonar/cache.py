@@ -3,7 +3,9 @@
 # author: Stephan Fuchs (Robert Koch Institute, MF1, fuchss@rki.de)
 
 import base64
+from collections import Counter
 from collections import defaultdict
+from functools import partial
 import hashlib
 import logging
 import os
@@ -11,15 +13,22 @@ import pickle
 import pprint
 import re
 import shutil
+import struct
 import sys
 import traceback
 from typing import Any
 from typing import Dict
+from typing import Iterable
 from typing import Iterator
+from typing import List
 from typing import Optional
+from typing import Tuple
 from typing import Union
+import zlib
 
+import magic
 from mpire import WorkerPool
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
@@ -42,6 +51,101 @@ from .utils_1 import get_filename_sonarhash
 pp = pprint.PrettyPrinter(indent=4)
 # Initialize logger
 LOGGER = LoggingConfigurator.get_logger()
+# bytes of FASTA input parsed, harmonized and hashed as one chunk by a worker,
+# sample lookups in the database are done once per chunk
+FASTA_CHUNK_SIZE = 4 * 1024 * 1024
+# samples per transaction of an import worker, see import_cached_samples_v2
+IMPORT_BATCH_SIZE = 500
+# columns of a var file written by sonarAligner, also the columns of the variant pack
+VAR_COLUMNS = ("ref", "start", "end", "alt", "element", "label", "frameshift")
+
+
+class sonarSamplePack:
+    """
+    Append-only segment file of records indexed by name, used by the packed cache
+    for sample dicts, sequences and variant tables.
+
+    Every record is a header (length of name, length of data), the utf-8 encoded
+    name and the zlib compressed pickle of the data. Caching a record again
+    appends a new one, the index always points to the latest one.
+    Records are only appended by the parent process, forked workers read them
+    with positional reads and do not share a file offset.
+
+    Attributes
+    ----------
+    fname : str
+        Path of the segment file.
+    index : dict
+        {name: (offset of the data, length of the data)}
+    """
+
+    HEADER = struct.Struct("<IQ")
+
+    def __init__(self, fname: str):
+        self.fname = fname
+        self.index = {}
+        self._writer = None
+        self._reader = None
+        if os.path.isfile(fname):
+            self._load_index()
+
+    def _load_index(self):
+        """
+        Rebuild the index by scanning the record headers of an existing segment file,
+        a truncated record at the end (interrupted write) is cut off.
+        """
+        size = os.path.getsize(self.fname)
+        with open(self.fname, "r+b") as handle:
+            offset = 0
+            while offset + self.HEADER.size <= size:
+                name_length, data_length = self.HEADER.unpack(
+                    handle.read(self.HEADER.size)
+                )
+                data_offset = offset + self.HEADER.size + name_length
+                if data_offset + data_length > size:
+                    break
+                name = handle.read(name_length).decode("utf-8")
+                self.index[name] = (data_offset, data_length)
+                offset = handle.seek(data_offset + data_length)
+            handle.truncate(offset)
+
+    def append(self, name: str, data: Any):
+        if self._writer is None:
+            self._writer = open(self.fname, "ab")
+        encoded_name = name.encode("utf-8")
+        record = zlib.compress(pickle.dumps(data), 1)
+        offset = self._writer.tell()
+        self._writer.write(self.HEADER.pack(len(encoded_name), len(record)))
+        self._writer.write(encoded_name)
+        self._writer.write(record)
+        self.index[name] = (
+            offset + self.HEADER.size + len(encoded_name),
+            len(record),
+        )
+
+    def read(self, name: str) -> Any:
+        if self._writer is not None:
+            self._writer.flush()
+        if self._reader is None:
+            self._reader = open(self.fname, "rb")
+        offset, length = self.index[name]
+        return pickle.loads(
+            zlib.decompress(os.pread(self._reader.fileno(), length, offset))
+        )
+
+    def iter_records(self, names) -> Iterator[Any]:
+        """
+        :param names: record names
+        :return: records in file order, i.e. with sequential reads
+        """
+        for name in sorted(names, key=lambda name: self.index[name][0]):
+            yield self.read(name)
+
+    def close(self):
+        for handle in (self._writer, self._reader):
+            if handle is not None:
+                handle.close()
+        self._writer = self._reader = None
 
 
 class sonarCache:
@@ -58,6 +162,7 @@ class sonarCache:
         temp: bool = False,
         debug: bool = False,
         disable_progress: bool = False,
+        packed: bool = False,
     ):
         """
         Initialize the sonarCache object.
@@ -71,6 +176,9 @@ class sonarCache:
             ignore_errors (bool): Whether to skip import errors and keep on going.
             temp (bool): Whether to set cache dir temporary or not.
             disable_progress (bool): Whether to disable progress display or not.
+            packed (bool): Whether to store sample records, sequences and variants in
+                append-only pack files (see sonarSamplePack) instead of one file
+                per sample or sequence.
         """
 
         if db is not None:
@@ -160,6 +268,16 @@ class sonarCache:
         os.makedirs(self.error_dir, exist_ok=True)
         os.makedirs(self.anno_dir, exist_ok=True)
 
+        # in packed mode _samplefiles and _samplefiles_to_profile hold sample names,
+        # seq_file and var_file of the sample dicts are names in seq_pack and var_pack
+        if packed:
+            self.sample_pack = sonarSamplePack(
+                os.path.join(self.sample_dir, "samples.pack")
+            )
+            self.seq_pack = sonarSamplePack(os.path.join(self.seq_dir, "seqs.pack"))
+            self.var_pack = sonarSamplePack(os.path.join(self.var_dir, "vars.pack"))
+        else:
+            self.sample_pack = self.seq_pack = self.var_pack = None
         self._samplefiles = set()
         self._samplefiles_to_profile = set()
         self._refs = set()
@@ -171,6 +289,9 @@ class sonarCache:
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
+        for pack in (self.sample_pack, self.seq_pack, self.var_pack):
+            if pack is not None:
+                pack.close()
         if os.path.isdir(self.basedir) and self.temp:
             shutil.rmtree(self.basedir)
         if self.logfile:
@@ -274,7 +395,6 @@ class sonarCache:
         translation_id,
         algnid,
         seqfile,
-        mafft_seqfile,
         vcffile,
         anno_vcf_file,
         anno_tsv_file,
@@ -303,7 +423,6 @@ class sonarCache:
             "header": header,
             "seqhash": seqhash,
             "seq_file": seqfile,
-            "mafft_seqfile": mafft_seqfile,
             "vcffile": vcffile,
             "anno_vcf_file": anno_vcf_file,
             "anno_tsv_file": anno_tsv_file,
@@ -315,26 +434,66 @@ class sonarCache:
             "cds_file": cdsfile,
             "properties": properties,
         }
-        fname = self.get_sample_fname(name)  # return fname with full path
+        if self.sample_pack is not None:
+            fname = name
+            self.sample_pack.append(name, data)
+        else:
+            fname = self.get_sample_fname(name)  # return fname with full path
 
-        self.log("Get:" + fname)
+            self.log("Get:" + fname)
 
-        try:
-            self.write_pickle(fname, data)
-        except OSError:
-            os.makedirs(os.path.dirname(fname), exist_ok=True)
-            self.write_pickle(fname, data)
+            try:
+                self.write_pickle(fname, data)
+            except OSError:
+                os.makedirs(os.path.dirname(fname), exist_ok=True)
+                self.write_pickle(fname, data)
         # Keeps Full path of each sample.
         self._samplefiles.add(fname)
-        if algnid is None:
+        # sequences profiled by a former run are not profiled again
+        if algnid is None and not (
+            self.var_pack is not None and varfile in self.var_pack.index
+        ):
             self._samplefiles_to_profile.add(fname)
         return fname
 
-    def iter_samples(self):
-        for fname in self._samplefiles:
-            yield self.read_pickle(fname)
+    def iter_samples(self, samplefiles=None):
+        """
+        :param samplefiles: sample files (sample names in packed mode) to read,
+            default: all samples cached by this object
+        """
+        if samplefiles is None:
+            samplefiles = self._samplefiles
+        if self.sample_pack is not None:
+            yield from self.sample_pack.iter_records(samplefiles)
+        else:
+            for fname in samplefiles:
+                yield self.read_pickle(fname)
+
+    def get_samples_to_profile(self):
+        """
+        :return: sample files for sonarAligner.process_cached_sample,
+            in packed mode a generator of the loaded sample dicts including their
+            "sequence", wrapped in 1-tuples (mpire would pass a dict as keyword arguments)
+        """
+        if self.sample_pack is not None:
+            return (
+                ({**sample, "sequence": self.seq_pack.read(sample["seq_file"])},)
+                for sample in self.iter_samples(self._samplefiles_to_profile)
+            )
+        return self._samplefiles_to_profile
 
     def cache_sequence(self, seqhash, sequence):
+        """
+        :return: the sequence file, in packed mode the name in the sequence pack
+        """
+        if self.seq_pack is not None:
+            if seqhash not in self.seq_pack.index:
+                self.seq_pack.append(seqhash, sequence)
+            elif self.seq_pack.read(seqhash) != sequence:
+                sys.exit(
+                    "seqhash collision: sequences differ for seqhash " + seqhash + "."
+                )
+            return seqhash
 
         fname = self.get_seq_fname(seqhash)
         if os.path.isfile(fname):
@@ -360,27 +519,6 @@ class sonarCache:
             self._refs.add(refid)
         return fname
 
-    def cache_seq_mafftinput(self, refid, ref_sequence, seqhash, qry_sequence):
-        """
-        This function create fasta file which contains
-        only ref and query seq. The file will be used for MAFFT input.
-        """
-        # Get fname (.seq)
-        fname = self.get_seq_fname(seqhash)
-        fname = fname + ".fasta"  # (.seq.fasta)
-
-        try:
-            os.makedirs(os.path.dirname(fname), exist_ok=True)
-            with open(fname, "w") as handle:
-                handle.write(">" + refid + "\n")
-                handle.write(ref_sequence + "\n")
-                handle.write(">" + seqhash + "\n")
-                handle.write(qry_sequence + "\n")
-        except OSError as e:
-            LOGGER.error(f"An error occurred: {e}")
-            sys.exit(1)
-        return fname
-
     def cache_translation_table(self, translation_id, dbm):
         """
         If the translation table
@@ -549,28 +687,154 @@ class sonarCache:
 
         """
         for fname in fnames:
-            with sonarBasics.open_file_autodetect(fname) as handle, tqdm(
-                desc="processing " + fname + "...",
-                total=os.path.getsize(fname),
-                unit="bytes",
-                unit_scale=True,
-                bar_format="{desc} {percentage:3.0f}% [{n_fmt}/{total_fmt}, {elapsed}<{remaining}, {rate_fmt}{postfix}]",
-                disable=self.disable_progress,
-            ) as pbar:
-                seq = []
-                header = None
-                for line in handle:
-                    pbar.update(len(line))
-                    line = line.strip()
-                    if line.startswith(">"):
-                        if seq:
-                            yield self.process_fasta_entry(header, "".join(seq))
-                            seq = []
-                        header = line[1:]
-                    else:
-                        seq.append(line)
+            for batch in self.iter_fasta_batches(fname):
+                yield from batch
+
+    def iter_fasta_batches(
+        self, fname: str, threads: int = 1
+    ) -> Iterator[List[Dict[str, Union[str, int]]]]:
+        """
+        Parse, harmonize and hash the records of a fasta file in chunks of about
+        FASTA_CHUNK_SIZE bytes, with threads > 1 the chunks are processed by a WorkerPool.
+        Plain files are split into byte ranges starting at record headers, which are read
+        by the workers. Records of compressed files (gz, xz, zip) are read in the main
+        process and handed over in batches.
+
+        Return:
+            Iterator over lists of dicts of process_fasta_entry, in file order.
+        """
+        plain = magic.from_file(fname, mime=True) in ("text/plain", "application/csv")
+        with tqdm(
+            desc="processing " + fname + "...",
+            total=os.path.getsize(fname),
+            unit="bytes",
+            unit_scale=True,
+            bar_format="{desc} {percentage:3.0f}% [{n_fmt}/{total_fmt}, {elapsed}<{remaining}, {rate_fmt}{postfix}]",
+            disable=self.disable_progress,
+        ) as pbar:
+            if plain:
+                ranges = list(self.iter_fasta_ranges(fname))
+                batches = self.imap_fasta_chunks(
+                    self.process_fasta_range,
+                    [(fname, start, end) for start, end in ranges],
+                    threads,
+                )
+                for (start, end), batch in zip(ranges, batches):
+                    pbar.update(end - start)
+                    yield batch
+            else:
+                yield from self.imap_fasta_chunks(
+                    self.process_fasta_records,
+                    self.iter_fasta_record_batches(fname, pbar),
+                    threads,
+                )
+
+    @staticmethod
+    def imap_fasta_chunks(func, chunks: Iterable[tuple], threads: int):
+        """
+        :param func: process_fasta_range or process_fasta_records
+        :param chunks: argument tuples of func
+        :return: results of func in order of chunks
+        """
+        if threads <= 1:
+            for chunk in chunks:
+                yield func(*chunk)
+        else:
+            with WorkerPool(n_jobs=threads, start_method="fork") as pool:
+                yield from pool.imap(func, chunks, chunk_size=1)
+
+    @staticmethod
+    def iter_fasta_records(lines: Iterable[str]) -> Iterator[Tuple[str, str]]:
+        """
+        :param lines: lines of a fasta file
+        :return: (header, sequence) of every record, the sequence is not harmonized yet
+        """
+        seq = []
+        header = None
+        for line in lines:
+            line = line.strip()
+            if line.startswith(">"):
                 if seq:
-                    yield self.process_fasta_entry(header, "".join(seq))
+                    yield header, "".join(seq)
+                    seq = []
+                header = line[1:]
+            else:
+                seq.append(line)
+        if seq:
+            yield header, "".join(seq)
+
+    @staticmethod
+    def iter_fasta_ranges(
+        fname: str, chunk_size: int = FASTA_CHUNK_SIZE
+    ) -> Iterator[Tuple[int, int]]:
+        """
+        Split a plain fasta file into byte ranges of about chunk_size bytes,
+        every range but the first one starts at a header line.
+
+        Return:
+            Iterator over (start, end) byte offsets.
+        """
+        size = os.path.getsize(fname)
+        with open(fname, "rb") as handle:
+            start = 0
+            while start < size:
+                end = size
+                if start + chunk_size < size:
+                    handle.seek(start + chunk_size)
+                    # skip the (partial) line and search for the next header
+                    handle.readline()
+                    while True:
+                        pos = handle.tell()
+                        line = handle.readline()
+                        if not line or line.startswith(b">"):
+                            end = pos if line else size
+                            break
+                yield start, end
+                start = end
+
+    def process_fasta_range(
+        self, fname: str, start: int, end: int
+    ) -> List[Dict[str, Union[str, int]]]:
+        with open(fname, "rb") as handle:
+            handle.seek(start)
+            lines = handle.read(end - start).decode("utf-8").split("\n")
+        return [
+            self.process_fasta_entry(header, seq)
+            for header, seq in self.iter_fasta_records(lines)
+        ]
+
+    def process_fasta_records(
+        self, records: List[Tuple[str, str]]
+    ) -> List[Dict[str, Union[str, int]]]:
+        return [self.process_fasta_entry(header, seq) for header, seq in records]
+
+    def iter_fasta_record_batches(
+        self, fname: str, pbar: tqdm, chunk_size: int = FASTA_CHUNK_SIZE
+    ) -> Iterator[Tuple[List[Tuple[str, str]]]]:
+        """
+        Read the records of a (compressed) fasta file in batches of about chunk_size characters.
+
+        Return:
+            Iterator over 1-tuples of lists of (header, sequence), arguments of process_fasta_records.
+        """
+
+        def iter_lines(handle):
+            for line in handle:
+                pbar.update(len(line))
+                yield line
+
+        with sonarBasics.open_file_autodetect(fname) as handle:
+            batch = []
+            batch_size = 0
+            for header, seq in self.iter_fasta_records(iter_lines(handle)):
+                batch.append((header, seq))
+                batch_size += len(seq)
+                if batch_size >= chunk_size:
+                    yield (batch,)
+                    batch = []
+                    batch_size = 0
+            if batch:
+                yield (batch,)
 
     def get_refmol(self, fasta_header):
         """
@@ -661,61 +925,81 @@ class sonarCache:
     def get_properties(self, fasta_header):
         return {x.group(1): x.group(2) for x in self._propregex.finditer(fasta_header)}
 
-    def add_fasta(self, *fnames, properties=defaultdict(dict), method=1):  # noqa: C901
+    def add_fasta(self, *fnames, properties=defaultdict(dict), threads=1):  # noqa: C901
         """
         Prepare/Create dict and then write  it ".sample" file (pickle file) to cache directory
         the dict contains all information (e.g., name, algnid, refmol, varfile )
+        fasta records are parsed and hashed by `threads` processes, see iter_fasta_batches
         """
         default_properties = {
             x: self.properties[x]["standard"] for x in self.properties
         }
         failed_list = []
+        source_elements = {}
         with sonarDBManager(self.db, debug=self.debug) as dbm:
             for fname in fnames:
-                for data in self.iter_fasta(fname):
-
-                    # EDIT: we currently lock the filtering part.
-                    # check sequence lenght
-                    # if not check_seq_compact(
-                    #    self.get_refseq(data["refmol"]), data["sequence"]
-                    # ):
-                    #    failed_list.append((data["name"], len(data["sequence"])))
-                    # log fail samples
-                    #    continue
-
-                    # check sample
-                    data["sampleid"], seqhash = dbm.get_sample_data(data["name"])
-                    source_element = dbm.get_source(data["refmolid"])
-                    data["sourceid"] = source_element["id"]
-                    data["source_acc"] = source_element["accession"]
-                    # check properties
-                    if data["sampleid"] is None:
-                        props = default_properties.copy()
-                        props.update(data["properties"])
-                        props.update(properties[data["sampleid"]])
-                        data["properties"] = props
-                    elif not self.allow_updates:
-                        continue
-                    else:
-                        data["properties"].update(properties[data["sampleid"]])
-
-                    # Check Reference
-                    # print("refmol", data)
-
-                    # refseq_id = self.get_refseq_id(data["refmol"])  # this line is from old covsonar
-                    # Note Change: IN MPXsonar, we use reference accession (e.g., NC_063383.1)
-                    # instead of using ID (e.g., 1) to avoid confusion or altering references across the database.
-                    refseq_id = data["refmol"]
-
-                    self.write_checkref_log(data, refseq_id)
-
-                    # Check Alignment
-                    data["algnid"] = dbm.get_alignment_id(data["seqhash"], refseq_id)
-                    # Write tmp/cache file (e.g., .seq, .ref)
-                    data = self.assign_data(data, seqhash, refseq_id, dbm, method)
-
-                    del data["sequence"]
-                    self.cache_sample(**data)
+                for batch in self.iter_fasta_batches(fname, threads):
+                    # existence checks of the whole batch with one query each
+                    sample_data = dbm.get_sample_data_many(
+                        [data["name"] for data in batch]
+                    )
+                    alignment_ids = {
+                        refmol: dbm.get_alignment_ids(
+                            [x["seqhash"] for x in batch if x["refmol"] == refmol],
+                            refmol,
+                        )
+                        for refmol in {data["refmol"] for data in batch}
+                    }
+                    for data in batch:
+                        if data["refmolid"] not in source_elements:
+                            source_elements[data["refmolid"]] = dbm.get_source(
+                                data["refmolid"]
+                            )
+
+                        # EDIT: we currently lock the filtering part.
+                        # check sequence lenght
+                        # if not check_seq_compact(
+                        #    self.get_refseq(data["refmol"]), data["sequence"]
+                        # ):
+                        #    failed_list.append((data["name"], len(data["sequence"])))
+                        # log fail samples
+                        #    continue
+
+                        # check sample
+                        data["sampleid"], seqhash = sample_data.get(
+                            data["name"], (None, None)
+                        )
+                        source_element = source_elements[data["refmolid"]]
+                        data["sourceid"] = source_element["id"]
+                        data["source_acc"] = source_element["accession"]
+                        # check properties
+                        if data["sampleid"] is None:
+                            props = default_properties.copy()
+                            props.update(data["properties"])
+                            props.update(properties[data["sampleid"]])
+                            data["properties"] = props
+                        elif not self.allow_updates:
+                            continue
+                        else:
+                            data["properties"].update(properties[data["sampleid"]])
+
+                        # Check Reference
+                        # print("refmol", data)
+
+                        # refseq_id = self.get_refseq_id(data["refmol"])  # this line is from old covsonar
+                        # Note Change: IN MPXsonar, we use reference accession (e.g., NC_063383.1)
+                        # instead of using ID (e.g., 1) to avoid confusion or altering references across the database.
+                        refseq_id = data["refmol"]
+
+                        self.write_checkref_log(data, refseq_id)
+
+                        # Check Alignment
+                        data["algnid"] = alignment_ids[refseq_id].get(data["seqhash"])
+                        # Write tmp/cache file (e.g., .seq, .ref)
+                        data = self.assign_data(data, seqhash, refseq_id, dbm)
+
+                        del data["sequence"]
+                        self.cache_sample(**data)
         if failed_list:
             self.log(
                 "Sample will not be processed due to violate max/min seq lenght rule (+-3%):"
@@ -745,7 +1029,7 @@ class sonarCache:
                     + ")"
                 )
 
-    def assign_data(self, data, seqhash, refseq_id, dbm, method):
+    def assign_data(self, data, seqhash, refseq_id, dbm):
         """This function linked to the add_fasta
 
         Create dict to store all related output file.
@@ -758,15 +1042,6 @@ class sonarCache:
         """
         if data["algnid"] is None:
             data["seqfile"] = self.cache_sequence(data["seqhash"], data["sequence"])
-            if method == 1:
-                data["mafft_seqfile"] = self.cache_seq_mafftinput(
-                    refseq_id,
-                    self.get_refseq(data["refmol"]),
-                    data["seqhash"],
-                    data["sequence"],
-                )
-            else:
-                data["mafft_seqfile"] = None
             # TODO: get ref accession number and put into cache_lift
             # to recreate cache directory *(optional task)
             data["reffile"] = self.cache_reference(
@@ -781,8 +1056,9 @@ class sonarCache:
             data["algnfile"] = self.get_algn_fname(
                 data["seqhash"] + "@" + self.get_refhash(data["refmol"])
             )
-            data["varfile"] = self.get_var_fname(
-                data["seqhash"] + "@" + self.get_refhash(data["refmol"])
+            var_key = data["seqhash"] + "@" + self.get_refhash(data["refmol"])
+            data["varfile"] = (
+                self.get_var_fname(var_key) if self.var_pack is None else var_key
             )
 
             data["vcffile"] = self.get_vcf_fname(refseq_id + "@" + data["name"])
@@ -797,15 +1073,6 @@ class sonarCache:
             # In case, sample is reupload under the same name but changes in fasta
             if data["seqhash"] != seqhash:
                 data["seqfile"] = self.cache_sequence(data["seqhash"], data["sequence"])
-                if method == 1:
-                    data["mafft_seqfile"] = self.cache_seq_mafftinput(
-                        refseq_id,
-                        self.get_refseq(data["refmol"]),
-                        data["seqhash"],
-                        data["sequence"],
-                    )
-                else:
-                    data["mafft_seqfile"] = None
 
                 data["vcffile"] = self.get_vcf_fname(refseq_id + "@" + data["name"])
                 data["anno_vcf_file"] = self.get_anno_vcf_fname(
@@ -817,7 +1084,6 @@ class sonarCache:
             else:  # if no changed in sequence. use the existing cache.
                 data["seqhash"] = None
                 data["seqfile"] = None
-                data["mafft_seqfile"] = None
                 data["vcffile"] = None
                 data["anno_vcf_file"] = None
                 data["anno_tsv_file"] = None
@@ -831,105 +1097,310 @@ class sonarCache:
 
         return data
 
-    def import_cached_sample(self, **sample_data: Dict[str, Any]) -> None:  # noqa: C901
-        list_fail_samples = []
-        anno_samples_list = []
-        refseqs = {}
-        count_sample = 0
-
-        try:
-            with sonarDBManager(self.db, readonly=False, debug=self.debug) as dbm:
-                # Attempt the database operations
-                # nucleotide level import
-                var_row_list = []
-                if not sample_data["seqhash"] is None:
-                    dbm.insert_sample(sample_data["name"], sample_data["seqhash"])
-                    algnid = dbm.insert_alignment(
-                        sample_data["seqhash"], sample_data["sourceid"]
-                    )
+    def init_import_worker(self, worker_state, batch_size=IMPORT_BATCH_SIZE):
+        """
+        mpire worker_init of import_cached_samples_v2:
+        every worker keeps one database connection and transaction for its lifetime.
+        """
+        worker_state["dbm"] = sonarDBManager(
+            self.db, readonly=False, debug=self.debug
+        ).__enter__()
+        worker_state["batch_size"] = batch_size
+        worker_state["uncommitted"] = 0
+        # substitution contexts of the uncommitted samples, see commit_import_batch
+        worker_state["snp_contexts"] = Counter()
 
-                if not sample_data["var_file"] is None:
+    @staticmethod
+    def commit_import_batch(worker_state):
+        """
+        Add the substitution contexts of the batch to the snp_context table and commit,
+        the counters are only locked for the commit instead of the whole batch.
+        """
+        dbm = worker_state["dbm"]
+        dbm.update_snp_contexts(worker_state["snp_contexts"])
+        dbm.commit()
+        worker_state["snp_contexts"] = Counter()
+        worker_state["uncommitted"] = 0
 
-                    elements_dict = dict()
-                    # get element dict
-                    elements_rows = dbm.get_elements(
-                        molecule_id=sample_data["refmolid"]
-                    )
-                    # get only neccessary column and add to another dict.
-                    for row in elements_rows:
-                        elements_dict[row["accession"]] = row["id"]
-                    # print(elements_dict)
-                    with open(sample_data["var_file"], "r") as handle:
-                        for line in handle:
-                            if line == "//":
-                                break
-                            vardat = line.strip("\r\n").split("\t")
-                            var_row_list.append(
-                                (
-                                    elements_dict[vardat[4]],  # element id
-                                    vardat[0],  # ref
-                                    vardat[3],  # alt
-                                    vardat[1],  # start
-                                    vardat[2],  # end
-                                    vardat[5],  # label
-                                    vardat[6],
-                                )  # frameshift
-                            )
-                        if line != "//":
-                            sys.exit(
-                                "cache error: corrupted file ("
-                                + sample_data["var_file"]
-                                + ")"
-                            )
-                # NOTE: we
+    @staticmethod
+    def exit_import_worker(worker_state):
+        """
+        mpire worker_exit of import_cached_samples_v2: commit the last batch and disconnect.
+        """
+        worker_state["dbm"].update_snp_contexts(worker_state["snp_contexts"])
+        worker_state["dbm"].__exit__(None, None, None)
 
-                if len(var_row_list) > 0:
-                    dbm.insert_variant_many(var_row_list, algnid)
-                else:
-                    LOGGER.info(
-                        f"No mutations detected in {sample_data['name']} sample associated with the reference."
-                    )
+    def import_cached_sample(  # noqa: C901
+        self, worker_state, **sample_data: Dict[str, Any]
+    ) -> bool:
+        """
+        Import a cached sample within a savepoint of the worker's transaction,
+        the transaction is committed every worker_state["batch_size"] samples.
 
-                if not sample_data["seqhash"] is None:
-                    # paranoia test
-                    paranoid_dict = self.paranoid_check(refseqs, sample_data, dbm)
-                    if paranoid_dict:
-                        list_fail_samples.append(paranoid_dict)
+        Return:
+            True if the sample was imported, False if it failed (changes are rolled back).
+        """
+        dbm = worker_state["dbm"]
+        dbm.savepoint()
+        try:
+            # Attempt the database operations
+            # nucleotide level import
+            var_row_list = []
+            if not sample_data["seqhash"] is None:
+                dbm.insert_sample(sample_data["name"], sample_data["seqhash"])
+                algnid = dbm.insert_alignment(
+                    sample_data["seqhash"], sample_data["sourceid"]
+                )
 
-                count_sample = count_sample + 1
+            if not sample_data["var_file"] is None:
+                var_row_list = self.read_variants(
+                    sample_data["var_file"],
+                    self.get_elements_dict(dbm, sample_data["refmolid"]),
+                )
 
-                # "If Dict is Empty", Proceed to Annotation step.
-                if not paranoid_dict:
-                    anno_samples_list.append(sample_data)
+            if len(var_row_list) > 0:
+                dbm.insert_variant_many(var_row_list, algnid)
+            else:
+                LOGGER.info(
+                    f"No mutations detected in {sample_data['name']} sample associated with the reference."
+                )
+            # new samples add the substitutions of their (maybe already aligned) sequence
+            snp_contexts = (
+                dbm.get_snp_contexts("sample.name = ?", [sample_data["name"]])
+                if sample_data["seqhash"] is not None
+                and sample_data.get("sampleid") is None
+                else {}
+            )
+            dbm.release_savepoint()
 
         except Exception as e:
-            LOGGER.error("\n------- Fatal Error ---------")
+            LOGGER.error("\n------- Import Error ---------")
             print(traceback.format_exc())
             print("\nDebugging Information:")
             print(e)
-            traceback.print_exc()
             print("\n During insert:")
             pp.pprint(sample_data)
-            sys.exit("Unknown import error")
+            dbm.rollback_to_savepoint()
+            return False
+
+        worker_state["snp_contexts"].update(snp_contexts)
+        worker_state["uncommitted"] += 1
+        if worker_state["uncommitted"] >= worker_state["batch_size"]:
+            self.commit_import_batch(worker_state)
+            dbm.start_transaction()
+        return True
+
+    def import_cached_sample_group(
+        self, worker_state, samples: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Import samples sharing the same sequence (see group_samples_by_sequence)
+        with the worker's connection.
 
-        # time.sleep(random.uniform(0.5, 0.8))
+        Return:
+            The sample data of the imported samples.
+        """
+        return [
+            sample_data
+            for sample_data in samples
+            if self.import_cached_sample(worker_state, **sample_data)
+        ]
+
+    @staticmethod
+    def get_elements_dict(dbm: sonarDBManager, molecule_id: int) -> Dict[str, int]:
+        """
+        Return:
+            The element ids of a molecule by element accession.
+        """
+        return {row["accession"]: row["id"] for row in dbm.get_elements(molecule_id)}
 
-    def import_cached_samples_v2(self, threads, auto_anno=False) -> None:  # noqa: C901
+    @staticmethod
+    def read_var_file(var_file: str, elements_dict: Dict[str, int]) -> List[Tuple]:
+        """
+        Read the variants of a cached sequence as rows of sonarDBManager.insert_variants.
+
+        Args:
+            var_file (str): The var file written by sonarAligner.
+            elements_dict (dict): The element ids by accession, see get_elements_dict.
+        """
+        var_row_list = []
+        with open(var_file, "r") as handle:
+            for line in handle:
+                if line == "//":
+                    break
+                vardat = line.strip("\r\n").split("\t")
+                var_row_list.append(
+                    (
+                        elements_dict[vardat[4]],  # element id
+                        vardat[0],  # ref
+                        vardat[3],  # alt
+                        vardat[1],  # start
+                        vardat[2],  # end
+                        vardat[5],  # label
+                        vardat[6],
+                    )  # frameshift
+                )
+            if line != "//":
+                sys.exit("cache error: corrupted file (" + var_file + ")")
+        return var_row_list
+
+    def cache_variants(self, var_file: str, variants: List[Tuple]) -> None:
+        """
+        Append the variants of a sequence profiled for the packed cache to the variant
+        pack as columns, positions as int32 arrays.
+
+        Args:
+            var_file (str): The var_file of the sample, the name in the variant pack.
+            variants (list): The variants in the order of the columns of a var file,
+                see sonarAligner.process_cached_sample.
+        """
+        columns = list(zip(*variants)) or [()] * len(VAR_COLUMNS)
+        self.var_pack.append(
+            var_file,
+            {
+                column: np.array(values, dtype=np.int32)
+                if column in ("start", "end")
+                else list(values)
+                for column, values in zip(VAR_COLUMNS, columns)
+            },
+        )
+
+    def read_variants(
+        self, var_file: str, elements_dict: Dict[str, int]
+    ) -> List[Tuple]:
+        """
+        Read the variants of a cached sequence from its var file or, in packed mode,
+        from the variant pack, see read_var_file.
+        """
+        if self.var_pack is None:
+            return self.read_var_file(var_file, elements_dict)
+        columns = self.var_pack.read(var_file)
+        return list(
+            zip(
+                [elements_dict[accession] for accession in columns["element"]],
+                columns["ref"],
+                columns["alt"],
+                columns["start"].tolist(),
+                columns["end"].tolist(),
+                columns["label"],
+                columns["frameshift"],
+            )
+        )
+
+    def insert_cached_variants(self, samples_list: List[Dict[str, Any]]) -> None:
+        """
+        Insert the variants of all cached samples with one connection before the import
+        workers start. The variant table has no unique key, workers inserting a new
+        variant of their samples in parallel would store it twice; instead they only
+        look up the ids of these committed variants.
+        """
+        var_files = {
+            (sample_data["var_file"], sample_data["refmolid"])
+            for sample_data in samples_list
+            if sample_data["var_file"] is not None
+        }
+        with sonarDBManager(self.db, readonly=False, debug=self.debug) as dbm:
+            elements_dicts = {}
+            for var_file, refmolid in tqdm(
+                sorted(var_files),
+                desc="inserting variants...",
+                unit="seqs",
+                disable=self.disable_progress,
+            ):
+                if refmolid not in elements_dicts:
+                    elements_dicts[refmolid] = self.get_elements_dict(dbm, refmolid)
+                var_row_list = self.read_variants(var_file, elements_dicts[refmolid])
+                if var_row_list:
+                    dbm.insert_variants(var_row_list)
+
+    @staticmethod
+    def group_samples_by_sequence(
+        samples_list: List[Dict[str, Any]]
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Samples with the same sequence share their sequence, alignment and
+        alignment2variant rows, they are imported by the same worker.
+        """
+        groups = defaultdict(list)
+        for sample_data in samples_list:
+            # samples with unchanged sequences only update the sample
+            key = sample_data["seqhash"] or ("sample", sample_data["name"])
+            groups[key].append(sample_data)
+        return list(groups.values())
+
+    def import_cached_samples_v2(
+        self, threads, auto_anno=False, batch_size=IMPORT_BATCH_SIZE
+    ) -> None:
+        """
+        Import cached samples with `threads` workers, every worker commits its samples
+        in transactions of batch_size samples.
+        Rows shared between samples are never inserted by two workers:
+        new variants are inserted before (insert_cached_variants) and
+        samples with the same sequence are imported by the same worker.
+        The substitution contexts of new samples are added to the snp_context table
+        with every commit (see commit_import_batch).
+        """
         samples_list = list(self.iter_samples())
+        self.insert_cached_variants(samples_list)
+        sample_groups = self.group_samples_by_sequence(samples_list)
+        anno_samples_list = []
+        count_sample = 0
 
-        with WorkerPool(n_jobs=threads, start_method="fork") as pool, tqdm(
+        with WorkerPool(
+            n_jobs=threads, start_method="fork", use_worker_state=True
+        ) as pool, tqdm(
             position=0,
             leave=True,
             desc="importing samples...",
-            total=len(samples_list),
+            total=len(sample_groups),
             unit="seqs",
             bar_format="{desc} {percentage:3.0f}% [{n_fmt}/{total_fmt}, {elapsed}<{remaining}, {rate_fmt}{postfix}]",
+            disable=self.disable_progress,
+        ) as pbar:
+            for imported_samples in pool.imap_unordered(
+                self.import_cached_sample_group,
+                [(samples,) for samples in sample_groups],
+                worker_init=partial(self.init_import_worker, batch_size=batch_size),
+                worker_exit=self.exit_import_worker,
+            ):
+                count_sample += len(imported_samples)
+                anno_samples_list.extend(
+                    sample_data
+                    for sample_data in imported_samples
+                    if not sample_data["seqhash"] is None
+                )
+                pbar.update(1)
+
+        if auto_anno:
+            self.annotate_samples(anno_samples_list, threads)
+
+        LOGGER.info("Total inserted: " + str(count_sample))
+
+    def annotate_samples(self, anno_samples_list, threads) -> None:
+        """
+        Annotate imported samples with `threads` workers, see annotate_sample.
+        """
+        # paired_anno_samples_list = [ {'db_path': self.db, 'sample_data': sample} for sample in anno_samples_list]
+        paired_anno_samples_list = list(
+            (self.db, sample) for sample in anno_samples_list
+        )
+        with WorkerPool(n_jobs=threads, start_method="fork") as pool, tqdm(
+            position=0,
+            leave=True,
+            desc="annotate samples...",
+            total=len(paired_anno_samples_list),
+            unit="samples",
+            bar_format="{desc} {percentage:3.0f}% [{n_fmt}/{total_fmt}, {elapsed}<{remaining}, {rate_fmt}{postfix}]",
+            disable=self.disable_progress,
         ) as pbar:
             for _ in pool.imap_unordered(
-                self.import_cached_sample, list(self.iter_samples())
+                self.annotate_sample, paired_anno_samples_list
             ):
                 pbar.update(1)
 
+        # TODO: 1. seperate the annotation function (Decoupling) to outside of this function.
+        # 2.check if seqhash same or not ----
+
     def annotate_sample(self, db_path, sample_data):
         # db_path, sample_data = args
         export_vcf_SonarCMD(
@@ -952,15 +1423,23 @@ class sonarCache:
             get_filename_sonarhash(sample_data["vcffile"]),
             sample_data["anno_tsv_file"],
         )
+        if self.sample_pack is not None:
+            # the packed cache keeps no per-sample files, annotation files are temporary
+            for fname in (
+                sample_data["vcffile"],
+                get_filename_sonarhash(sample_data["vcffile"]),
+                sample_data["anno_vcf_file"],
+                sample_data["anno_tsv_file"],
+            ):
+                if os.path.isfile(fname):
+                    os.remove(fname)
 
     def import_cached_samples(self, threads, auto_anno) -> None:  # noqa: C901
         """
         NOTE: Performance is so slow.
         can we change/edit this process into parallel stlye
         """
-        list_fail_samples = []
         anno_samples_list = []
-        refseqs = {}
         count_sample = 0
         with sonarDBManager(self.db, readonly=False, debug=self.debug) as dbm:
             for sample_data in tqdm(
@@ -1027,18 +1506,10 @@ class sonarCache:
                                     f"No mutations detected in {sample_data['name']} sample associated with the reference."
                                 )
 
+                    # samples failing the paranoid test of the aligner are not imported
                     if not sample_data["seqhash"] is None:
-                        # paranoia test
-                        paranoid_dict = self.paranoid_check(refseqs, sample_data, dbm)
-                        if paranoid_dict:
-                            list_fail_samples.append(paranoid_dict)
-
                         count_sample = count_sample + 1
-
-                        # "If Dict is Empty", Proceed to Annotation step.
-
-                        if not paranoid_dict:
-                            anno_samples_list.append(sample_data)
+                        anno_samples_list.append(sample_data)
 
                 except Exception as e:
                     LOGGER.error("\n------- Fatal Error ---------")
@@ -1051,34 +1522,10 @@ class sonarCache:
                     sys.exit("Unknown import error")
 
         if auto_anno:
-            # paired_anno_samples_list = [ {'db_path': self.db, 'sample_data': sample} for sample in anno_samples_list]
-            paired_anno_samples_list = list(
-                (self.db, sample) for sample in anno_samples_list
-            )
-            with WorkerPool(n_jobs=threads, start_method="fork") as pool, tqdm(
-                position=0,
-                leave=True,
-                desc="annotate samples...",
-                total=len(paired_anno_samples_list),
-                unit="samples",
-                bar_format="{desc} {percentage:3.0f}% [{n_fmt}/{total_fmt}, {elapsed}<{remaining}, {rate_fmt}{postfix}]",
-                disable=self.disable_progress,
-            ) as pbar:
-                for _ in pool.imap_unordered(
-                    self.annotate_sample, paired_anno_samples_list
-                ):
-                    pbar.update(1)
-
-            # TODO: 1. seperate the annotation function (Decoupling) to outside of this function.
-            # 2.check if seqhash same or not ----
+            self.annotate_samples(anno_samples_list, threads)
 
         # LOGGER.warn("Sonar will delete a sample with empty alignment.")
         LOGGER.info("Error logs are kept under the given cache directory.")
-        if list_fail_samples:
-            LOGGER.info(f"Start paranoid alignment on {len(list_fail_samples)} sample.")
-            # start process.
-            # self.paranoid_align_multi(list_fail_samples, threads)
-        count_sample = count_sample - len(list_fail_samples)
         LOGGER.info("Total inserted: " + str(count_sample))
 
     def _align(self, output_paranoid, qryfile, reffile, sample_name):
@@ -1119,105 +1566,28 @@ class sonarCache:
             for _ in pool.imap_unordered(self._align, list_fail_samples):
                 pbar.update(1)
 
-    def paranoid_check(self, refseqs, sample_data, dbm):  # noqa: C901
+    def discard_samples(self, sample_names):
         """
-        This is the current version of paranoid test.
-        It is linked to import_cached_samples
-
-        Return:
-            dict.
+        Exclude samples from the import, e.g. samples failing the paranoid test of the aligner.
         """
-        try:
-            seq = list(refseqs[sample_data["sourceid"]])
-        except Exception:
-            refseqs[sample_data["sourceid"]] = list(
-                dbm.get_sequence(sample_data["sourceid"])
+        for sample_name in sample_names:
+            key = (
+                sample_name
+                if self.sample_pack is not None
+                else self.get_sample_fname(sample_name)
             )
-            seq = list(refseqs[sample_data["sourceid"]])
-        prefix = ""
-        gaps = {".", " "}
-        sample_name = sample_data["name"]
-        iter_dna_list = list(
-            dbm.iter_dna_variants(sample_name, sample_data["sourceid"])
-        )
-        for vardata in iter_dna_list:
-            if vardata["variant.alt"] in gaps:
-                for i in range(vardata["variant.start"], vardata["variant.end"]):
-                    seq[i] = ""
-            elif vardata["variant.alt"] == ".":
-                for i in range(vardata["variant.start"], vardata["variant.end"]):
-                    seq[i] = ""
-            elif vardata["variant.start"] >= 0:
-                seq[vardata["variant.start"]] = vardata["variant.alt"]
-            else:
-                prefix = vardata["variant.alt"]
-
-        ref_name = sample_data["refmol"]
-        # seq is now a restored version from variant dict.
-        seq = prefix + "".join(seq)
-        with open(sample_data["seq_file"], "r") as handle:
-            orig_seq = handle.read()
-
-        if seq != orig_seq:
-            self.log("[Paranoid-test] Fail sample:" + sample_name)
-            logging.warn(
-                f"Failure in sanity check: This {sample_name} sample will not be inserted to the database."
-            )
-            if not os.path.exists(self.error_dir):
-                os.makedirs(self.error_dir)
-            with open(
-                os.path.join(self.error_dir, f"{sample_name}.error.var"), "w+"
-            ) as handle:
-                for vardata in iter_dna_list:
-                    handle.write(str(vardata) + "\n")
-
-            qryfile = os.path.join(
-                self.error_dir, sample_name + ".error.restored_sam.fa"
-            )
-            reffile = os.path.join(
-                self.error_dir, sample_name + ".error.original_sam.fa"
-            )
-
-            with open(qryfile, "w+") as handle:
-                handle.write(seq)
-            with open(reffile, "w+") as handle:
-                handle.write(orig_seq)
-            output_paranoid = os.path.join(
-                self.basedir, f"{sample_name}.withref.{ref_name}.fail-paranoid.fna"
-            )
-
-            dbm.delete_alignment(
-                seqhash=sample_data["seqhash"], element_id=sample_data["sourceid"]
-            )
-            # delete sample  if this sample didnt have any alignment and variant??.
-            _return_ali_id = dbm.get_alignment_by_seqhash(
-                seqhash=sample_data["seqhash"]
-            )
-            if len(_return_ali_id) == 0:
-                dbm.delete_samples(sample_name)
-                dbm.delete_seqhash(sample_data["seqhash"])
-
-            return {
-                "sample_name": sample_name,
-                "qryfile": qryfile,
-                "reffile": reffile,
-                "output_paranoid": output_paranoid,
-            }
-        else:
-            return {}
+            self._samplefiles.discard(key)
+            self._samplefiles_to_profile.discard(key)
 
     def clear_uncessary_cache(self, samplefiles):
-        for fname in samplefiles:
-            with open(fname, "rb") as handle:
-                data = pickle.load(handle, encoding="bytes")
-                # clear uncessary file
-                try:
-                    os.remove(data["mafft_seqfile"])
-                    os.remove(data["vcffile"])
-                    os.remove(data["anno_vcf_file"])
+        for data in self.iter_samples(samplefiles):
+            # clear uncessary file
+            try:
+                os.remove(data["vcffile"])
+                os.remove(data["anno_vcf_file"])
 
-                except OSError:
-                    pass
+            except OSError:
+                pass
 
 
 if __name__ == "__main__":
@@ -164,6 +164,9 @@ class sonarDBManager:
         self.__source_ref_dict = {}
         self.__references = {}
         self.__default_reference = None
+        # (element_id, ref, alt, start, end) -> variant id, see cache_variant_ids
+        self.__variant_ids = {}
+        self.__variant_id_elements = set()
         self.__uri = self.get_uri(self.db_url)
         self.db_user = self.__uri.username
         self.db_pass = self.__uri.password
@@ -237,6 +240,24 @@ class sonarDBManager:
     def rollback(self):
         """roll back"""
         self.con.rollback()
+        # cached ids of rolled back variants are invalid
+        self.__variant_ids = {}
+        self.__variant_id_elements = set()
+
+    def savepoint(self, name: str = "sample"):
+        """set a savepoint within the current transaction"""
+        self.cursor.execute(f"SAVEPOINT {name};")
+
+    def release_savepoint(self, name: str = "sample"):
+        """release a savepoint, its changes stay part of the current transaction"""
+        self.cursor.execute(f"RELEASE SAVEPOINT {name};")
+
+    def rollback_to_savepoint(self, name: str = "sample"):
+        """roll back the changes since a savepoint, the transaction stays open"""
+        self.cursor.execute(f"ROLLBACK TO SAVEPOINT {name};")
+        # cached ids of rolled back variants are invalid
+        self.__variant_ids = {}
+        self.__variant_id_elements = set()
 
     def close(self):
         """close database connection"""
@@ -839,11 +860,28 @@ class sonarDBManager:
             value = datetime.date.today()
             self.insert_property(sid, "IMPORTED", value)
         else:
-            pass
-            # print("PASS")
+            # sequence of an existing sample imported again
+            self.mark_modified(sid)
 
         return sid
 
+    def mark_modified(self, sample_id: int) -> None:
+        """
+        Sets the MODIFIED property of a sample to today.
+        Samples are marked when their data changes after the first import,
+        MPXRadar selects them by MODIFIED to update its cache incrementally.
+
+        Args:
+            sample_id (int): The ID of the changed sample.
+
+        Example usage:
+            >>> dbm = getfixture('init_writeable_dbm')
+            >>> dbm.mark_modified(1)
+        """
+        # databases set up without the reserved properties cannot mark samples
+        if "MODIFIED" in self.properties:
+            self.insert_property(sample_id, "MODIFIED", datetime.date.today())
+
     def insert_alignment(self, seqhash, element_id):
         """
         Inserts a sequence-alignment relation into the database if not existing and returns the row id.
@@ -1014,6 +1052,26 @@ class sonarDBManager:
         """
         Improved Version of insert variant
         instead of one by one, we use executemany to improve insertion time.
+        Variants not in the DB yet are inserted (see insert_variants),
+        all variants are linked to the alignment.
+
+        Args:
+            row_list (list): Variants of the alignment, see insert_variants.
+            alignment_id (int): The id of the alignment.
+        """
+        # STILL keep all variants for next step alignment2variant
+        updated_alignment2variant_list = [
+            (alignment_id, variant_id)
+            for variant_id in dict.fromkeys(self.insert_variants(row_list))
+        ]
+        sql = "INSERT IGNORE INTO alignment2variant (alignment_id, variant_id) VALUES(?, ?);"
+        self.cursor.executemany(sql, updated_alignment2variant_list)
+
+    def insert_variants(self, row_list) -> List[int]:
+        """
+        Inserts variants not in the DB yet and returns the ids of all given variants.
+        Variant ids are looked up in a dictionary of known variants (see cache_variant_ids),
+        only variants not in the DB yet are inserted and queried afterwards.
 
         row_list = [(
         element_id, 0
@@ -1025,20 +1083,26 @@ class sonarDBManager:
         frameshift, 6
         )]
 
-        updated_var_row_list = [(id 0, element_id 1, pre_ref 2, start 3, end 4, ref 5, alt 6,
+        insert_var_row_list = [(id 0, element_id 1, pre_ref 2, ref 3, alt 4, start 5, end 6,
         label 7, parent_id 8, frameshift 9)]
+
+        Returns:
+            List[int]: The variant ids in the order of row_list.
         """
-        updated_var_row_list = []
-        insert_var_row_list = []
         parent_id = ""
         ref_dict = self.sequence_references
+        self.cache_variant_ids({int(row[0]) for row in row_list})
 
+        variant_keys = []
+        insert_var_rows = {}
         for row in row_list:
-
+            key = (int(row[0]), row[1], row[2], int(row[3]), int(row[4]))
+            variant_keys.append(key)
+            # Deduplicate variants...
+            # if it exists, we will not insert......
+            if key in self.__variant_ids or key in insert_var_rows:
+                continue
             try:
-                # Convert the old tuple to a list to modify it
-                updated_list = list(row)
-
                 selected_ref_seq = ref_dict[int(row[0])]
                 if int(row[3]) <= 0:
                     pre_ref = ""
@@ -1049,61 +1113,113 @@ class sonarDBManager:
                 # KeyError for a case of Amino Acid, we don't stroe these information at this moment.
                 # logging.warn(e)
                 pre_ref = ""
-
-            # Insert None (*ID) at position 0
-            updated_list.insert(0, None)
-            # Insert pre_ref at position 2
-            updated_list.insert(2, pre_ref)
-            updated_list.insert(8, parent_id)
-
-            # Deduplicate variants...
-            # Check varaint if exist
-            vid = self.get_variant_id(
-                updated_list[1],
-                int(updated_list[5]),
-                int(updated_list[6]),
-                updated_list[3],
-                updated_list[4],
+            insert_var_rows[key] = (
+                (None, row[0], pre_ref)
+                + tuple(row[1:6])
+                + (
+                    parent_id,
+                    row[6],
+                )
             )
 
-            # STILL keep all variants for next step alignment2variant
-            updated_var_row_list.append(tuple(updated_list))
-
-            # if it exists, we will not insert......
-            if vid is None:
-                # Convert the updated list back to a tuple and append to the new list
-                insert_var_row_list.append(tuple(updated_list))
-
-        if len(insert_var_row_list) > 0:
+        if len(insert_var_rows) > 0:
             sql = "INSERT IGNORE INTO variant (id, element_id, pre_ref, ref, alt, start, end, label, parent_id, frameshift) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"
-            self.cursor.executemany(sql, insert_var_row_list)
+            self.cursor.executemany(sql, list(insert_var_rows.values()))
+            # ids of new variants, also inserted by other connections in the meantime
+            self.__variant_ids.update(self.get_variant_id_dict(list(insert_var_rows)))
+        return [self.__variant_ids[key] for key in variant_keys]
 
-        # print('Execution time- updated_var_row_list:',  round(elapsed_time,2), 'seconds')
+    def cache_variant_ids(self, element_ids):
+        """
+        Load the ids of all variants of the given elements once per connection
+        into the dictionary (element_id, ref, alt, start, end) -> variant id.
+        Samples share most of their variants, so insert_variant_many can look up ids
+        without querying the variant table for every variant.
 
-        updated_alignment2variant_list = []
-        variant_data_list = []
-        # st = time.time()  # NOTE!!: Slow Performance
-        for row in updated_var_row_list:
-            """
-            element_id = row[1]
-            start = row[3]
-            end = row[4]
-            ref = row[5]
-            alt = row[6]
-            """
-            variant_data_list.append((row[1], row[3], row[4], row[5], row[6]))
-        _data_list = self.get_variant_ids(variant_data_list)
+        Args:
+            element_ids (set): IDs of elements whose variants are imported.
+        """
+        element_ids = sorted(set(element_ids) - self.__variant_id_elements)
+        if not element_ids:
+            return
+        placeholders = ", ".join(["?"] * len(element_ids))
+        sql = f"SELECT id, element_id, ref, alt, start, end FROM variant WHERE element_id IN ({placeholders});"
+        self.cursor.execute(sql, element_ids)
+        for row in self.cursor.fetchall():
+            self.__variant_ids[
+                (row["element_id"], row["ref"], row["alt"], row["start"], row["end"])
+            ] = row["id"]
+        self.__variant_id_elements.update(element_ids)
 
-        # print('Execution time- get_variant_ids:',  round(elapsed_time,2), 'seconds')
+    def get_snp_contexts(
+        self, condition: str = "TRUE", values: List[Any] = []
+    ) -> Dict[Tuple[int, str, str, str, str], int]:
+        """
+        Counts the single-base substitutions of the selected samples per reference
+        and trinucleotide context, the flanking bases are taken from the reference
+        (empty at the ends of the reference).
 
-        # st = time.time()  # NOTE!!: Slow Performance
-        for row_id in _data_list:
-            updated_alignment2variant_list.append((alignment_id, row_id))
+        Args:
+            condition (str): SQL condition on the sample table, default: all samples.
+            values (list): Values of the placeholders in condition.
 
-        sql = "INSERT IGNORE INTO alignment2variant (alignment_id, variant_id) VALUES(?, ?);"
-        self.cursor.executemany(sql, updated_alignment2variant_list)
+        Returns:
+            Dict[Tuple, int]: {(reference_id, nt_before, ref, alt, nt_after): count}
+        """
+        nts = "('A', 'C', 'G', 'T')"
+        sql = (
+            "SELECT molecule.reference_id, COALESCE(variant.pre_ref, '') AS nt_before,"
+            " variant.ref, variant.alt,"
+            " SUBSTRING(element.sequence, variant.end + 1, 1) AS nt_after,"
+            " COUNT(*) AS count"
+            " FROM sample"
+            " JOIN alignment ON alignment.seqhash = sample.seqhash"
+            " JOIN alignment2variant ON alignment2variant.alignment_id = alignment.id"
+            " JOIN variant ON variant.id = alignment2variant.variant_id"
+            " JOIN element ON element.id = variant.element_id"
+            " JOIN molecule ON molecule.id = element.molecule_id"
+            f" WHERE {condition} AND element.type = 'source'"
+            f" AND variant.ref IN {nts} AND variant.alt IN {nts}"
+            " AND variant.ref != variant.alt"
+            " GROUP BY molecule.reference_id, nt_before, variant.ref, variant.alt, nt_after;"
+        )
+        self.cursor.execute(sql, values)
+        return {
+            (
+                row["reference_id"],
+                row["nt_before"],
+                row["ref"],
+                row["alt"],
+                row["nt_after"],
+            ): row["count"]
+            for row in self.cursor.fetchall()
+        }
+
+    def update_snp_contexts(
+        self, counts: Dict[Tuple[int, str, str, str, str], int]
+    ) -> None:
+        """
+        Adds counts of get_snp_contexts to the snp_context table (negative counts
+        for deleted samples). Rows are updated in a fixed order, so that concurrent
+        import workers cannot deadlock.
+        """
+        rows = [key + (count,) for key, count in sorted(counts.items()) if count]
+        if not rows:
+            return
+        sql = (
+            "INSERT INTO snp_context (reference_id, nt_before, ref, alt, nt_after, `count`)"
+            " VALUES(?, ?, ?, ?, ?, ?)"
+            " ON DUPLICATE KEY UPDATE `count` = `count` + VALUES(`count`);"
+        )
+        self.cursor.executemany(sql, rows)
 
-        # print('Execution time- updated_alignment2variant_list:',  round(elapsed_time,2), 'seconds')
+    def rebuild_snp_contexts(self) -> None:
+        """
+        Recounts the snp_context table from all samples, e.g. for databases
+        created before the table was maintained by the import.
+        """
+        self.cursor.execute("DELETE FROM snp_context;")
+        self.update_snp_contexts(self.get_snp_contexts())
 
     def insert_variant(
         self,
@@ -1198,6 +1314,37 @@ class sonarDBManager:
         self.cursor.execute(sql, [sample_name, reference_accession])
         return self.cursor.fetchall()
 
+    def get_alignment_data_many(
+        self, sample_names: List[str], reference_accession: Optional[str] = None
+    ) -> List[dict]:
+        """
+        Bulk version of get_alignment_data without the element sequences,
+        see get_sequence.
+
+        Args:
+            sample_names (list): Names of the samples.
+            reference_accession (str, optional): Accession of the reference. Defaults to None (all references).
+
+        Returns:
+            list: rows with sample.name, reference.accession, element.id and element.symbol
+                ordered by sample name and element id.
+        """
+        if not sample_names:
+            return []
+        placeholders = ", ".join(["?"] * len(sample_names))
+        sql = (
+            "SELECT `sample.name`, `reference.accession`, `element.id`, `element.symbol`"
+            f" FROM alignmentView WHERE `sample.name` IN ({placeholders})"
+            " AND `element.id` IS NOT NULL"
+        )
+        params = list(sample_names)
+        if reference_accession is not None:
+            sql += " AND `reference.accession` = ?"
+            params.append(reference_accession)
+        sql += " ORDER BY `sample.name`, `element.id`"
+        self.cursor.execute(sql, params)
+        return self.cursor.fetchall()
+
     def get_variant_id(
         self, element_id: int, start: int, end: int, ref: str, alt: str
     ) -> Optional[int]:
@@ -1229,6 +1376,25 @@ class sonarDBManager:
         row = self.cursor.fetchone()
         return None if row is None else row
 
+    def get_variants_by_ids(self, variant_ids, chunk_size=10000):
+        """
+        Bulk version of get_variant_by_id with one query per chunk of ids.
+
+        Args:
+            variant_ids (list): IDs of the variants.
+
+        Returns:
+            list: variant rows of all existing ids.
+        """
+        rows = []
+        for i in range(0, len(variant_ids), chunk_size):
+            chunk = variant_ids[i : i + chunk_size]
+            placeholders = ", ".join(["?"] * len(chunk))
+            sql = f"SELECT * FROM variant WHERE id IN ({placeholders});"
+            self.cursor.execute(sql, chunk)
+            rows.extend(self.cursor.fetchall())
+        return rows
+
     def get_variant_ids(self, variant_data_list):
         """
         Retrieves the ID of the variant based on the given list of variant.
@@ -1250,6 +1416,31 @@ class sonarDBManager:
 
         return None if rows is None else [row["id"] for row in rows]
 
+    def get_variant_id_dict(self, variant_data_list):
+        """
+        Retrieves the IDs of the given variants.
+        [ (element_id, ref, alt, start, end )]
+
+        Returns:
+            dict: (element_id, ref, alt, start, end) -> variant id
+        """
+        if not variant_data_list:
+            return {}
+
+        placeholders = ",".join(["(?, ?, ?, ?, ?)"] * len(variant_data_list))
+        values = [item for variant_data in variant_data_list for item in variant_data]
+
+        sql = f"""
+            SELECT id, element_id, ref, alt, start, end FROM variant WHERE (element_id, ref, alt, start, end ) IN ({placeholders});
+        """
+        self.cursor.execute(sql, values)
+        return {
+            (row["element_id"], row["ref"], row["alt"], row["start"], row["end"]): row[
+                "id"
+            ]
+            for row in self.cursor.fetchall()
+        }
+
     def iter_dna_variants(
         self, sample_name: str, *element_ids: int
     ) -> Iterator[sqlite3.Row]:
@@ -1299,6 +1490,45 @@ class sonarDBManager:
             if row["variant.start"] is not None:
                 yield row
 
+    def iter_dna_variants_many(
+        self, sample_names: List[str], *element_ids: int
+    ) -> Iterator[dict]:
+        """
+        Bulk version of iter_dna_variants with one query for all given samples.
+
+        Args:
+            sample_names (list): Names of the samples.
+            *element_ids (int): IDs of the elements.
+
+        Yields:
+            dict: variant rows with additional sample.name, ordered by sample name
+                and variant id.
+        """
+        if not sample_names or not element_ids:
+            return
+        sql = (
+            """ SELECT  sample.name as `sample.name`,
+                    variant.element_id as `element.id`,
+                    variant.start as `variant.start`,
+                    variant.end as  `variant.end`,
+                    variant.ref as  `variant.ref`,
+                    variant.alt as `variant.alt`
+                    FROM sample
+                    INNER JOIN alignment
+                        ON sample.seqhash = alignment.seqhash
+                    INNER JOIN alignment2variant
+                        ON alignment.id = alignment2variant.alignment_id
+                    INNER JOIN	variant
+                        ON alignment2variant.variant_id = variant.id
+                    WHERE sample.name IN ("""
+            + ", ".join(["?"] * len(sample_names))
+            + ") AND variant.element_id IN ("
+            + ", ".join(["?"] * len(element_ids))
+            + ") AND variant.start IS NOT NULL ORDER BY sample.name, variant.id"
+        )
+        self.cursor.execute(sql, list(sample_names) + list(element_ids))
+        yield from self.cursor.fetchall()
+
     def get_seq_hash(self, sample_name):
         sql = "SELECT seqhash FROM sample WHERE name = ? ;"
         self.cursor.execute(sql, [sample_name])
@@ -1318,11 +1548,16 @@ class sonarDBManager:
             >>> dbm.delete_samples("NC_045512")
         """
         sample_names = list(set(sample_names))
-        sql = (
-            "DELETE FROM sample WHERE name IN ("
-            + ", ".join(["?"] * len(sample_names))
-            + ");"
+        placeholders = ", ".join(["?"] * len(sample_names))
+        self.update_snp_contexts(
+            {
+                key: -count
+                for key, count in self.get_snp_contexts(
+                    f"sample.name IN ({placeholders})", sample_names
+                ).items()
+            }
         )
+        sql = "DELETE FROM sample WHERE name IN (" + placeholders + ");"
         self.cursor.execute(sql, sample_names)
         self.clean()
 
@@ -1415,6 +1650,29 @@ class sonarDBManager:
         row = self.cursor.fetchone()
         return (row["id"], row["seqhash"]) if row else (None, None)
 
+    def get_sample_data_many(
+        self, sample_names: List[str]
+    ) -> Dict[str, Tuple[int, str]]:
+        """
+        Bulk version of get_sample_data with one query for all given sample names.
+
+        Args:
+            sample_names (list): Names of the samples.
+
+        Returns:
+            Dict[str, Tuple[int,str]]: sample name -> (id, seqhash) of existing samples.
+        """
+        sample_names = sorted(set(sample_names))
+        if not sample_names:
+            return {}
+        placeholders = ", ".join(["?"] * len(sample_names))
+        sql = f"SELECT name, id, seqhash FROM sample WHERE name IN ({placeholders});"
+        self.cursor.execute(sql, sample_names)
+        sample_data = {}
+        for row in self.cursor.fetchall():
+            sample_data.setdefault(row["name"], (row["id"], row["seqhash"]))
+        return sample_data
+
     def iter_sample_names(self) -> Iterator[str]:
         """
         Iterates over all sample names stored in the database.
@@ -1446,6 +1704,30 @@ class sonarDBManager:
         row = self.cursor.fetchone()
         return None if row is None else row["id"]
 
+    def get_alignment_ids(
+        self, seqhashes: List[str], element_id: int
+    ) -> Dict[str, int]:
+        """
+        Bulk version of get_alignment_id with one query for all given seqhashes.
+
+        Args:
+            seqhashes (list): The seqhashes of the samples.
+            element_id (int): The element id.
+
+        Returns:
+            Dict[str, int]: seqhash -> id of the alignment, for stored alignments only.
+        """
+        seqhashes = sorted(set(seqhashes))
+        if not seqhashes:
+            return {}
+        placeholders = ", ".join(["?"] * len(seqhashes))
+        sql = f"SELECT seqhash, id FROM alignment WHERE element_id = ? AND seqhash IN ({placeholders});"
+        self.cursor.execute(sql, [element_id] + seqhashes)
+        alignment_ids = {}
+        for row in self.cursor.fetchall():
+            alignment_ids.setdefault(row["seqhash"], row["id"])
+        return alignment_ids
+
     def get_alignment_by_seqhash(self, seqhash):
         """
         Returns the rowid of a sample based on the respective seqhash  If no
@@ -3193,6 +3475,16 @@ class sonarDBManager:
             sys.exit(1)
         return _id
 
+    def get_annotation_type_ids(self) -> Dict[str, int]:
+        """
+        Get the whole annotation type table, e.g. to resolve effects in memory
+
+        Return dict seq_ontology -> id
+        """
+        sql = "SELECT id, seq_ontology FROM annotation_type;"
+        self.cursor.execute(sql)
+        return {row["seq_ontology"]: row["id"] for row in self.cursor.fetchall()}
+
     def insert_effect(self, seq_ontology):
         sql = "INSERT IGNORE INTO annotation_type (id, seq_ontology, region) VALUES(?,?,?);"
         self.cursor.execute(sql, [None, seq_ontology, "NONE"])
@@ -3201,3 +3493,15 @@ class sonarDBManager:
     def insert_alignment2annotation(self, variant_id, alignment_id, annotation_id):
         sql = "INSERT IGNORE INTO alignment2annotation (variant_id, alignment_id, annotation_id) VALUES(?,?,?);"
         self.cursor.execute(sql, [variant_id, alignment_id, annotation_id])
+
+    def insert_alignment2annotation_many(self, rows):
+        """
+        Bulk version of insert_alignment2annotation
+
+        Args:
+            rows (list): (variant_id, alignment_id, annotation_id) tuples
+        """
+        if not rows:
+            return
+        sql = "INSERT IGNORE INTO alignment2annotation (variant_id, alignment_id, annotation_id) VALUES(?,?,?);"
+        self.cursor.executemany(sql, rows)
@@ -109,6 +109,7 @@ def parse_args(args=None):
         output_parser,
         reference_parser,
         general_parser,
+        thread_parser,
     )
     subparsers, _ = create_subparser_info(subparsers, database_parser)
     subparsers, _ = create_subparser_optimize(subparsers, database_parser)
@@ -459,6 +460,11 @@ def create_subparser_import(
         type=str,
         default=None,
     )
+    parser.add_argument(
+        "--packed-cache",
+        help="store sample records, sequences and variants in append-only pack files in the cache directory instead of one file per sample or sequence",
+        action="store_true",
+    )
     parser.add_argument(
         "--no-progress",
         "-p",
@@ -716,7 +722,7 @@ def create_subparser_optimize(
     """
     parser = subparsers.add_parser(
         "optimize",
-        help="optimize database (e.g., rearranges data for efficient storage and faster queries, eliminating unnecessary space.)",
+        help="optimize database (e.g., rearranges data for efficient storage and faster queries, eliminating unnecessary space; recounts the substitution contexts.)",
         parents=parent_parsers,
     )
     parser.add_argument(
@@ -1122,6 +1128,7 @@ def handle_import(args: argparse.Namespace):
         quiet=args.debug,
         reference=args.reference,
         method=args.method,
+        packed_cache=args.packed_cache,
     )
 
 
@@ -1351,6 +1358,7 @@ def handle_restore(args: argparse.Namespace):
         samples,
         aligned=args.aligned,
         outfile=args.out,
+        threads=args.threads,
     )
 
     # def handle_update_pangolin(args: argparse.Namespace):
@@ -1489,8 +1497,10 @@ def handle_optimize(args: argparse.Namespace):
     Raises:
         FileNotFoundError: If the database file is not found.
     """
-    with sonarDBManager(args.db) as db_manager:
+    with sonarDBManager(args.db, readonly=False) as db_manager:
         db_manager.optimize()
+        # databases created before the import maintained the substitution counts
+        db_manager.rebuild_snp_contexts()
 
 
 def handle_direct_query(args: argparse.Namespace):
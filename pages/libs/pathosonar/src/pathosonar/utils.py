@@ -18,6 +18,7 @@ from Bio.SeqFeature import FeatureLocation
 from Bio.SeqFeature import SeqFeature
 from Bio.SeqRecord import SeqRecord
 from mpire import WorkerPool
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
@@ -32,6 +33,12 @@ from .utils_1 import get_filename_sonarhash
 
 # Initialize logger
 LOGGER = LoggingConfigurator.get_logger()
+# rows of alignment2annotation inserted with one executemany, see process_annotation
+ANNOTATION_BATCH_SIZE = 10000
+# samples per alignment/variant query, see restore_seq
+RESTORE_BATCH_SIZE = 1000
+# alt of deletions
+GAP_ALTS = {" ", "."}
 
 
 def print_max_min_rule(ref):
@@ -701,6 +708,7 @@ class sonarUtils:
         quiet: bool = False,
         reference: str = None,
         method: int = 1,
+        packed_cache: bool = False,
     ) -> None:
         """Import data from various sources into the database.
 
@@ -716,6 +724,7 @@ class sonarUtils:
             update: Whether to update existing records.
             threads: The number of threads to use for import.
             quiet: Whether to suppress logging.
+            packed_cache: Whether to store sample records, sequences and variants in append-only pack files.
         """
         sonarUtils._log_import_mode(update, quiet)
 
@@ -736,7 +745,9 @@ class sonarUtils:
         properties = sonarUtils._extract_props(csv_files, tsv_files, prop_names, quiet)
 
         # setup cache
-        cache = sonarUtils._setup_cache(db, reference, cachedir, update, progress)
+        cache = sonarUtils._setup_cache(
+            db, reference, cachedir, update, progress, packed=packed_cache
+        )
 
         # importing sequences
         if fasta:
@@ -916,11 +927,13 @@ class sonarUtils:
         if not fasta_files:
             return
 
-        cache.add_fasta(*fasta_files, properties=properties, method=method)
+        cache.add_fasta(*fasta_files, properties=properties, threads=threads)
 
         # align sequences and process
         aligner = sonarAligner(cache_outdir=cache.basedir, method=method)
         l = len(cache._samplefiles_to_profile)
+        # samples failing the paranoid test, i.e. not restorable from their variants
+        list_fail_samples = []
         with WorkerPool(n_jobs=threads, start_method="fork") as pool, tqdm(
             desc="profiling sequences...",
             total=l,
@@ -928,12 +941,24 @@ class sonarUtils:
             bar_format="{desc} {percentage:3.0f}% [{n_fmt}/{total_fmt}, {elapsed}<{remaining}, {rate_fmt}{postfix}]",
             disable=not progress,
         ) as pbar:
-            for _ in pool.imap_unordered(
-                aligner.process_cached_sample, cache._samplefiles_to_profile
+            for result in pool.imap_unordered(
+                aligner.process_cached_sample,
+                cache.get_samples_to_profile(),
+                iterable_len=l,
             ):
+                if "sample_name" in result:
+                    list_fail_samples.append(result)
+                elif result:
+                    # packed cache: variants are appended by this process only
+                    cache.cache_variants(**result)
                 pbar.update(1)
+        if list_fail_samples:
+            LOGGER.info(
+                f"{len(list_fail_samples)} samples failed the paranoid test and will not be imported."
+            )
+            cache.discard_samples([x["sample_name"] for x in list_fail_samples])
 
-        cache.import_cached_samples(threads, auto_anno=auto_anno)
+        cache.import_cached_samples_v2(threads, auto_anno=auto_anno)
         if method == 1:
             cache.clear_uncessary_cache(cache._samplefiles_to_profile)
 
@@ -945,6 +970,7 @@ class sonarUtils:
         update: bool = True,
         progress: bool = False,
         debug: bool = False,
+        packed: bool = False,
     ) -> sonarCache:
         """Set up a cache for sequence data."""
         # Instantiate a sonarCache object.
@@ -957,6 +983,7 @@ class sonarUtils:
             debug=debug,
             disable_progress=not progress,
             refacc=reference,
+            packed=packed,
         )
 
     @staticmethod
@@ -986,6 +1013,7 @@ class sonarUtils:
                     continue
                 for property_name, value in properties[sample_name].items():
                     dbm.insert_property(sample_id, property_name, value)
+                dbm.mark_modified(sample_id)
 
     # MATCHING
     @staticmethod
@@ -1100,113 +1128,193 @@ class sonarUtils:
         reference_accession: Optional[str] = None,
         aligned: bool = False,
         outfile: Optional[str] = None,
+        threads: int = 1,
+        batch_size: int = RESTORE_BATCH_SIZE,
     ) -> None:
         """
         Restores the given samples from the database.
 
+        Alignments and variants are queried for batch_size samples at once and
+        every batch is written as soon as its sequences are rebuilt.
+
         Args:
             db: The database to restore samples from.
             samples: A list of samples to be restored.
             reference_accession: Reference accession if any.
             aligned: Whether the samples are aligned or not.
             outfile: If provided, the result will be written to this file.
+            threads: Number of processes to rebuild the sequences.
+            batch_size: Number of samples per database query.
         """
-        reference_list = []
-        with sonarDBManager(db, readonly=True) as dbm:
+        samples = sorted(samples)
+        # element id -> reference sequence
+        references = {}
+        with sonarDBManager(db, readonly=True) as dbm, sonarBasics.out_autodetect(
+            outfile
+        ) as handle:
 
             # NOTE:Since we only want to restore fasta regardless of reference.
             # We select all references, and then we use only one of them
             # if the sample aligns with any.
 
             # get all references
+            reference_rank = {}
             if reference_accession is None:
-                reference_accession_dict = dbm.references
-                for row in reference_accession_dict:
-                    reference_list.append(row["accession"])
+                reference_list = [row["accession"] for row in dbm.references]
+                reference_rank = {x: i for i, x in enumerate(reference_list)}
                 LOGGER.debug(f"Query using reference: {reference_list}")
 
-            gap = "-" if aligned else ""
-            gap_alts = {" ", "."}
-
-            with sonarBasics.out_autodetect(outfile) as handle:
-                for sample in samples:
-                    prefixes = collections.defaultdict(str)
-
-                    # get reference-specific molecule sequences
+            for i in range(0, len(samples), batch_size):
+                batch = samples[i : i + batch_size]
 
-                    if len(reference_list) > 0:  # find all possible alignments
-                        for reference in reference_list:
-                            alignment_data = dbm.get_alignment_data(
-                                sample, reference_accession=reference
-                            )
-                            for x in alignment_data:
-                                if x is not None:
-                                    molecules = {
-                                        x["element.id"]: {
-                                            "seq": list(x["element.sequence"]),
-                                            "mol": x["element.symbol"],
-                                        }
-                                    }
-                                    # once we found it, no need to continually loop
-                                    break
-                    else:  # when the reference_accession is provided
-                        molecules = {
-                            x["element.id"]: {
-                                "seq": list(x["element.sequence"]),
-                                "mol": x["element.symbol"],
-                            }
-                            for x in dbm.get_alignment_data(
-                                sample, reference_accession=reference_accession
-                            )
-                        }
-
-                    if len(molecules) == 0:
+                # get reference-specific molecules {sample: {element id: symbol}}
+                sample_molecules = {}
+                alignment_data = dbm.get_alignment_data_many(
+                    batch, reference_accession=reference_accession
+                )
+                if reference_accession is None:
+                    # use the first molecule of the last reference the sample aligns with
+                    selected = {}
+                    for x in alignment_data:
+                        current = selected.get(x["sample.name"])
+                        if current is None or reference_rank.get(
+                            x["reference.accession"], -1
+                        ) > reference_rank.get(current["reference.accession"], -1):
+                            selected[x["sample.name"]] = x
+                    alignment_data = selected.values()
+                for x in alignment_data:
+                    sample_molecules.setdefault(x["sample.name"], {})[
+                        x["element.id"]
+                    ] = x["element.symbol"]
+
+                for sample in batch:
+                    if sample not in sample_molecules:
                         LOGGER.info(
                             f"No {sample} with {reference_accession} is stored in the database"
                         )
-                        continue
 
-                    # restore stored mutations
-                    for vardata in dbm.iter_dna_variants(sample, *molecules.keys()):
-                        alt = vardata["variant.alt"]
-                        start = vardata["variant.start"]
-                        end = vardata["variant.end"]
-                        elem_id = vardata["element.id"]
-                        mol_symbol = molecules[elem_id]["mol"]
-
-                        # inserting deletions
-                        if alt in gap_alts:
-                            for i in range(start, end):
-                                molecules[elem_id]["seq"][i] = gap
-
-                        # inserting snps and insertions
-                        elif start >= 0:
-                            if len(alt) > 1:
-                                if aligned:
-                                    alt = alt[1:].lower()
-                                else:
-                                    alt = alt[1:]
-                                molecules[elem_id]["seq"][start] += alt
-                            else:
-                                molecules[elem_id]["seq"][start] = (
-                                    alt + molecules[elem_id]["seq"][start][1:]
-                                )
-                        else:
-                            prefixes[elem_id] = alt
-
-                    # writing fasta output
-                    molecules_len = len(molecules)
-                    records = []
-                    for elem_id in molecules:
-                        if molecules_len == 1:
-                            records.append(f">{sample}")
-                        else:
-                            records.append(f">{sample} [molecule={mol_symbol}]")
-                        records.append(
-                            prefixes[elem_id] + "".join(molecules[elem_id]["seq"])
+                element_ids = {x for y in sample_molecules.values() for x in y}
+                for element_id in element_ids - references.keys():
+                    references[element_id] = dbm.get_sequence(element_id).encode()
+
+                # restore stored mutations
+                sample_variants = collections.defaultdict(list)
+                for vardata in dbm.iter_dna_variants_many(
+                    list(sample_molecules), *element_ids
+                ):
+                    if (
+                        vardata["element.id"]
+                        in sample_molecules[vardata["sample.name"]]
+                    ):
+                        sample_variants[vardata["sample.name"]].append(
+                            (
+                                vardata["element.id"],
+                                vardata["variant.start"],
+                                vardata["variant.end"],
+                                vardata["variant.alt"],
+                            )
                         )
-                    if len(records) > 0:
-                        handle.write("\n".join(records) + "\n")
+
+                # writing fasta output
+                tasks = [
+                    (sample, sample_molecules[sample], sample_variants[sample])
+                    for sample in batch
+                    if sample in sample_molecules
+                ]
+                if threads > 1 and len(tasks) > 1:
+                    with WorkerPool(
+                        n_jobs=threads,
+                        start_method="fork",
+                        shared_objects=(references, aligned),
+                    ) as pool:
+                        handle.writelines(pool.imap(sonarUtils._restore_sample, tasks))
+                else:
+                    handle.writelines(
+                        sonarUtils._restore_sample((references, aligned), *task)
+                        for task in tasks
+                    )
+
+    @staticmethod
+    def _restore_sample(
+        shared_objects: tuple,
+        sample: str,
+        molecules: Dict[int, str],
+        variants: List[tuple],
+    ) -> str:
+        """
+        Args:
+            shared_objects: element id -> reference sequence, aligned
+            molecules: element id -> symbol of the molecules to restore
+            variants: (element id, start, end, alt) of the sample
+
+        Returns:
+            str: fasta records of the sample
+        """
+        references, aligned = shared_objects
+        element_variants = collections.defaultdict(list)
+        for elem_id, start, end, alt in variants:
+            element_variants[elem_id].append((start, end, alt))
+        records = []
+        for elem_id, mol_symbol in molecules.items():
+            if len(molecules) == 1:
+                records.append(f">{sample}")
+            else:
+                records.append(f">{sample} [molecule={mol_symbol}]")
+            records.append(
+                sonarUtils._restore_molecule(
+                    references[elem_id], element_variants[elem_id], aligned
+                )
+            )
+        return "\n".join(records) + "\n"
+
+    @staticmethod
+    def _restore_molecule(refseq: bytes, variants: List[tuple], aligned: bool) -> str:
+        """
+        Applies the variants in the given order to the reference sequence.
+
+        Args:
+            refseq: Reference sequence of the molecule.
+            variants: (start, end, alt) of the variants.
+            aligned: Deletions as "-" and lowercase insertions, otherwise deletions are removed.
+
+        Returns:
+            str: The restored sequence.
+        """
+        seq = np.frombuffer(refseq, dtype=np.uint8).copy()
+        gaps = np.zeros(len(seq), dtype=bool)
+        # position -> inserted bases after the position
+        insertions = {}
+        prefix = ""
+        for start, end, alt in variants:
+            # inserting deletions
+            if alt in GAP_ALTS:
+                gaps[start:end] = True
+                for pos in [x for x in insertions if start <= x < end]:
+                    del insertions[pos]
+
+            # inserting snps and insertions
+            elif start >= 0:
+                if len(alt) > 1:
+                    alt = alt[1:].lower() if aligned else alt[1:]
+                    insertions[start] = insertions.get(start, "") + alt
+                else:
+                    seq[start] = ord(alt)
+                    gaps[start] = False
+            else:
+                prefix = alt
+
+        if aligned:
+            seq[gaps] = ord("-")
+        parts = [prefix]
+        prev = 0
+        for pos in sorted(insertions.keys() | {len(seq) - 1}):
+            part = seq[prev : pos + 1]
+            if not aligned:
+                part = part[~gaps[prev : pos + 1]]
+            parts.append(part.tobytes().decode())
+            parts.append(insertions.get(pos, ""))
+            prev = pos + 1
+        return "".join(parts)
 
     # DELETE OPERATION
     @staticmethod
@@ -1535,137 +1643,162 @@ class sonarUtils:
                 sonarUtils._write_vcf_records(handle, records, all_samples)
 
     @staticmethod
-    def process_annotation(db, paired_list, progress=False):  # noqa: C901
+    def process_annotation(  # noqa: C901
+        db, paired_list, progress=False, batch_size=ANNOTATION_BATCH_SIZE
+    ):
         """
         Steps:
-            1. Read annotated txt file and .sonar_hash
-            2. Get alignment ID and source element ID
-            3. Get variant ID
-            4. Insert the 3 IDs into the database.
+            1. Read all annotated txt files and .sonar_hash files
+            2. Get alignment IDs and source element ID, one query per file/reference
+            3. Get variants with one query per chunk of IDs and match them
+               to the annotated rows of their file
+            4. Insert the 3 IDs into the database in batches of batch_size rows.
 
         Input:
             paired_list = (annotated_file, sonar_hash_file)
 
         """
+        annotated_dfs = []
+        # (file index, alignment id, variant id) of all samples
+        sample_variant_rows = []
+        source_element_ids = {}
         with sonarDBManager(db, readonly=False) as dbm:
-            for _tuple in paired_list:
-                annotated_file, sonar_hash_file = _tuple
-                annotated_df = read_tsv_snpSift(annotated_file)
+            for file_id, (annotated_file, sonar_hash_file) in enumerate(paired_list):
+                annotated_dfs.append(
+                    read_tsv_snpSift(annotated_file).assign(file_id=file_id)
+                )
                 sonar_hash = read_sonar_hash(sonar_hash_file)
                 reference_accession = sonar_hash["reference"]
                 sample_dict = sonar_hash["sample_hashes"]
                 sample_variant_dict = sonar_hash["sample_variantTable"]
 
                 # Step 2
-                for sample_key in sample_dict:
-                    hash_value = sample_dict[sample_key]
+                if reference_accession not in source_element_ids:
                     source_ids_list = dbm.get_element_ids(reference_accession, "source")
-
                     if len(source_ids_list) > 1:
                         LOGGER.error("There is a duplicated element ID!!")
                         sys.exit(1)
-                    else:
-                        source_element_id = source_ids_list[0]
-
-                    alnids = dbm.get_alignment_id(hash_value, source_element_id)
-
-                    if type(alnids) is list:
+                    source_element_ids[reference_accession] = source_ids_list[0]
+                alignment_ids = dbm.get_alignment_ids(
+                    list(sample_dict.values()), source_element_ids[reference_accession]
+                )
+                for sample_key, hash_value in sample_dict.items():
+                    if hash_value not in alignment_ids:
                         LOGGER.error(
                             f"Hash value: {hash_value} is not found in the database!!"
                         )
                         sys.exit(1)
-                    else:
-                        alignment_id = alnids
-
-                    # Step 3
-                    sample_variant_list = sample_variant_dict[sample_key]
-
-                    # NOTE: MemoryError can be raised if a huge list is converted to a DataFrame
-                    _df = pd.DataFrame.from_dict(sample_variant_list)
-
-                    for row in _df.itertuples():
-                        variant_id = getattr(row, "variant_id")
-
-                        selected_var = dbm.get_variant_by_id(variant_id)
-                        if selected_var is None:
-                            LOGGER.error("No variant was found")
-                            LOGGER.warning(
-                                "This can happen when using a differnet version of database or database instance."
-                            )
-                            LOGGER.info(
-                                "Please ensure data import from the corresponding database version."
-                            )
-                            sys.exit(1)
-                        # ref = selected_var["ref"]
-
-                        # VCF: 1-based position
-                        # For DEL, we dont do +1
-                        ref = (
-                            (selected_var["pre_ref"] + selected_var["ref"])
-                            if selected_var["alt"] == " "
-                            else selected_var["ref"]
-                        )
+                    sample_variant_rows.extend(
+                        (file_id, alignment_ids[hash_value], x["variant_id"])
+                        for x in sample_variant_dict[sample_key]
+                    )
+            if not sample_variant_rows:
+                return
+            sample_variants = pd.DataFrame(
+                sample_variant_rows, columns=["file_id", "alignment_id", "variant_id"]
+            )
+            annotated_df = pd.concat(annotated_dfs, ignore_index=True)
+            annotated_df["REF"] = annotated_df["REF"].astype(str)
+            annotated_df["ALT"] = annotated_df["ALT"].astype(str)
+
+            # Step 3
+            variant_ids = sample_variants["variant_id"].unique().tolist()
+            variants = pd.DataFrame(
+                dbm.get_variants_by_ids(variant_ids),
+                columns=["id", "pre_ref", "ref", "alt", "start"],
+            )
+            if len(variants) < len(variant_ids):
+                LOGGER.error("No variant was found")
+                LOGGER.warning(
+                    "This can happen when using a differnet version of database or database instance."
+                )
+                LOGGER.info(
+                    "Please ensure data import from the corresponding database version."
+                )
+                sys.exit(1)
+            # VCF: 1-based position
+            # For DEL, we dont do +1
+            deletion = variants["alt"] == " "
+            del_at_start = deletion & (variants["start"] == 0)
+            variants["REF"] = variants["ref"].mask(
+                deletion, variants["pre_ref"].fillna("") + variants["ref"]
+            )
+            variants["POS"] = (
+                (variants["start"] + 1)
+                .mask(deletion, variants["start"])
+                .mask(del_at_start, 1)
+            )
+            alts = (
+                variants["alt"]
+                .mask(deletion, variants["pre_ref"])
+                .mask(del_at_start, ".")
+            )
+            # Handle different kind of SNV (Nucleotide symbol).
+            variants["ALT"] = [
+                sorted(sonarDBManager.IUPAC_CODES["nt"][alt.upper()])
+                if alt != "." and len(alt) == 1
+                else [alt]
+                for alt in alts
+            ]
+            variants = variants.explode("ALT")[["id", "POS", "REF", "ALT"]]
+
+            # Check if every variant exists in the annotated txt file of its sample.
+            file_variants = sample_variants[["file_id", "variant_id"]].drop_duplicates()
+            matches = file_variants.merge(
+                variants, left_on="variant_id", right_on="id"
+            ).merge(annotated_df, on=["file_id", "POS", "REF", "ALT"])
+            unmatched = file_variants[
+                ~file_variants.set_index(["file_id", "variant_id"]).index.isin(
+                    matches.set_index(["file_id", "variant_id"]).index
+                )
+            ]
+            # If it does not return any result, we should raise an error because
+            # the wrong annotated text file is being used or the database has already been modified.
+            if len(unmatched):
+                file_id, variant_id = unmatched.iloc[0]
+                selected_var = variants[variants["id"] == variant_id]
+                LOGGER.error(
+                    "It appears that the wrong annotated text file is being used "
+                    "or the .sonar_hash file is not match to the input "
+                    "or the database has already been modified. Please double-check the file "
+                    "or database!"
+                )
+                LOGGER.info("Get VAR:")
+                LOGGER.info(selected_var)
+                LOGGER.info("Get DF:")
+                LOGGER.info(
+                    f"{annotated_dfs[file_id][annotated_dfs[file_id]['POS'].isin(selected_var['POS'])]}"
+                )
+                sys.exit(1)
 
-                        if selected_var["alt"] == " ":
-                            if selected_var["start"] == 0:
-                                start = 1
-                            else:
-                                start = selected_var["start"]
-                        else:
-                            start = selected_var["start"] + 1
-
-                        if selected_var["alt"] == " ":
-                            if selected_var["start"] == 0:
-                                alt = "."
-                            else:
-                                alt = selected_var["pre_ref"]
-                        else:
-                            alt = selected_var["alt"]
-
-                        # Handle different kind of SNV (Nucleotide symbol).
-                        if alt != "." and len(alt) == 1:
-                            alt = sonarDBManager.IUPAC_CODES["nt"][alt.upper()]
-
-                        else:
-                            alt = [alt]
-                        # Check if it exists in the annotated txt file.
-                        selected_rows = annotated_df.loc[
-                            (annotated_df["POS"] == start)
-                            & (annotated_df["REF"] == ref)
-                            & (annotated_df["ALT"].isin(alt))
-                        ]
-                        # If it does not return any result or more than 1, we should raise an error because
-                        # the wrong annotated text file is being used or the database has already been modified.
-
-                        if len(selected_rows) == 0:
-                            LOGGER.error(
-                                "It appears that the wrong annotated text file is being used "
-                                "or the .sonar_hash file is not match to the input "
-                                "or the database has already been modified. Please double-check the file "
-                                "or database!"
-                            )
-                            LOGGER.info("Get VAR:")
-                            LOGGER.info(selected_var)
-                            LOGGER.info("Use for searching a ROW:")
-                            LOGGER.info(f"start:{start} , ref:{ref} , alt:{alt}")
-                            LOGGER.info("Get DF:")
-                            LOGGER.info(f"{annotated_df[annotated_df['POS'] == start]}")
-                            sys.exit(1)
-
-                        # Find associated ID from annotationTable.
-                        for index, row in selected_rows.iterrows():
-
-                            effect = row["EFFECT"]
-
-                            if effect is None or effect == ".":
-                                effect = ""  # Default
-                            effect_id = dbm.get_annotation_ID_by_type(effect)
-
-                            # Step 4
-                            # Insert into the database
-                            dbm.insert_alignment2annotation(
-                                variant_id, alignment_id, effect_id
-                            )
+            # Find associated ID from annotationTable.
+            effects = matches["EFFECT"].where(
+                matches["EFFECT"].notna() & (matches["EFFECT"] != "."), ""
+            )
+            effect_ids = dbm.get_annotation_type_ids()
+            for effect in effects.unique():
+                if effect not in effect_ids:
+                    effect_ids[effect] = dbm.get_annotation_ID_by_type(effect)
+            matches["effect_id"] = effects.map(effect_ids)
+
+            # Step 4
+            # Insert into the database
+            rows = (
+                sample_variants.merge(
+                    matches[["file_id", "variant_id", "effect_id"]],
+                    on=["file_id", "variant_id"],
+                )[["variant_id", "alignment_id", "effect_id"]]
+                .drop_duplicates()
+                .to_numpy()
+                .tolist()
+            )
+            for i in tqdm(
+                range(0, len(rows), batch_size),
+                desc="import annotations...",
+                unit="batches",
+                disable=not progress,
+            ):
+                dbm.insert_alignment2annotation_many(rows[i : i + batch_size])
 
     @staticmethod
     def _check_reference(db, reference):
@@ -16,12 +16,25 @@ def mock_workerpool_imap_unordered(monkeypatch):
     coverage with multiprocess subprocesses, and also to make the tests
     reproducible (ordered).
     """
-    monkeypatch.setattr(
-        "mpire.WorkerPool.imap_unordered",
-        lambda self, func, args=(), kwds={}, callback=None, error_callback=None: (
-            func(arg) for arg in args
-        ),
-    )
+
+    def imap_unordered(
+        self, func, iterable_of_args, worker_init=None, worker_exit=None, **kwargs
+    ):
+        # one worker: arguments are unpacked like mpire does, worker state is passed first
+        worker_state = [{}] if self.pool_params.use_worker_state else []
+        if worker_init:
+            worker_init(*worker_state)
+        for args in iterable_of_args:
+            if isinstance(args, dict):
+                yield func(*worker_state, **args)
+            elif isinstance(args, tuple):
+                yield func(*worker_state, *args)
+            else:
+                yield func(*worker_state, args)
+        if worker_exit:
+            worker_exit(*worker_state)
+
+    monkeypatch.setattr("mpire.WorkerPool.imap_unordered", imap_unordered)
 
 
 @pytest.fixture(scope="session")
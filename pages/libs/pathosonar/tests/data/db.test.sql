@@ -175,6 +175,19 @@ CREATE TABLE IF NOT EXISTS `alignment2variant` (
 	FOREIGN KEY(alignment_id) REFERENCES `alignment`(id) ON DELETE CASCADE,
 	FOREIGN KEY(variant_id) REFERENCES variant(id) ON DELETE CASCADE
 );
+-- structure for table mpx.snp_context
+-- single-base substitutions of all samples counted per reference and
+-- trinucleotide context, maintained by the import (see sonarDBManager.update_snp_contexts)
+CREATE TABLE IF NOT EXISTS `snp_context` (
+	reference_id INTEGER NOT NULL,
+	nt_before VARCHAR(1) NOT NULL,
+	ref VARCHAR(1) NOT NULL,
+	alt VARCHAR(1) NOT NULL,
+	nt_after VARCHAR(1) NOT NULL,
+	`count` INTEGER NOT NULL,
+	PRIMARY KEY(reference_id, nt_before, ref, alt, nt_after),
+	FOREIGN KEY(reference_id) REFERENCES reference(id) ON DELETE CASCADE
+);
 -- structure for table mpx.lineages
 -- CREATE TABLE IF NOT EXISTS `lineages`(
 --	`lineage` VARCHAR(100) NOT NULL,
@@ -0,0 +1,164 @@
+from collections import defaultdict
+
+import pytest
+
+from pathosonar.align import sonarAligner
+from pathosonar.cache import sonarCache
+from pathosonar.dbm import sonarDBManager
+from pathosonar.utils import sonarUtils
+
+
+def write_var_file(path, variants):
+    # same format as sonarAligner.process_cached_sample
+    with open(path, "w") as handle:
+        handle.write("\n".join("\t".join(variant) for variant in variants) + "\n//")
+
+
+def test_import_workers_share_new_variant(testdb, tmp_path):
+    with sonarCache(db=testdb, outdir=tmp_path, refacc="MN908947.3") as sc:
+        molecule_id = sc.refmols["MN908947.3"]["molecule.id"]
+        source = sc.sources["MN908947.3"]
+        variant = (
+            "G",
+            "29850",
+            "29851",
+            "TTTT",
+            source["accession"],
+            "G29851TTTT",
+            "0",
+        )
+        samples = []
+        for i in range(2):
+            var_file = str(tmp_path / f"shared_variant_{i}.var")
+            write_var_file(var_file, [variant])
+            samples.append(
+                {
+                    "name": f"shared_variant_sample_{i}",
+                    "seqhash": f"shared_variant_seqhash_{i}",
+                    "refmolid": molecule_id,
+                    "sourceid": source["id"],
+                    "var_file": var_file,
+                }
+            )
+        assert len(sc.group_samples_by_sequence(samples)) == 2
+
+        sc.insert_cached_variants(samples)
+        # two workers with open transactions import samples sharing the new variant
+        workers = [{}, {}]
+        for worker_state in workers:
+            sc.init_import_worker(worker_state)
+        for worker_state, sample_data in zip(workers, samples):
+            assert sc.import_cached_sample(worker_state, **sample_data)
+        for worker_state in workers:
+            sc.exit_import_worker(worker_state)
+
+    with sonarDBManager(testdb) as dbm:
+        dbm.cursor.execute(
+            "SELECT id FROM variant"
+            " WHERE element_id = ? AND ref = ? AND alt = ? AND start = ? AND end = ?;",
+            [source["id"], "G", "TTTT", 29850, 29851],
+        )
+        variant_ids = [row["id"] for row in dbm.cursor.fetchall()]
+        assert len(variant_ids) == 1
+        dbm.cursor.execute(
+            "SELECT alignment.seqhash FROM alignment2variant"
+            " JOIN alignment ON alignment.id = alignment2variant.alignment_id"
+            " WHERE variant_id = ?;",
+            variant_ids,
+        )
+        assert {row["seqhash"] for row in dbm.cursor.fetchall()} == {
+            "shared_variant_seqhash_0",
+            "shared_variant_seqhash_1",
+        }
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_paranoid_check_failure_is_not_imported(testdb, tmp_path, monkeypatch, packed):
+    # the extracted variants miss the snp, the sequence cannot be restored
+    monkeypatch.setattr(sonarAligner, "process_cached_v2", lambda self, data: [])
+    sample_name = f"paranoid_sample_packed_{packed}"
+    cachedir = tmp_path / "cache"
+    with sonarUtils._setup_cache(
+        testdb, "MN908947.3", str(cachedir), packed=packed
+    ) as cache:
+        refseq = cache.get_refseq("MN908947.3")
+        fasta = tmp_path / "paranoid.fasta"
+        snp = "A" if refseq[100] != "A" else "C"
+        fasta.write_text(f">{sample_name}\n{refseq[:100]}{snp}{refseq[101:]}\n")
+
+        sonarUtils._import_fasta([str(fasta)], defaultdict(dict), cache, method=2)
+
+        assert not cache._samplefiles
+        if packed:
+            assert not cache.var_pack.index
+        else:
+            assert not list((cachedir / "var").rglob("*.var"))
+
+    for suffix in ("error.var", "error.restored_sam.fa", "error.original_sam.fa"):
+        assert (cachedir / "error" / f"{sample_name}.{suffix}").is_file()
+    with sonarDBManager(testdb) as dbm:
+        assert dbm.get_sample_id(sample_name) is None
+
+
+def test_snp_contexts_of_imported_and_deleted_samples(testdb, tmp_path):
+    with sonarCache(db=testdb, outdir=tmp_path, refacc="MN908947.3") as sc:
+        molecule_id = sc.refmols["MN908947.3"]["molecule.id"]
+        source = sc.sources["MN908947.3"]
+        refseq = source["sequence"]
+        alt = "A" if refseq[100] != "A" else "C"
+        var_file = str(tmp_path / "snp.var")
+        write_var_file(
+            var_file,
+            [(refseq[100], "100", "101", alt, source["accession"], "snp", "0")],
+        )
+        # two new samples of the same sequence
+        samples = [
+            {
+                "name": f"snp_context_sample_{i}",
+                "sampleid": None,
+                "seqhash": "snp_context_seqhash",
+                "refmolid": molecule_id,
+                "sourceid": source["id"],
+                "var_file": var_file,
+            }
+            for i in range(2)
+        ]
+        sc.insert_cached_variants(samples)
+        worker_state = {}
+        sc.init_import_worker(worker_state)
+        for sample_data in samples:
+            assert sc.import_cached_sample(worker_state, **sample_data)
+        sc.exit_import_worker(worker_state)
+
+    with sonarDBManager(testdb) as dbm:
+        dbm.cursor.execute(
+            "SELECT id FROM reference WHERE accession = ?;", ["MN908947.3"]
+        )
+        key = (
+            dbm.cursor.fetchone()["id"],
+            refseq[99],
+            refseq[100],
+            alt,
+            refseq[101],
+        )
+
+    def count_context():
+        with sonarDBManager(testdb) as dbm:
+            dbm.cursor.execute(
+                "SELECT `count` FROM snp_context WHERE reference_id = ?"
+                " AND nt_before = ? AND ref = ? AND alt = ? AND nt_after = ?;",
+                list(key),
+            )
+            row = dbm.cursor.fetchone()
+            return row["count"] if row else 0, dbm.get_snp_contexts().get(key, 0)
+
+    maintained, counted = count_context()
+    assert maintained == counted >= 2
+
+    with sonarDBManager(testdb, readonly=False) as dbm:
+        dbm.delete_samples("snp_context_sample_0")
+    assert count_context() == (maintained - 1, counted - 1)
+
+    with sonarDBManager(testdb, readonly=False) as dbm:
+        dbm.rebuild_snp_contexts()
+    assert count_context() == (maintained - 1, counted - 1)
@@ -1,3 +1,4 @@
+import datetime
 import re
 
 import pytest
@@ -88,3 +89,17 @@ def test_create_genomic_element_conditions(testdb):
             molecule_prefix,
         ) = dbm.create_genomic_element_conditions(["MN908947.3", "NC_063383.1"])
         print(genome_element_condition, molecule_prefix)
+
+
+def test_mark_modified_on_reimport(testdb):
+    with sonarDBManager(testdb, readonly=False) as dbm:
+        seqhash = "modified_test_seqhash"
+        sample_id = dbm.insert_sample("modified_test_sample", seqhash)
+        sql = "SELECT value_date FROM sample2property WHERE sample_id = ? AND property_id = ?;"
+        modified_id = dbm.properties["MODIFIED"]["id"]
+        dbm.cursor.execute(sql, [sample_id, modified_id])
+        assert dbm.cursor.fetchone() is None
+
+        assert dbm.insert_sample("modified_test_sample", seqhash) == sample_id
+        dbm.cursor.execute(sql, [sample_id, modified_id])
+        assert dbm.cursor.fetchone()["value_date"] == datetime.date.today()
@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from pathosonar.align import sonarAligner
+
+REF_DIR = Path(__file__).parent / "data" / "cache-test" / "ref"
+
+
+@pytest.fixture
+def lift_file(tmp_path):
+    """lift file of MN908947.3 with the accession column written by sonarCache.cache_lift"""
+    df = pd.read_pickle(REF_DIR / "1.lift")
+    df["accession"] = df["symbol"] + "_ACC"
+    path = tmp_path / "1.lift"
+    df.to_pickle(path)
+    return str(path)
+
+
+def nuc_var(ref, start, end, alt):
+    return (ref, str(start), str(end), alt, "MN908947.3", "", "nt")
+
+
+# expected AA variants of the former row-wise lift_vars (pandas df.loc per position)
+@pytest.mark.parametrize(
+    "nuc_vars,expected",
+    [
+        # snp
+        (
+            [nuc_var("A", 23402, 23403, "G")],
+            [("D", "613", "614", "G", "S_ACC", "D614G", "cds")],
+        ),
+        # deletion of three codons, runs are merged relative to their first position
+        (
+            [nuc_var("N" * 9, 21766, 21775, " ")],
+            [
+                ("HV", "68", "70", " ", "S_ACC", "del:69-70", "cds"),
+                ("S", "70", "71", " ", "S_ACC", "del:71", "cds"),
+            ],
+        ),
+        # deletion of two codons
+        (
+            [nuc_var("N" * 6, 27971, 27977, " ")],
+            [("QH", "26", "28", " ", "ORF8_ACC", "del:27-28", "cds")],
+        ),
+        # frameshift deletion of one nucleotide
+        ([nuc_var("N", 28880, 28881, " ")], []),
+        # insertion
+        (
+            [nuc_var("G", 26276, 26277, "GAAA")],
+            [("T", "10", "11", "TK", "E_ACC", "T11TK", "cds")],
+        ),
+        # uncovered terminal region
+        ([nuc_var("N" * 50, 0, 50, ".")], []),
+        # snps and adjacent deletions in several CDS
+        (
+            [
+                nuc_var("A", 9265, 9266, "T"),
+                nuc_var("N" * 9, 21991, 22000, " "),
+                nuc_var("N" * 3, 22000, 22003, " "),
+                nuc_var("A", 28879, 28880, "C"),
+            ],
+            [
+                ("S", "3000", "3001", "C", "orf1ab_ACC", "S3001C", "cds"),
+                ("YY", "143", "145", " ", "S_ACC", "del:144-145", "cds"),
+                ("HK", "145", "147", " ", "S_ACC", "del:146-147", "cds"),
+            ],
+        ),
+    ],
+)
+def test_lift_vars(lift_file, nuc_vars, expected):
+    aligner = sonarAligner()
+    assert [
+        tuple(str(x) for x in aa_var)
+        for aa_var in aligner.lift_vars(nuc_vars, lift_file, str(REF_DIR / "1.tt"))
+    ] == expected
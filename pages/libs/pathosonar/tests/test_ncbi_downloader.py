@@ -0,0 +1,143 @@
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import importlib.util
+from pathlib import Path
+import sys
+import threading
+from urllib.parse import parse_qs
+
+import pytest
+
+GENBANK_RECORD = """LOCUS       {accession}                 60 bp    DNA     linear   VRL 18-NOV-2022
+DEFINITION  Monkeypox virus isolate {accession}, partial genome.
+ACCESSION   {accession}
+VERSION     {accession}.1
+KEYWORDS    .
+SOURCE      Monkeypox virus
+  ORGANISM  Monkeypox virus
+            Viruses.
+FEATURES             Location/Qualifiers
+     source          1..60
+                     /organism="Monkeypox virus"
+                     /isolate="{accession}"
+                     /host="Homo sapiens"
+                     /country="Germany: Berlin"
+                     /collection_date="Nov-2022"
+ORIGIN
+        1 acgtacgtac acgtacgtac acgtacgtac acgtacgtac acgtacgtac acgtacgtac
+//
+"""
+ESEARCH_RESULT = """<?xml version="1.0" encoding="UTF-8" ?>
+<!DOCTYPE eSearchResult PUBLIC "-//NLM//DTD esearch 20060628//EN" "https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20060628/esearch.dtd">
+<eSearchResult><Count>{count}</Count><RetMax>{retmax}</RetMax><RetStart>0</RetStart>
+<IdList>{ids}</IdList></eSearchResult>
+"""
+SAMPLE_IDS = [f"OQ{i:06d}.1" for i in range(1, 96)] + ["NC_063383.1"]
+
+
+class NCBIStandIn(BaseHTTPRequestHandler):
+    """Serves canned esearch and efetch (GenBank) responses of SAMPLE_IDS."""
+
+    # the first efetch requests fail with these status codes
+    errors = []
+    # efetch fails for batches containing one of these ids
+    broken_ids = set()
+    fetched_ids = []
+
+    def do_POST(self):
+        params = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        if self.path.endswith("esearch.fcgi"):
+            retmax = int(params.get("retmax", ["20"])[0])
+            ids = "".join(f"<Id>{x}</Id>" for x in SAMPLE_IDS[:retmax])
+            body = ESEARCH_RESULT.format(count=len(SAMPLE_IDS), retmax=retmax, ids=ids)
+        else:
+            ids = params["id"][0].split(",")
+            if self.errors:
+                self.send_error(self.errors.pop(0))
+                return
+            if self.broken_ids.intersection(ids):
+                # truncated response
+                body = GENBANK_RECORD.format(accession=ids[0].split(".")[0])[:100]
+            else:
+                self.fetched_ids.extend(ids)
+                body = "".join(
+                    GENBANK_RECORD.format(accession=x.split(".")[0]) for x in ids
+                )
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def downloader(monkeypatch):
+    path = Path(__file__).parents[1] / "NCBI.downloader.py"
+    spec = importlib.util.spec_from_file_location("ncbi_downloader", path)
+    module = importlib.util.module_from_spec(spec)
+    # parser processes look up the module of parse_genbank_file
+    monkeypatch.setitem(sys.modules, "ncbi_downloader", module)
+    spec.loader.exec_module(module)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), NCBIStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(NCBIStandIn, "errors", [])
+    monkeypatch.setattr(NCBIStandIn, "broken_ids", set())
+    monkeypatch.setattr(NCBIStandIn, "fetched_ids", [])
+    monkeypatch.setattr(module, "EUTILS_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(module, "REQUESTS_PER_SECOND", 1000)
+    monkeypatch.setattr(module, "RETRY_DELAY", 0)
+    monkeypatch.setattr(module, "PARSE_WORKERS", 2)
+    monkeypatch.setattr(module, "get_existing_sample_list", lambda: ["OQ000001.1"])
+    yield module
+    server.shutdown()
+    server.server_close()
+
+
+def read_meta_ids(output_path):
+    with open(output_path / "meta.tsv") as handle:
+        lines = handle.read().splitlines()
+    assert lines[0].startswith("ID\tISOLATE")
+    return sorted(line.split("\t")[0] for line in lines[1:])
+
+
+def test_download_generate_outputfiles(downloader, tmp_path):
+    NCBIStandIn.errors.extend([503, 429])
+    gb_path = tmp_path / "GB"
+    gb_path.mkdir()
+
+    assert downloader.generate_outputfiles(downloader.download(gb_path), tmp_path)
+
+    expected_ids = [x for x in SAMPLE_IDS if x not in ["OQ000001.1", "NC_063383.1"]]
+    assert read_meta_ids(tmp_path) == expected_ids
+    with open(tmp_path / "meta.tsv") as handle:
+        assert (
+            "OQ000002.1\tOQ000002\t60\tGermany\tGermany: Berlin\t2022-11-18\t2022-11-01\t\tHomo sapiens\tpartial\n"
+            in handle.read()
+        )
+    with open(tmp_path / "seq.fasta") as handle:
+        assert handle.read().count(">") == len(expected_ids)
+    assert sorted(NCBIStandIn.fetched_ids) == sorted(SAMPLE_IDS[1:])
+    assert (gb_path / ".download.success").exists()
+
+
+def test_download_resume(downloader, tmp_path):
+    NCBIStandIn.broken_ids.add("OQ000050.1")
+    gb_path = tmp_path / "GB"
+    gb_path.mkdir()
+
+    with pytest.raises(downloader.DownloadError):
+        downloader.generate_outputfiles(downloader.download(gb_path), tmp_path)
+    assert not (gb_path / ".download.success").exists()
+    batches = downloader.downloaded_batches(gb_path)
+    assert batches
+    downloaded_ids = set(NCBIStandIn.fetched_ids)
+    assert "OQ000050.1" not in downloaded_ids
+
+    NCBIStandIn.broken_ids.clear()
+    NCBIStandIn.fetched_ids.clear()
+    assert downloader.generate_outputfiles(downloader.download(gb_path), tmp_path)
+    assert "OQ000050.1" in NCBIStandIn.fetched_ids
+    assert not downloaded_ids.intersection(NCBIStandIn.fetched_ids)
+    assert len(read_meta_ids(tmp_path)) == len(SAMPLE_IDS) - 2
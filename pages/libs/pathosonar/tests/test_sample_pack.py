@@ -0,0 +1,64 @@
+import os
+
+from pathosonar.cache import sonarSamplePack
+
+
+def test_append_read(tmp_path):
+    pack = sonarSamplePack(str(tmp_path / "samples.pack"))
+    pack.append("sample_1", {"name": "sample_1", "properties": {"LENGTH": 1}})
+    pack.append("sample_2", "ACGT")
+    pack.append("sample_1", {"name": "sample_1", "properties": {"LENGTH": 2}})
+
+    assert pack.read("sample_1") == {"name": "sample_1", "properties": {"LENGTH": 2}}
+    assert pack.read("sample_2") == "ACGT"
+    # records in file order, a sample cached again is read from its latest record
+    assert list(pack.iter_records(["sample_1", "sample_2"])) == [
+        "ACGT",
+        {"name": "sample_1", "properties": {"LENGTH": 2}},
+    ]
+    pack.close()
+
+
+def test_reopen_rebuilds_index(tmp_path):
+    fname = str(tmp_path / "samples.pack")
+    pack = sonarSamplePack(fname)
+    for i in range(3):
+        pack.append(f"sample_{i}", {"name": f"sample_{i}"})
+    pack.append("sample_0", {"name": "sample_0", "updated": True})
+    index = dict(pack.index)
+    pack.close()
+
+    pack = sonarSamplePack(fname)
+    assert pack.index == index
+    assert pack.read("sample_0") == {"name": "sample_0", "updated": True}
+    pack.append("sample_3", {"name": "sample_3"})
+    assert [record["name"] for record in pack.iter_records(pack.index)] == [
+        "sample_1",
+        "sample_2",
+        "sample_0",
+        "sample_3",
+    ]
+    pack.close()
+
+
+def test_truncated_tail_is_cut_off(tmp_path):
+    fname = str(tmp_path / "samples.pack")
+    pack = sonarSamplePack(fname)
+    pack.append("sample_0", {"name": "sample_0"})
+    size = sum(pack.index["sample_0"])
+    pack.append("sample_1", {"name": "sample_1", "sequence": "ACGT" * 100})
+    pack.close()
+    # interrupted write of the second record
+    with open(fname, "r+b") as handle:
+        handle.truncate(os.path.getsize(fname) - 10)
+
+    pack = sonarSamplePack(fname)
+    assert list(pack.index) == ["sample_0"]
+    assert os.path.getsize(fname) == size
+    pack.append("sample_1", {"name": "sample_1"})
+    pack.close()
+
+    pack = sonarSamplePack(fname)
+    assert pack.read("sample_1") == {"name": "sample_1"}
+    assert pack.read("sample_0") == {"name": "sample_0"}
+    pack.close()
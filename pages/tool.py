@@ -18,6 +18,8 @@ import plotly.graph_objects as go
 from pages.config import color_schemes
 from pages.config import location_coordinates
 from pages.config import logging_radar
+from pages.config import redis_manager
+from pages.config import RESULT_CACHE_SIZE_MB
 from pages.html_compare import html_aa_nt_radio
 from pages.html_compare import html_compare_button
 from pages.html_compare import html_date_picker
@@ -43,8 +45,9 @@ from pages.utils_filters import get_all_frequency_sorted_countries_by_filters
 from pages.utils_filters import get_all_frequency_sorted_seqtech
 from pages.utils_filters import get_all_gene_dict
 from pages.utils_filters import get_all_references
-from pages.utils_filters import get_frequency_sorted_cds_mutation_by_filters
 from pages.utils_filters import get_frequency_sorted_seq_techs_by_filters
+from pages.utils_result_cache import ResultCache
+from pages.utils_snapshot import get_dataset_version
 from pages.utils_tables import OverviewTable
 from pages.utils_tables import TableFilter
 from pages.utils_worldMap_explorer import DateSlider
@@ -52,6 +55,7 @@ from .app_controller import get_freq_mutation
 from .app_controller import match_controller
 from .app_controller import sonarBasicsChild
 from .compare_callbacks import get_compare_callbacks
+from .explore_callbacks import get_cds_mutation_options
 from .explore_callbacks import get_explore_callbacks
 from .utils import get_color_dict
 
@@ -59,6 +63,10 @@ from .utils import get_color_dict
 df_dict = load_all_sql_files()
 date_slider = DateSlider(df_dict)
 color_dict = get_color_dict(df_dict)
+# results of the explore and compare callbacks, shared by all workers of the snapshot
+result_cache = ResultCache(
+    get_dataset_version(df_dict), redis_manager, RESULT_CACHE_SIZE_MB * 1024 * 1024
+)
 
 # initialize explore tool
 start_cond_ref_id = sorted(list(df_dict["variantView"]["complete"].keys()))[0]
@@ -95,7 +103,8 @@ start_country_value = [i["value"] for i in start_country_options]
     start_colored_mutation_options_dict,
     max_nb_freq,
     min_nb_freq,
-) = get_frequency_sorted_cds_mutation_by_filters(
+) = get_cds_mutation_options(
+    result_cache,
     df_dict,
     start_seq_tech_values,
     start_country_value,
@@ -216,6 +225,7 @@ tab_explored_tool = html.Div(
                         pd.DataFrame(columns=explore_columns),
                         "Properties of filtered samples.",
                         "explorer",
+                        server_side=True,
                     )
                 ),
             ],
@@ -870,9 +880,11 @@ def update_output_sonar_map(rows, columns):  # noqa: C901
 """
 
 # This is the EXPLORE TOOL PART
-get_explore_callbacks(df_dict, date_slider, color_dict, location_coordinates)
+get_explore_callbacks(
+    df_dict, date_slider, color_dict, location_coordinates, result_cache
+)
 
 # COMPARE PART
-get_compare_callbacks(df_dict, color_dict)
+get_compare_callbacks(df_dict, color_dict, result_cache)
 
 del df_dict
@@ -3,10 +3,13 @@ import datetime
 import pandas as pd
 
 from pages.utils_filters import get_frequency_sorted_mutation_by_df
+from pages.utils_filters import select_profile_dfs
 from pages.utils_filters import select_propertyView_dfs
+from pages.utils_filters import select_variant_index_dfs
 from pages.utils_filters import select_variantView_dfs
 from pages.utils_tables import OverviewTable
 from pages.utils_tables import TableFilter
+from pages.utils_worldMap_explorer import DATE_ORDINAL_COLUMN
 from pages.utils_worldMap_explorer import DateSlider
 
 
@@ -35,14 +38,14 @@ def filter_propertyView(
     """
     :return: filtered df by user selected sequencing technologies, countries and dates
     """
-    date_list = DateSlider.get_all_dates(
+    date_range = DateSlider.get_date_range(
         datetime.datetime.strptime(start_date, "%Y-%m-%d").date(),
         datetime.datetime.strptime(end_date, "%Y-%m-%d").date(),
     )
     return df[
         (df["SEQ_TECH"].isin(seqtech_value))
         & (df["COUNTRY"].isin(country_value))
-        & (df["COLLECTION_DATE"].isin(date_list))
+        & DateSlider.date_range_mask(df[DATE_ORDINAL_COLUMN], date_range)
     ]
 
 
@@ -246,10 +249,15 @@ def create_comparison_tables(
     right selection or table for shared mutations between both selections for compare tool
     based on user selection
     """
-    variantView_dfs = select_variantView_dfs(
-        df_dict, complete_partial_radio, reference_value, aa_nt_radio
-    )
+    profile_dfs = select_profile_dfs(df_dict, complete_partial_radio, reference_value)
     propertyView_dfs = select_propertyView_dfs(df_dict, complete_partial_radio)
+    variant_index_dfs = select_variant_index_dfs(
+        df_dict,
+        complete_partial_radio,
+        reference_value,
+        aa_nt_radio,
+        "gene:variant" if aa_nt_radio == "cds" else "variant.label",
+    )
 
     table_left_ins = TableFilter(
         "compare",
@@ -283,23 +291,26 @@ def create_comparison_tables(
     ]
 
     table_df_1 = table_left_ins.create_compare_table_left_and_right(
-        variantView_dfs, propertyView_dfs_left
+        profile_dfs, propertyView_dfs_left, variant_index_dfs
     )
     table_df_2 = table_right_ins.create_compare_table_left_and_right(
-        variantView_dfs, propertyView_dfs_right
+        profile_dfs, propertyView_dfs_right, variant_index_dfs
     )
     (
         table_df_3,
         samples_left_both,
         samples_right_both,
     ) = table_both_ins.create_compare_table_both(
-        variantView_dfs, propertyView_dfs_left, propertyView_dfs_right
+        profile_dfs,
+        propertyView_dfs_left,
+        propertyView_dfs_right,
+        variant_index_dfs,
     )
 
     overviewTable = OverviewTable(aa_nt_radio)
     variantView_df_overview_both = (
         overviewTable.count_shared_mutation_in_left_and_right_selection(
-            mut_value_both, samples_left_both, samples_right_both, variantView_dfs
+            mut_value_both, samples_left_both, samples_right_both, variant_index_dfs
         )
     )
 
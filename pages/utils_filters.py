@@ -3,6 +3,9 @@ from datetime import datetime
 from dash import html
 import pandas as pd
 
+from pages.utils_sample_index import select_samples
+from pages.utils_sample_index import unique_sample_ids
+
 
 def select_variantView_dfs(
     df_dict: dict, complete_partial_radio: str, reference_value: int, aa_nt_radio: str
@@ -33,6 +36,55 @@ def select_propertyView_dfs(
     return propertyView_dfs
 
 
+def select_profile_dfs(
+    df_dict: dict, complete_partial_radio: str, reference_value: int
+) -> list[pd.DataFrame]:
+    """
+    selection of used profile dfs based on user selection of completeness and reference sequence
+    :return: list of profile dfs with columns ["sample.id", "sample.name", "reference.id",
+        "REFERENCE_ACCESSION", "AA_PROFILE", "NUC_PROFILE"]
+    """
+    profile_dfs = [df_dict["profiles"]["complete"][reference_value]]
+    if complete_partial_radio == "partial":
+        profile_dfs.append(df_dict["profiles"]["partial"][reference_value])
+    return profile_dfs
+
+
+def select_property_index_dfs(
+    df_dict: dict, complete_partial_radio: str, column: str
+) -> list[pd.DataFrame]:
+    """
+    selection of used propertyView index dfs of column based on user selection of completeness
+    :return: list of index dfs with columns [column, "sample_id_list"]
+    """
+    index_dfs = [df_dict["property_index"]["complete"][column]]
+    if complete_partial_radio == "partial":
+        index_dfs.append(df_dict["property_index"]["partial"][column])
+    return index_dfs
+
+
+def select_variant_index_dfs(
+    df_dict: dict,
+    complete_partial_radio: str,
+    reference_value: int,
+    aa_nt_radio: str,
+    column: str,
+) -> list[pd.DataFrame]:
+    """
+    selection of used variantView index dfs of column
+    based on user selection of completeness, reference sequence and variant type
+    :return: list of index dfs with columns [column, "sample_id_list"]
+    """
+    index_dfs = [
+        df_dict["variant_index"]["complete"][reference_value][aa_nt_radio][column]
+    ]
+    if complete_partial_radio == "partial":
+        index_dfs.append(
+            df_dict["variant_index"]["partial"][reference_value][aa_nt_radio][column]
+        )
+    return index_dfs
+
+
 def sort_and_extract_by_col(propertyView: pd.DataFrame, col: str) -> list:
     """
     sort column col by number of rows
@@ -129,7 +181,7 @@ def get_all_frequency_sorted_countries_by_filters(
     """
     # complete samples, propertyView filtered by seqtech, gene, min date
     filtered_propertyView = filter_propertyView_by_seqtech_and_gene(
-        df_dict["variantView"]["complete"][reference_value][aa_nt],
+        df_dict["variant_index"]["complete"][reference_value][aa_nt]["element.symbol"],
         df_dict["propertyView"]["complete"],
         seqtech_value,
         gene_value,
@@ -140,7 +192,9 @@ def get_all_frequency_sorted_countries_by_filters(
     # add partial samples, propertyView filtered by seqtech, gene, min date
     if complete_partial_radio == "partial":
         filtered_propertyView_partial = filter_propertyView_by_seqtech_and_gene(
-            df_dict["variantView"]["partial"][reference_value][aa_nt],
+            df_dict["variant_index"]["partial"][reference_value][aa_nt][
+                "element.symbol"
+            ],
             df_dict["propertyView"]["partial"],
             seqtech_value,
             gene_value,
@@ -169,7 +223,7 @@ def filter_propertyView_by_seqtech_and_country(
 
 
 def filter_propertyView_by_seqtech_and_gene(
-    variantView: pd.DataFrame,
+    gene_index: pd.DataFrame,
     propertyView: pd.DataFrame,
     seqtech_value: list[str],
     gene_value: list[str],
@@ -181,18 +235,17 @@ def filter_propertyView_by_seqtech_and_gene(
     + gene filtering if variant type = cds
     and ensures both tables contain same sample ids
 
+    :param gene_index: variant_index df of column element.symbol for same variantView
     :return: filtered propertyView df for user input seqtech (and date)
     """
     if aa_nt == "cds":
-        sample_id_set = set(
-            variantView[variantView["element.symbol"].isin(gene_value)]["sample.id"]
-        )
+        sample_ids = select_samples([gene_index], "element.symbol", gene_value)
     elif aa_nt == "source":
-        sample_id_set = set(variantView["sample.id"])
+        sample_ids = unique_sample_ids(gene_index["sample_id_list"])
 
     filtered_propertyView = propertyView[
         propertyView["SEQ_TECH"].isin(seqtech_value)
-        & propertyView["sample.id"].isin(sample_id_set)
+        & propertyView["sample.id"].isin(sample_ids)
     ]
 
     if min_date:
@@ -234,6 +287,23 @@ def filter_by_seqtech_country_gene_and_merge(
     return merged_df
 
 
+def filter_mutation_cube(
+    mutation_cube: pd.DataFrame,
+    seqtech_value: list[str],
+    country_value: list[str],
+    gene_value: list[str],
+) -> pd.DataFrame:
+    """
+    :param mutation_cube: precomputed counts, see data.create_mutation_cube
+    :return: rows of mutation_cube for user input seq techs, countries and genes
+    """
+    return mutation_cube[
+        mutation_cube["SEQ_TECH"].isin(seqtech_value)
+        & mutation_cube["COUNTRY"].isin(country_value)
+        & mutation_cube["element.symbol"].isin(gene_value)
+    ]
+
+
 def get_frequency_sorted_cds_mutation_by_filters(
     df_dict: dict,
     seqtech_value: list[str],
@@ -245,6 +315,9 @@ def get_frequency_sorted_cds_mutation_by_filters(
     min_nb_freq: int = 1,
 ) -> (list[dict], int, int):
     """
+    mutation frequencies are summed up from the precomputed mutation cube,
+    no merge of propertyView and variantView needed
+
     :return: mutation options sorted by frequency,
         with color styling for AA variants and additional value frequency of mutation
         -> allows fast filtering of mutation options by min_nb_freq
@@ -252,32 +325,25 @@ def get_frequency_sorted_cds_mutation_by_filters(
     :return: highest mutation frequency in selection = nb of samples with same mutation
     :return: lowest mutation frequency in selecion
     """
-    merged_df = filter_by_seqtech_country_gene_and_merge(
-        df_dict["propertyView"]["complete"],
-        df_dict["variantView"]["complete"][reference_value]["cds"],
-        seqtech_value,
-        country_value,
-        gene_value,
-    )
-
+    mutation_cubes = [df_dict["mutation_cube"]["complete"][reference_value]]
     if complete_partial_radio == "partial":
-        merged_df_2 = filter_by_seqtech_country_gene_and_merge(
-            df_dict["propertyView"]["partial"],
-            df_dict["variantView"]["partial"][reference_value]["cds"],
-            seqtech_value,
-            country_value,
-            gene_value,
-        )
-        merged_df = pd.concat([merged_df, merged_df_2], ignore_index=True, axis=0)
-
-    (
-        sorted_mutation_options,
-        max_nb_freq,
-        min_nb_freq,
-    ) = get_frequency_sorted_mutation_by_df(
-        merged_df, color_dict, ["gene:variant", "element.symbol"], "cds", min_nb_freq
+        mutation_cubes.append(df_dict["mutation_cube"]["partial"][reference_value])
+    filtered_cube = pd.concat(
+        [
+            filter_mutation_cube(cube, seqtech_value, country_value, gene_value)
+            for cube in mutation_cubes
+        ],
+        ignore_index=True,
+        axis=0,
+    )
+    count_df = (
+        filtered_cube.groupby(["gene:variant", "element.symbol"])["count"]
+        .sum()
+        .reset_index()
+    )
+    return get_frequency_sorted_mutation_by_counts(
+        count_df, color_dict, "cds", min_nb_freq
     )
-    return sorted_mutation_options, max_nb_freq, min_nb_freq
 
 
 def get_frequency_sorted_mutation_by_df(
@@ -293,6 +359,28 @@ def get_frequency_sorted_mutation_by_df(
     :param variant_columns: ["gene:variant", "element.symbol"] for AA variants,
         ["variant.label"] for Nt variants
     :param mut_type: "cds" or "source"
+    :param min_nb_freq: user input or None
+        -> only mutation options occuring at least in min_nb_freq samples
+    :return: see get_frequency_sorted_mutation_by_counts
+    """
+    count_df = df.groupby(variant_columns).size().reset_index(name="count")
+    return get_frequency_sorted_mutation_by_counts(
+        count_df, color_dict, mut_type, min_nb_freq
+    )
+
+
+def get_frequency_sorted_mutation_by_counts(
+    df: pd.DataFrame,
+    color_dict: dict,
+    mut_type: str,
+    min_nb_freq: int = None,
+) -> (list[dict], int, int):
+    """
+    :param df: variant columns and column "count" (number of samples), one row per mutation
+        variant columns: ["gene:variant", "element.symbol"] for AA variants,
+        ["variant.label"] for Nt variants
+    :param color_dict: colors based on gene name
+    :param mut_type: "cds" or "source"
     :param min_nb_freq: user input or None
         -> only mutation options occuring at least in min_nb_freq samples
     :return: mutation options sorted by occurence, with color styling for AA variants
@@ -300,13 +388,7 @@ def get_frequency_sorted_mutation_by_df(
     :return: max_freq_nb, highest mutation frequency in selection = nb of samples with same mutation
     :return: min_nb_freq, None, user input or changed user iput depending on max_nb_freq
     """
-    df = (
-        df.groupby(variant_columns)
-        .size()
-        .reset_index()
-        .rename(columns={0: "count"})
-        .sort_values(["count"], ascending=False, ignore_index=True)
-    )
+    df = df.sort_values(["count"], ascending=False, ignore_index=True)
     if not df.empty:
         max_freq_nb = df.iloc[0, -1]
         if min_nb_freq:
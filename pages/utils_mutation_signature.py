@@ -0,0 +1,74 @@
+import pandas as pd
+
+from pages.config import logging_radar
+from pages.utils import generate_96_mutation_types
+
+# reference bases of the six substitution classes C>A, C>G, C>T, T>A, T>C, T>G
+SIGNATURE_REF_NTS = ["C", "T"]
+
+
+def count_tri_mutation_types(snp_counts: pd.DataFrame) -> dict:
+    """
+    count the 96 trinucleotide mutation types (e.g. A[C>A]A) per reference
+
+    :param snp_counts: df of app_controller.get_snp_counts with columns
+        ["reference.accession", "variant.ref", "variant.alt", "nt_before", "nt_after",
+        "count"], flanking bases outside of the reference are empty strings
+    :return: {accession: {mutation type: {trinucleotide type: count}}}
+    """
+    final_dict = {
+        accession: generate_96_mutation_types()
+        for accession in snp_counts["reference.accession"].unique()
+    }
+    df = snp_counts[
+        snp_counts["variant.ref"].isin(SIGNATURE_REF_NTS)
+        & (snp_counts["nt_before"] != "")
+        & (snp_counts["nt_after"] != "")
+    ]
+    mutation_type = df["variant.ref"] + ">" + df["variant.alt"]
+    _type = df["nt_before"] + mutation_type + df["nt_after"]
+    counts = df.groupby(
+        [df["reference.accession"], mutation_type.rename("type"), _type]
+    )["count"].sum()
+    for (accession, mutation_type, _type), count in counts.items():
+        if _type not in final_dict[accession][mutation_type]:
+            logging_radar.warning(f"Unknown trinucleotide context {_type}")
+            continue
+        final_dict[accession][mutation_type][_type] = count
+    return final_dict
+
+
+def create_snp_type_counts(snp_counts: pd.DataFrame) -> pd.DataFrame:
+    """
+    count for every substitution the single, 2 NTs and 3 NTs types, e.g. for C>T
+    C>T, GC>GT (end changes), CA>TA (begin changes), GCA>GTA (middle changes)
+
+    :param snp_counts: df of app_controller.get_snp_counts
+    :return: df with columns ["genome_assembly", "mutation", "count"],
+        one row per reference and type, count is NaN for types not found in a reference
+    """
+    ref, alt = snp_counts["variant.ref"], snp_counts["variant.alt"]
+    before, after = snp_counts["nt_before"], snp_counts["nt_after"]
+    df = pd.concat(
+        [
+            snp_counts.assign(mutation=mutation)
+            for mutation in [
+                ref + ">" + alt,
+                before + ref + ">" + before + alt,
+                ref + after + ">" + alt + after,
+                before + ref + ">" + alt + after,
+            ]
+        ],
+        ignore_index=True,
+        axis=0,
+    )
+    df = (
+        df.groupby(["reference.accession", "mutation"])["count"]
+        .sum()
+        .unstack("mutation")
+        .rename_axis(index="genome_assembly", columns=None)
+        .reset_index()
+    )
+    return pd.melt(
+        df, id_vars=["genome_assembly"], var_name="mutation", value_name="count"
+    )
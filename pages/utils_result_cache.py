@@ -0,0 +1,173 @@
+from collections import OrderedDict
+from datetime import date
+import hashlib
+import json
+import pickle
+import threading
+import zlib
+
+import numpy as np
+import redis
+
+from pages.config import logging_radar
+
+RESULT_KEY_PREFIX = "mpxradar:result"
+# same lifetime as the snapshot flag "df_dict" in redis
+RESULT_TIMEOUT = 3600 * 23
+
+
+def canonical_value(value):
+    """
+    filter values in a form independent of the selection order of the user:
+    lists, tuples and sets are sorted, dates are iso strings, numpy scalars python scalars
+    """
+    if isinstance(value, (list, tuple, set, frozenset, np.ndarray)):
+        return sorted(
+            (canonical_value(x) for x in value),
+            key=lambda x: json.dumps(x, sort_keys=True),
+        )
+    if isinstance(value, dict):
+        return {str(key): canonical_value(x) for key, x in value.items()}
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def date_range(dates: list[date]) -> list[date]:
+    """
+    :param dates: consecutive dates or (first date, last date),
+        e.g. of DateSlider.get_date_range_in_interval
+    :return: [first date, last date], shorter filter value for the same dates
+    """
+    if not dates:
+        return []
+    return [min(dates), max(dates)]
+
+
+def result_key(version: str, name: str, filters: dict) -> str:
+    """
+    :param version: dataset version, see get_dataset_version
+    :param name: name of the cached computation, e.g. "compare_tables"
+    :param filters: filter state the result depends on
+    :return: redis key, e.g. mpxradar:result:<version>:compare_tables:<hash of filters>
+    """
+    digest = hashlib.sha256(
+        json.dumps(canonical_value(filters), sort_keys=True, default=str).encode()
+    ).hexdigest()[:32]
+    return f"{RESULT_KEY_PREFIX}:{version}:{name}:{digest}"
+
+
+def remove_results(redis_client, keep_version: str = None) -> int:
+    """
+    delete cached results of all dataset versions except keep_version,
+    called after a new snapshot is published
+
+    :return: number of deleted keys
+    """
+    keep_prefix = f"{RESULT_KEY_PREFIX}:{keep_version}:".encode()
+    deleted = 0
+    try:
+        keys = [
+            key
+            for key in redis_client.scan_iter(
+                match=f"{RESULT_KEY_PREFIX}:*", count=1000
+            )
+            if not key.startswith(keep_prefix)
+        ]
+        for i in range(0, len(keys), 1000):
+            deleted += redis_client.delete(*keys[i : i + 1000])
+    except redis.exceptions.RedisError as e:
+        logging_radar.warning(f"Cached results not removed: {e}")
+    return deleted
+
+
+class ResultCache:
+    """
+    cache of explore and compare results by canonical filter state and dataset version
+    two tiers: LRU of serialized results in the worker process (evicted by size)
+    and redis shared by all workers, results of other dataset versions are never used
+
+    ...
+
+    Attributes
+    ----------
+    version: dataset version, None -> results are only cached in the process
+    redis_client: redis connection, None -> results are only cached in the process
+    max_bytes: size of serialized results kept in the process
+    timeout: seconds results are kept in redis
+    """
+
+    def __init__(
+        self,
+        version: str,
+        redis_client=None,
+        max_bytes: int = 256 * 1024 * 1024,
+        timeout: int = RESULT_TIMEOUT,
+    ):
+        self.version = version
+        # results of a dataset that was not published as snapshot are not shared
+        self.redis_client = redis_client if version else None
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._local = OrderedDict()
+        self._local_bytes = 0
+        self._lock = threading.Lock()
+
+    def _get_local(self, key: str) -> bytes:
+        with self._lock:
+            data = self._local.get(key)
+            if data is not None:
+                self._local.move_to_end(key)
+            return data
+
+    def _set_local(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._local:
+                self._local_bytes -= len(self._local.pop(key))
+            self._local[key] = data
+            self._local_bytes += len(data)
+            while self._local_bytes > self.max_bytes:
+                _key, evicted = self._local.popitem(last=False)
+                self._local_bytes -= len(evicted)
+
+    def _get_shared(self, key: str) -> bytes:
+        if self.redis_client is None:
+            return None
+        try:
+            return self.redis_client.get(key)
+        except redis.exceptions.RedisError as e:
+            logging_radar.warning(f"Result cache not available: {e}")
+            return None
+
+    def _set_shared(self, key: str, data: bytes):
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.set(key, data, ex=self.timeout)
+        except redis.exceptions.RedisError as e:
+            logging_radar.warning(f"Result cache not available: {e}")
+
+    def get_or_compute(self, name: str, compute, **filters):
+        """
+        :param name: name of the computation, results of different names never collide
+        :param compute: function without arguments computing the result
+        :param filters: complete filter state the result depends on
+            lists are compared as sets, e.g. countries=["USA", "Germany"]
+            equals countries=["Germany", "USA"]
+        :return: result of compute, a new copy for every call
+        """
+        key = result_key(self.version, name, filters)
+        data = self._get_local(key)
+        if data is None:
+            data = self._get_shared(key)
+            if data is None:
+                data = zlib.compress(
+                    pickle.dumps(compute(), protocol=pickle.HIGHEST_PROTOCOL), 1
+                )
+                self._set_shared(key, data)
+            self._set_local(key, data)
+        return pickle.loads(zlib.decompress(data))
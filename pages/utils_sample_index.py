@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+
+# dtype of the sample id arrays in column sample_id_list of world_map and index dfs
+SAMPLE_ID_TYPE = "int32"
+# propertyView columns with an inverted index, processed_df_dict["property_index"]
+PROPERTY_INDEX_COLUMNS = ["SEQ_TECH", "COUNTRY", "COLLECTION_DATE"]
+# variantView columns with an inverted index, processed_df_dict["variant_index"]
+VARIANT_INDEX_COLUMNS = {
+    "source": ["element.symbol", "variant.label"],
+    "cds": ["element.symbol", "gene:variant"],
+}
+
+
+def group_sample_ids(df: pd.DataFrame, group_columns: list[str]) -> pd.DataFrame:
+    """
+    collect distinct sample ids of rows with same values in group_columns
+    rows are sorted like groupby would sort them, each group is a slice of sorted sample.id
+
+    :param df: df with column "sample.id" and group_columns
+    :return: df with columns group_columns + ["sample_id_list"],
+        column sample_id_list: sorted int32 array of sample ids e.g. array([3, 45, 67])
+    """
+    df = (
+        df[group_columns + ["sample.id"]]
+        .drop_duplicates()
+        .sort_values(group_columns + ["sample.id"])
+    )
+    group_ids = df.groupby(group_columns, dropna=False, sort=False).ngroup().to_numpy()
+    group_starts = np.flatnonzero(np.diff(group_ids, prepend=-1))
+    sample_id_lists = pd.Series(
+        np.split(df["sample.id"].to_numpy(dtype=SAMPLE_ID_TYPE), group_starts[1:])
+        if len(group_starts)
+        else [],
+        dtype=object,
+    )
+    df = df.iloc[group_starts][group_columns].reset_index(drop=True)
+    df["sample_id_list"] = sample_id_lists
+    return df
+
+
+def create_sample_index(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    """
+    inverted index of df: every value of column mapped to the samples containing it
+
+    :return: df with columns [column, "sample_id_list"], one row per distinct value
+    """
+    return group_sample_ids(df, [column])
+
+
+def _sample_bitmap(sample_ids: np.ndarray, size: int) -> np.ndarray:
+    """
+    :return: boolean mask over all sample ids < size, True for contained samples
+    """
+    bitmap = np.zeros(size, dtype=bool)
+    bitmap[sample_ids] = True
+    return bitmap
+
+
+def unique_sample_ids(sample_id_lists) -> np.ndarray:
+    """
+    union of sample id arrays
+
+    :param sample_id_lists: sample id arrays, e.g. column sample_id_list of world dfs
+    :return: sorted array of distinct sample ids
+    """
+    sample_id_lists = [ids for ids in sample_id_lists if len(ids)]
+    if not sample_id_lists:
+        return np.empty(0, dtype=SAMPLE_ID_TYPE)
+    sample_ids = np.concatenate(sample_id_lists)
+    bitmap = _sample_bitmap(sample_ids, sample_ids.max() + 1)
+    return np.flatnonzero(bitmap).astype(SAMPLE_ID_TYPE)
+
+
+def intersect_samples(*sample_ids: np.ndarray) -> np.ndarray:
+    """
+    intersection of sorted arrays of distinct sample ids
+
+    :return: sorted array of sample ids contained in all arrays
+    """
+    result = sample_ids[0]
+    for ids in sample_ids[1:]:
+        if not len(result) or not len(ids):
+            return np.empty(0, dtype=SAMPLE_ID_TYPE)
+        bitmap = _sample_bitmap(ids, max(result.max(), ids.max()) + 1)
+        result = result[bitmap[result]]
+    return result
+
+
+def select_samples(
+    index_dfs: list[pd.DataFrame], column: str, values: list
+) -> np.ndarray:
+    """
+    :param index_dfs: index dfs of create_sample_index, e.g. for complete and partial samples
+    :param column: indexed column
+    :param values: user selected values of column
+    :return: sorted array of sample ids with any of the values
+    """
+    return unique_sample_ids(
+        ids
+        for index_df in index_dfs
+        for ids in index_df.loc[index_df[column].isin(values), "sample_id_list"]
+    )
+
+
+def select_samples_in_range(
+    index_dfs: list[pd.DataFrame], column: str, first_value, last_value
+) -> np.ndarray:
+    """
+    index dfs are sorted by column, the values in range are found by binary search
+
+    :param index_dfs: index dfs of create_sample_index, e.g. for complete and partial samples
+    :param column: indexed column, e.g. COLLECTION_DATE
+    :param first_value: first value of the range
+    :param last_value: last value of the range (included)
+    :return: sorted array of sample ids with a value in range
+    """
+    sample_id_lists = []
+    for index_df in index_dfs:
+        start = index_df[column].searchsorted(first_value, side="left")
+        stop = index_df[column].searchsorted(last_value, side="right")
+        sample_id_lists.extend(index_df["sample_id_list"].iloc[start:stop])
+    return unique_sample_ids(sample_id_lists)
+
+
+def count_samples_by_value(
+    index_dfs: list[pd.DataFrame], column: str, values: list, sample_ids: np.ndarray
+) -> pd.DataFrame:
+    """
+    count for every value of column the samples containing it within sample_ids
+
+    :return: df with columns [column, "count"] sorted by column,
+        values without samples are not contained
+    """
+    index_df = pd.concat(
+        [index_df[index_df[column].isin(values)] for index_df in index_dfs],
+        ignore_index=True,
+        axis=0,
+    )
+    if index_df.empty or not len(sample_ids):
+        return pd.DataFrame(columns=[column, "count"])
+    lengths = index_df["sample_id_list"].map(len).to_numpy()
+    all_ids = np.concatenate(index_df["sample_id_list"].to_list())
+    bitmap = _sample_bitmap(sample_ids, max(sample_ids.max(), all_ids.max()) + 1)
+    index_df["count"] = np.add.reduceat(
+        bitmap[all_ids].astype("int64"), np.cumsum(lengths) - lengths
+    )
+    df = index_df.groupby(column)["count"].sum().reset_index()
+    return df[df["count"] > 0].reset_index(drop=True)
+
+
+def remove_sample_ids(
+    df: pd.DataFrame, sample_ids: np.ndarray, column: str = "sample_id_list"
+) -> pd.DataFrame:
+    """
+    remove sample ids from the sample id arrays of df, rows without remaining samples are dropped
+
+    :param df: df of group_sample_ids, e.g. world_map or index df
+    :param sample_ids: sample ids to remove
+    :return: copy of df
+    """
+    df = df.copy()
+    if df.empty or not len(sample_ids):
+        return df
+    lengths = df[column].map(len).to_numpy()
+    all_ids = np.concatenate(df[column].to_list())
+    bitmap = _sample_bitmap(sample_ids, max(sample_ids.max(), all_ids.max()) + 1)
+    keep = ~bitmap[all_ids]
+    kept_lengths = np.add.reduceat(keep.astype("int64"), np.cumsum(lengths) - lengths)
+    affected = np.flatnonzero(kept_lengths < lengths)
+    kept_ids = np.split(all_ids[keep], np.cumsum(kept_lengths)[:-1])
+    # only changed rows get new arrays, all others keep their (memory-mapped) arrays
+    sample_id_lists = df[column].to_numpy(dtype=object)
+    for i in affected:
+        sample_id_lists[i] = kept_ids[i]
+    df[column] = sample_id_lists
+    return df[kept_lengths > 0].reset_index(drop=True)
+
+
+def merge_sample_id_groups(
+    df: pd.DataFrame,
+    delta_df: pd.DataFrame,
+    group_columns: list[str],
+    removed_sample_ids: np.ndarray,
+) -> pd.DataFrame:
+    """
+    incremental version of group_sample_ids:
+    remove changed samples from df and add the groups of new and changed samples
+
+    :param df: df of group_sample_ids of all previous samples
+    :param delta_df: df of group_sample_ids of new and changed samples
+    :param group_columns: group columns of both dfs
+    :param removed_sample_ids: sample ids of changed samples
+    :return: same result as group_sample_ids applied on all current samples
+    """
+    columns = group_columns + ["sample_id_list"]
+    df = pd.concat(
+        [remove_sample_ids(df[columns], removed_sample_ids), delta_df[columns]],
+        ignore_index=True,
+        axis=0,
+    )
+    group_ids = df.groupby(group_columns, dropna=False, sort=False).ngroup()
+    duplicated = group_ids.duplicated(keep=False).to_numpy()
+    if duplicated.any():
+        # same group in previous and delta samples -> union of both arrays
+        merged = {
+            group_id: unique_sample_ids(sample_id_lists)
+            for group_id, sample_id_lists in df.loc[
+                duplicated, "sample_id_list"
+            ].groupby(group_ids[duplicated])
+        }
+        first = ~group_ids.duplicated(keep="first").to_numpy()
+        df = df[first].reset_index(drop=True)
+        sample_id_lists = df["sample_id_list"].to_numpy(dtype=object).copy()
+        positions = pd.Index(group_ids[first]).get_indexer(list(merged))
+        for i, merged_ids in zip(positions, merged.values()):
+            sample_id_lists[i] = merged_ids
+        df["sample_id_list"] = sample_id_lists
+    return df.sort_values(group_columns).reset_index(drop=True)
@@ -0,0 +1,349 @@
+from collections.abc import Mapping
+from datetime import datetime
+import fcntl
+import json
+import os
+import shutil
+from uuid import uuid4
+import weakref
+
+import pandas as pd
+import pyarrow as pa
+
+from pages.config import logging_radar
+
+MANIFEST_NAME = "manifest.json"
+SNAPSHOT_FORMAT = 4
+# number of snapshot versions kept on disk, versions locked by running workers are kept as well
+KEEP_VERSIONS = 2
+# every process reading a snapshot version holds a shared lock on this file, see VersionLock
+READER_LOCK_NAME = ".readers.lock"
+ARROW_STRING_DTYPE = pd.StringDtype("pyarrow")
+ARROW_STRING_KEY = b"mpxradar.arrow_string_columns"
+
+
+def iter_partitions(df_dict: dict, keys: tuple = ()):
+    """
+    walk the nested processed_df_dict and yield every dataframe with its key path, e.g.
+        ("propertyView", "complete"), ("variantView", "complete", 2, "cds"),
+        ("world_map", "complete", 2)
+    """
+    for key, value in df_dict.items():
+        if isinstance(value, pd.DataFrame):
+            yield keys + (key,), value
+        else:
+            yield from iter_partitions(value, keys + (key,))
+
+
+def partition_file_name(keys: tuple) -> str:
+    """
+    :return: file name of partition, e.g. variantView.complete.2.cds.arrow
+    """
+    return ".".join(str(key) for key in keys) + ".arrow"
+
+
+def write_partition(df: pd.DataFrame, path: str):
+    """
+    write df as uncompressed Arrow IPC file, index and pandas dtypes are kept in the schema metadata
+    string[pyarrow] columns are listed separately, they are restored without conversion
+    """
+    table = pa.Table.from_pandas(df)
+    arrow_string_columns = [
+        column for column in df.columns if df[column].dtype == ARROW_STRING_DTYPE
+    ]
+    table = table.replace_schema_metadata(
+        {
+            **table.schema.metadata,
+            ARROW_STRING_KEY: json.dumps(arrow_string_columns).encode(),
+        }
+    )
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_partition(path: str) -> pd.DataFrame:
+    """
+    memory-map Arrow IPC file and convert it back into the pandas df that was written
+    """
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    arrow_string_columns = json.loads(table.schema.metadata[ARROW_STRING_KEY])
+    # string[pyarrow] columns wrap the mapped buffers, no python strings are created
+    arrow_strings = {}
+    for column in arrow_string_columns:
+        i = table.schema.get_field_index(column)
+        arrow_strings[column] = table.column(i)
+        table = table.set_column(i, column, pa.nulls(len(table)))
+    # split_blocks: numeric columns without nulls keep pointing into the mapped file,
+    # processes mapping the same snapshot share these pages instead of holding own copies
+    df = table.to_pandas(split_blocks=True)
+    # column labels as plain object index, string dtype labels break pandas comparisons
+    df.columns = pd.Index(list(df.columns), dtype=object)
+    for column, values in arrow_strings.items():
+        df[column] = pd.arrays.ArrowStringArray(values)
+    return df
+
+
+class VersionLock:
+    """
+    shared lock (flock) on a snapshot version, held as long as the lock object is referenced
+    the kernel releases the lock when the process exits, also after crashes
+    forked workers inherit the lock of their parent
+
+    ...
+    Attributes
+    ----------
+    fd: file descriptor of the locked READER_LOCK_NAME file in the version directory
+    """
+
+    def __init__(self, version_path: str):
+        self.fd = os.open(
+            os.path.join(version_path, READER_LOCK_NAME), os.O_RDONLY | os.O_CREAT
+        )
+        self._finalizer = weakref.finalize(self, os.close, self.fd)
+        fcntl.flock(self.fd, fcntl.LOCK_SH)
+
+    def release(self):
+        self._finalizer()
+
+
+def is_version_locked(version_path: str) -> bool:
+    """
+    :return: True if a process holds a VersionLock on the snapshot version
+    """
+    try:
+        fd = os.open(os.path.join(version_path, READER_LOCK_NAME), os.O_RDONLY)
+    except FileNotFoundError:
+        # written before locks were used or removed in the meantime
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+class LazyPartitionDict(Mapping):
+    """
+    read-only dict used instead of processed_df_dict when loading a snapshot
+    same nested key structure, partitions are read from disk at first access and kept afterwards
+    the version is locked as long as the dict is used -> its files are not removed by rebuilds
+
+    ...
+    Attributes
+    ----------
+    snapshot_path: directory of snapshot version
+    entries: dict{key: LazyPartitionDict OR file name of partition}
+    lock: VersionLock on snapshot_path, shared by all nested dicts
+    """
+
+    def __init__(self, snapshot_path: str, lock: VersionLock = None):
+        self.snapshot_path = snapshot_path
+        self.entries = {}
+        self.lock = lock
+        self._loaded = {}
+
+    def add_partition(self, keys: list, file_name: str):
+        key = keys[0]
+        if len(keys) == 1:
+            self.entries[key] = file_name
+        else:
+            if key not in self.entries:
+                self.entries[key] = LazyPartitionDict(self.snapshot_path, self.lock)
+            self.entries[key].add_partition(keys[1:], file_name)
+
+    def __getitem__(self, key):
+        entry = self.entries[key]
+        if isinstance(entry, LazyPartitionDict):
+            return entry
+        if key not in self._loaded:
+            self._loaded[key] = read_partition(os.path.join(self.snapshot_path, entry))
+        return self._loaded[key]
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def get_dataset_version(df_dict) -> str:
+    """
+    :param df_dict: processed_df_dict of load_all_sql_files
+    :return: snapshot version of df_dict, None if df_dict was not loaded from a snapshot
+    """
+    if isinstance(df_dict, LazyPartitionDict):
+        return os.path.basename(os.path.normpath(df_dict.snapshot_path))
+    return None
+
+
+def read_manifest(snapshot_dir: str) -> dict:
+    """
+    :return: manifest of current snapshot, None if no snapshot was published
+    """
+    manifest_path = os.path.join(snapshot_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as handle:
+        return json.load(handle)
+
+
+def remove_old_versions(
+    snapshot_dir: str, current_version: str, keep: int = KEEP_VERSIONS
+):
+    """
+    delete all but the newest keep snapshot versions, the current version is never deleted
+    versions locked by running workers are kept until a later rebuild finds them unlocked
+    version names start with their creation time, so sorting them sorts by age
+    hidden directories are versions still being copied by publish_snapshot
+    """
+    versions = sorted(
+        entry.name
+        for entry in os.scandir(snapshot_dir)
+        if entry.is_dir()
+        and entry.name != current_version
+        and not entry.name.startswith(".")
+    )
+    for version in versions[: len(versions) - keep + 1]:
+        version_path = os.path.join(snapshot_dir, version)
+        if not is_version_locked(version_path):
+            shutil.rmtree(version_path, ignore_errors=True)
+
+
+def write_snapshot(
+    df_dict: dict, snapshot_dir: str, high_water_mark: dict = None
+) -> str:
+    """
+    write every partition of processed_df_dict into a new version directory, then publish
+    the version by replacing manifest.json atomically -> workers never see half written snapshots
+
+    :param df_dict: processed_df_dict of load_all_sql_files
+    :param snapshot_dir: directory containing manifest and snapshot versions
+    :param high_water_mark: last imported samples contained in df_dict,
+        start of the next incremental rebuild
+    :return: version of written snapshot
+    """
+    version = f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid4().hex[:8]}"
+    version_path = os.path.join(snapshot_dir, version)
+    os.makedirs(version_path)
+    partitions = []
+    for keys, df in iter_partitions(df_dict):
+        file_name = partition_file_name(keys)
+        write_partition(df, os.path.join(version_path, file_name))
+        partitions.append({"keys": list(keys), "file": file_name, "rows": len(df)})
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "partitions": partitions,
+        "high_water_mark": high_water_mark,
+    }
+    write_manifest(manifest, snapshot_dir)
+    logging_radar.info(f"Snapshot {version} written: {len(partitions)} partitions")
+    return version
+
+
+def write_manifest(manifest: dict, snapshot_dir: str):
+    """
+    publish snapshot version of manifest by replacing manifest.json atomically,
+    afterwards outdated versions are removed
+    """
+    version = manifest["version"]
+    tmp_manifest_path = os.path.join(snapshot_dir, f".{MANIFEST_NAME}.{version}")
+    with open(tmp_manifest_path, "w") as handle:
+        json.dump(manifest, handle, indent=1)
+    os.replace(tmp_manifest_path, os.path.join(snapshot_dir, MANIFEST_NAME))
+    remove_old_versions(snapshot_dir, version)
+
+
+def publish_snapshot(snapshot_dir: str, shm_dir: str) -> str:
+    """
+    copy current snapshot version into shared memory (tmpfs, e.g. /dev/shm/mpxradar)
+    all workers memory-map the same copy -> the dataset is held once in RAM
+    independent of the number of workers and never read from disk again
+    several workers can publish at the same time, the version directory is renamed atomically
+
+    :param snapshot_dir: directory of snapshot written by write_snapshot
+    :param shm_dir: directory on tmpfs
+    :return: published version, None if no snapshot was written
+    """
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None:
+        return None
+    version = manifest["version"]
+    shm_manifest = read_manifest(shm_dir)
+    if shm_manifest and shm_manifest["version"] == version:
+        return version
+    os.makedirs(shm_dir, exist_ok=True)
+    version_path = os.path.join(shm_dir, version)
+    if not os.path.exists(version_path):
+        tmp_path = os.path.join(shm_dir, f".{version}.{uuid4().hex[:8]}")
+        shutil.copytree(
+            os.path.join(snapshot_dir, version),
+            tmp_path,
+            ignore=shutil.ignore_patterns(READER_LOCK_NAME),
+        )
+        try:
+            os.rename(tmp_path, version_path)
+        except OSError:
+            # published by another worker in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    write_manifest(manifest, shm_dir)
+    logging_radar.info(f"Snapshot {version} published to {shm_dir}")
+    return version
+
+
+def load_snapshot(snapshot_dir: str, lazy: bool = True):
+    """
+    :param snapshot_dir: directory containing manifest and snapshot versions
+    :param lazy: True -> partitions are read at first access, False -> read all partitions now
+    :return: LazyPartitionDict with same structure as processed_df_dict,
+        None if no snapshot was published or the files of its version are missing
+    """
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None or manifest.get("format") != SNAPSHOT_FORMAT:
+        return None
+    version_path = os.path.join(snapshot_dir, manifest["version"])
+    try:
+        lock = VersionLock(version_path)
+    except FileNotFoundError:
+        lock = None
+    if lock is None or not all(
+        os.path.exists(os.path.join(version_path, partition["file"]))
+        for partition in manifest["partitions"]
+    ):
+        if lock is not None:
+            lock.release()
+        # outdated version removed after reading the manifest -> load the new version
+        new_manifest = read_manifest(snapshot_dir)
+        if new_manifest and new_manifest["version"] != manifest["version"]:
+            return load_snapshot(snapshot_dir, lazy)
+        # files of the published version are missing -> the snapshot has to be rebuilt
+        logging_radar.warning(f"Snapshot {manifest['version']} is incomplete")
+        return None
+    df_dict = LazyPartitionDict(version_path, lock)
+    for partition in manifest["partitions"]:
+        df_dict.add_partition(partition["keys"], partition["file"])
+    if not lazy:
+        for _keys, _df in iter_partitions(df_dict):
+            pass
+    return df_dict
+
+
+def to_nested_dict(df_dict) -> dict:
+    """
+    read all partitions of a (lazy) processed_df_dict into a nested dict of dataframes,
+    e.g. to update a loaded snapshot
+
+    :return: dict with same structure as processed_df_dict
+    """
+    nested_dict = {}
+    for keys, df in iter_partitions(df_dict):
+        parent = nested_dict
+        for key in keys[:-1]:
+            parent = parent.setdefault(key, {})
+        parent[keys[-1]] = df
+    return nested_dict
@@ -1,11 +1,121 @@
 from datetime import datetime
+import math
+import operator
+import re
 
+import numpy as np
 import pandas as pd
 
+from pages.utils_filters import select_profile_dfs
+from pages.utils_filters import select_property_index_dfs
 from pages.utils_filters import select_propertyView_dfs
-from pages.utils_filters import select_variantView_dfs
+from pages.utils_filters import select_variant_index_dfs
+from pages.utils_sample_index import count_samples_by_value
+from pages.utils_sample_index import intersect_samples
+from pages.utils_sample_index import SAMPLE_ID_TYPE
+from pages.utils_sample_index import select_samples
+from pages.utils_sample_index import select_samples_in_range
+from pages.utils_sample_index import unique_sample_ids
+from pages.utils_worldMap_explorer import DATE_ORDINAL_COLUMN
 from pages.utils_worldMap_explorer import DateSlider
 
+# explore table columns of the precomputed profiles, only joined for the visible page
+# unless the table is sorted or filtered by them
+VARIANT_TABLE_COLUMNS = ["NUC_PROFILE", "AA_PROFILE", "REFERENCE_ACCESSION"]
+# one condition of a DataTable filter_query, e.g. "{COUNTRY} scontains Germany"
+FILTER_PART_PATTERN = re.compile(
+    r"^\{(?P<column>[^}]+)\}\s+(?P<case>[is]?)"
+    r"(?P<operator>contains|datestartswith|>=|<=|!=|=|<|>|ge|le|ne|eq|lt|gt)"
+    r"\s+(?P<value>.+)$",
+    re.IGNORECASE,
+)
+FILTER_OPERATORS = {"ge": ">=", "le": "<=", "ne": "!=", "eq": "=", "lt": "<", "gt": ">"}
+FILTER_FUNCTIONS = {
+    "contains": lambda values, value: values.str.contains(value, regex=False),
+    "datestartswith": lambda values, value: values.str.startswith(value),
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def parse_filter_query(filter_query: str) -> list[tuple]:
+    """
+    :param filter_query: filter_query of a DataTable with filter_action="custom",
+        e.g. '{COUNTRY} scontains Germany && {LENGTH} > 190000'
+    :return: list of (column, operator, value, case_sensitive),
+        unsupported conditions (e.g. "is blank") are skipped
+    """
+    conditions = []
+    for part in (filter_query or "").split(" && "):
+        match = FILTER_PART_PATTERN.match(part.strip())
+        if match is None:
+            continue
+        value = match["value"].strip()
+        if len(value) > 1 and value[0] == value[-1] and value[0] in "\"'`":
+            value = value[1:-1]
+        filter_operator = match["operator"].lower()
+        conditions.append(
+            (
+                match["column"],
+                FILTER_OPERATORS.get(filter_operator, filter_operator),
+                value,
+                match["case"].lower() != "i",
+            )
+        )
+    return conditions
+
+
+def filter_table_df(df: pd.DataFrame, filter_query: str) -> pd.DataFrame:
+    """
+    apply the filter_query of a DataTable to df, numeric columns are compared
+    as numbers, all others as strings
+
+    :return: rows of df matching all conditions
+    """
+    for column, filter_operator, value, case_sensitive in parse_filter_query(
+        filter_query
+    ):
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values) and filter_operator not in [
+            "contains",
+            "datestartswith",
+        ]:
+            try:
+                value = float(value)
+            except ValueError:
+                return df.iloc[0:0]
+        else:
+            values = values.astype(str)
+            if not case_sensitive:
+                values = values.str.lower()
+                value = value.lower()
+        mask = FILTER_FUNCTIONS[filter_operator](values, value)
+        df = df[mask & df[column].notna()]
+    return df
+
+
+def sort_table_df(df: pd.DataFrame, sort_by: list[dict]) -> pd.DataFrame:
+    """
+    :param sort_by: sort_by of a DataTable with sort_action="custom",
+        [{"column_id": column, "direction": "asc" or "desc"}]
+    :return: df sorted by sort_by and sample.name, missing values last
+    """
+    sort_by = [x for x in sort_by or [] if x["column_id"] in df.columns]
+    columns = [x["column_id"] for x in sort_by]
+    ascending = [x["direction"] == "asc" for x in sort_by]
+    if "sample.name" not in columns:
+        columns.append("sample.name")
+        ascending.append(True)
+    return df.sort_values(
+        columns, ascending=ascending, kind="mergesort", na_position="last"
+    )
+
 
 # table results for filter
 class TableFilter(object):
@@ -72,7 +182,7 @@ class TableFilter(object):
         elif table_type == "compare":
             self.table_columns = [
                 "sample.name",
-                "variant.label",
+                "NUC_PROFILE",
                 "IMPORTED",
                 "COLLECTION_DATE",
                 "RELEASE_DATE",
@@ -83,7 +193,7 @@ class TableFilter(object):
                 "GEO_LOCATION",
                 "HOST",
                 "GENOME_COMPLETENESS",
-                "reference.accession",
+                "REFERENCE_ACCESSION",
             ]
 
             self.aa_nt_radio = aa_nt_radio
@@ -93,132 +203,108 @@ class TableFilter(object):
             self.end_date = end_date
             if aa_nt_radio == "cds":
                 self.variant_col = "gene:variant"
-                self.table_columns[1] = "gene:variant"
+                self.table_columns[1] = "AA_PROFILE"
             elif aa_nt_radio == "source":
                 self.variant_col = "variant.label"
 
     def _get_samples_by_filters(
         self,
-        propertyView_dfs: list[pd.DataFrame],
-        variantView_dfs: list[pd.DataFrame],
+        df_dict: dict,
+        complete_partial_radio: str,
+        reference_id: int,
         seq_tech_list: list[str],
         dates: list[datetime.date],
         countries: list[str],
-    ) -> set[int]:
-        """
-        :return: set of sample ids with matching seq techs, dates and countries
-        """
-        sample_set = set()
-        for i, df in enumerate(variantView_dfs):
-            samples = set(
-                propertyView_dfs[i][
-                    propertyView_dfs[i]["COLLECTION_DATE"].isin(dates)
-                    & propertyView_dfs[i]["SEQ_TECH"].isin(seq_tech_list)
-                    & propertyView_dfs[i]["COUNTRY"].isin(countries)
-                ]["sample.id"]
+    ) -> np.ndarray:
+        """
+        :return: sorted array of sample ids with matching seq techs, dates, countries
+            and mutations
+        """
+        property_filters = {
+            "SEQ_TECH": seq_tech_list,
+            "COUNTRY": countries,
+        }
+        sample_ids = [
+            select_samples(
+                select_property_index_dfs(df_dict, complete_partial_radio, column),
+                column,
+                values,
             )
-            sample_set = sample_set.union(
-                set(
-                    df[
-                        df["sample.id"].isin(samples)
-                        & df["gene:variant"].isin(self.mut_value)
-                    ]["sample.id"]
+            for column, values in property_filters.items()
+        ]
+        if len(dates):
+            sample_ids.append(
+                select_samples_in_range(
+                    select_property_index_dfs(
+                        df_dict, complete_partial_radio, "COLLECTION_DATE"
+                    ),
+                    "COLLECTION_DATE",
+                    min(dates),
+                    max(dates),
                 )
             )
-        return sample_set
+        else:
+            sample_ids.append(np.empty(0, dtype=SAMPLE_ID_TYPE))
+        sample_ids.append(
+            select_samples(
+                select_variant_index_dfs(
+                    df_dict, complete_partial_radio, reference_id, "cds", "gene:variant"
+                ),
+                "gene:variant",
+                self.mut_value,
+            )
+        )
+        return intersect_samples(*sample_ids)
 
     def get_samples_by_mutation(
-        self, propertyView_dfs: list[pd.DataFrame], variantView_dfs: list[pd.DataFrame]
-    ) -> set[int]:
-        """
-        :return: set of sample ids with matching mutations
-        """
-        new_samples = set()
-        for i, df in enumerate(variantView_dfs):
-            samples = set(propertyView_dfs[i]["sample.id"])
-            new_samples = new_samples.union(
-                set(
-                    df[
-                        df["sample.id"].isin(samples)
-                        & df[self.variant_col].isin(self.mut_value)
-                    ]["sample.id"]
-                )
-            )
-        return new_samples
+        self,
+        propertyView_dfs: list[pd.DataFrame],
+        variant_index_dfs: list[pd.DataFrame],
+    ) -> np.ndarray:
+        """
+        :param variant_index_dfs: variant_index dfs of column variant_col
+        :return: sorted array of sample ids of propertyView_dfs with matching mutations
+        """
+        samples = unique_sample_ids(
+            df["sample.id"].to_numpy(dtype=SAMPLE_ID_TYPE) for df in propertyView_dfs
+        )
+        return intersect_samples(
+            samples, select_samples(variant_index_dfs, self.variant_col, self.mut_value)
+        )
 
-    def _merge_variantView_with_propertyView(
-        self, variantView: pd.DataFrame, propertyView: pd.DataFrame
+    def _merge_profiles_with_propertyView(
+        self, profiles: pd.DataFrame, propertyView: pd.DataFrame
     ) -> pd.DataFrame:
         return pd.merge(
-            variantView, propertyView, how="inner", on=["sample.id", "sample.name"]
+            profiles, propertyView, how="inner", on=["sample.id", "sample.name"]
         )
 
-    def concat_and_merge_tables(
-        self, variantView_dfs: list[pd.DataFrame], propertyView_dfs: list[pd.DataFrame]
-    ):
-        return pd.concat(
-            [
-                self._merge_variantView_with_propertyView(
-                    variantView_dfs[i], propertyView_dfs[i]
-                )
-                for i in range(len(variantView_dfs))
-            ],
-            ignore_index=True,
-            axis=0,
-        )[self.table_columns]
-
-    def combine_labels_by_sample_and_rename_columns(
-        self, df: pd.DataFrame, aa_nt: str
+    def _select_profiles(
+        self, profile_dfs: list[pd.DataFrame], samples: np.ndarray
     ) -> pd.DataFrame:
         """
-        :returns: df with only one row per sample
-            -> all variants combined into one comma sep string in AA_PROFILE or NUC_PROFILE column
+        :param profile_dfs: precomputed profile dfs, see select_profile_dfs
+        :return: profiles of samples, AA_PROFILE and NUC_PROFILE as plain string columns
         """
-        if self.table_type == "explorer":
-            column_names = [
-                "sample.name",
-                "sample.id",
-                "reference.id",
-                "reference.accession",
-            ]
-            if aa_nt == "cds":
-                column_names.append("gene:variant")
-            elif aa_nt == "source":
-                column_names.append("variant.label")
-            df = df[column_names]
-        elif self.table_type == "compare":
-            column_names = list(df.columns)
-        if aa_nt == "cds":
-            column_names.remove("gene:variant")
-            df = (
-                df.groupby(column_names, dropna=False, group_keys=True)["gene:variant"]
-                .apply(lambda x: ",".join([str(y) for y in set(x)]))
-                .reset_index()
-                .rename(columns={"gene:variant": "AA_PROFILE"})
-            )[["sample.name", "AA_PROFILE"] + column_names[1:]]
-        elif aa_nt == "source":
-            column_names.remove("variant.label")
-            df = (
-                df.groupby(column_names, dropna=False, group_keys=True)["variant.label"]
-                .apply(lambda x: ",".join([str(y) for y in set(x)]))
-                .reset_index()
-                .rename(columns={"variant.label": "NUC_PROFILE"})
-            )[["sample.name", "NUC_PROFILE"] + column_names[1:]]
-        df = df.rename(columns={"reference.accession": "REFERENCE_ACCESSION"})
-        return df
+        df = pd.concat(
+            [df[df["sample.id"].isin(samples)] for df in profile_dfs],
+            ignore_index=True,
+            axis=0,
+        )
+        return df.astype({"AA_PROFILE": object, "NUC_PROFILE": object})
 
     def filter_propertyView(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         filter propertyView by dates, seq techs, countries
         """
-        date_list = DateSlider.get_all_dates(
+        date_range = DateSlider.get_date_range(
             datetime.strptime(self.start_date, "%Y-%m-%d").date(),
             datetime.strptime(self.end_date, "%Y-%m-%d").date(),
         )
         return df[
             (df["SEQ_TECH"].isin(self.seqtech))
             & (df["COUNTRY"].isin(self.countries))
-            & (df["COLLECTION_DATE"].isin(date_list))
+            & DateSlider.date_range_mask(df[DATE_ORDINAL_COLUMN], date_range)
         ]
 
     def create_explore_table(
@@ -231,113 +317,233 @@ class TableFilter(object):
         countries: list[str],
     ) -> pd.DataFrame:
         """
-        filter dfs by user input, combine variants into one string, naming and ordering columns
+        filter dfs by user input, join precomputed profiles, naming and ordering columns
 
         :param df_dict: all pre-processed dfs
         :param complete_partial_radio: complete OR partial (partial= using complete AND partial dfs)
         :param mutation_list: user selected mutations of style "gene:variant"
         :param seq_tech_list: user selected seq tech list
         :param reference_id: id of reference sequence
-        :param dates: list of dates (date slider chosen date + interval)
+        :param dates: (first date, last date) of date slider chosen date + interval,
+            a list of all dates of the interval works as well
         :param countries:  user selected country list
         :return: df explore table
         """
-        variantView_dfs_cds = select_variantView_dfs(
-            df_dict, complete_partial_radio, reference_id, "cds"
+        samples = self._get_samples_by_filters(
+            df_dict,
+            complete_partial_radio,
+            reference_id,
+            seq_tech_list,
+            dates,
+            countries,
         )
-        variantView_dfs_source = select_variantView_dfs(
-            df_dict, complete_partial_radio, reference_id, "source"
+        df = self._get_explore_profiles(
+            df_dict, complete_partial_radio, reference_id, samples
         )
         propertyView_dfs = select_propertyView_dfs(df_dict, complete_partial_radio)
-        samples = self._get_samples_by_filters(
-            propertyView_dfs, variantView_dfs_cds, seq_tech_list, dates, countries
+        propertyView_df = pd.concat(propertyView_dfs, ignore_index=True, axis=0)
+        df = self._merge_profiles_with_propertyView(df, propertyView_df)
+        df = df[self.table_columns]
+        if df.empty:
+            df = pd.DataFrame(columns=self.table_columns)
+        return df
+
+    def _get_explore_profiles(
+        self,
+        df_dict: dict,
+        complete_partial_radio: str,
+        reference_id: int,
+        samples: np.ndarray,
+    ) -> pd.DataFrame:
+        """
+        :return: df with columns ["sample.name", "sample.id", "reference.id",
+            "REFERENCE_ACCESSION", "AA_PROFILE", "NUC_PROFILE"] for samples
+        """
+        return self._select_profiles(
+            select_profile_dfs(df_dict, complete_partial_radio, reference_id), samples
         )
-        variantView_dfs_cds = [
-            variantView[variantView["sample.id"].isin(samples)]
-            for variantView in variantView_dfs_cds
-        ]
-        variantView_dfs_source = [
-            variantView[variantView["sample.id"].isin(samples)]
-            for variantView in variantView_dfs_source
+
+    def get_explore_samples(
+        self,
+        df_dict: dict,
+        complete_partial_radio: str,
+        seq_tech_list: list[str],
+        reference_id: int,
+        dates: list[datetime.date],
+        countries: list[str],
+    ) -> np.ndarray:
+        """
+        samples of the explore table, see create_explore_table for the parameters
+
+        :return: sorted array of sample ids
+        """
+        return self._get_samples_by_filters(
+            df_dict,
+            complete_partial_radio,
+            reference_id,
+            seq_tech_list,
+            dates,
+            countries,
+        )
+
+    def create_explore_table_page(
+        self,
+        df_dict: dict,
+        complete_partial_radio: str,
+        reference_id: int,
+        samples: np.ndarray,
+        page_current: int,
+        page_size: int,
+        sort_by: list[dict] = None,
+        filter_query: str = "",
+    ) -> (pd.DataFrame, int):
+        """
+        one page of the explore table for a DataTable with custom paging, sorting
+        and filtering, profiles are only joined for the rows of the page
+        unless the table is sorted or filtered by them
+
+        :param samples: sample ids of get_explore_samples
+        :param page_current: page number, starting with 0
+        :param page_size: rows per page
+        :param sort_by: sort_by of the DataTable
+        :param filter_query: filter_query of the DataTable
+        :return: df explore table rows of the page (same columns as create_explore_table)
+        :return: number of pages
+        """
+        propertyView_dfs = select_propertyView_dfs(df_dict, complete_partial_radio)
+        df = pd.concat(
+            [df[df["sample.id"].isin(samples)] for df in propertyView_dfs],
+            ignore_index=True,
+            axis=0,
+        )
+        used_columns = [x["column_id"] for x in sort_by or []] + [
+            x[0] for x in parse_filter_query(filter_query)
         ]
-        table_dfs_cds = []
-        for variantView in variantView_dfs_cds:
-            result_df = self.combine_labels_by_sample_and_rename_columns(
-                variantView, "cds"
+        profiles_first = any(x in VARIANT_TABLE_COLUMNS for x in used_columns)
+        if profiles_first:
+            df = self._merge_profiles_with_propertyView(
+                self._get_explore_profiles(
+                    df_dict, complete_partial_radio, reference_id, samples
+                ),
+                df,
             )
-            table_dfs_cds.append(result_df)
-        table_df_cds = pd.concat(table_dfs_cds, ignore_index=True, axis=0)
-        table_dfs_source = []
-        for variantView in variantView_dfs_source:
-            result_df = self.combine_labels_by_sample_and_rename_columns(
-                variantView, "source"
+        df = sort_table_df(filter_table_df(df, filter_query), sort_by)
+        page_count = max(1, math.ceil(len(df) / page_size))
+        df = df.iloc[page_current * page_size : (page_current + 1) * page_size]
+        if not profiles_first:
+            df = self._merge_profiles_with_propertyView(
+                self._get_explore_profiles(
+                    df_dict,
+                    complete_partial_radio,
+                    reference_id,
+                    df["sample.id"].to_numpy(),
+                ),
+                df,
             )
-            table_dfs_source.append(result_df)
-        table_df_source = pd.concat(table_dfs_source, ignore_index=True, axis=0)
-        df = pd.merge(
-            table_df_cds,
-            table_df_source,
-            how="outer",
-            on=["sample.id", "sample.name", "REFERENCE_ACCESSION", "reference.id"],
+            df = sort_table_df(df, sort_by)
+        df = df[self.table_columns]
+        if df.empty:
+            df = pd.DataFrame(columns=self.table_columns)
+        return df, page_count
+
+    def create_explore_table_export(
+        self,
+        df_dict: dict,
+        complete_partial_radio: str,
+        reference_id: int,
+        samples: np.ndarray,
+        sort_by: list[dict] = None,
+        filter_query: str = "",
+    ) -> pd.DataFrame:
+        """
+        all rows of the explore table in the order of its pages, e.g. for the csv export
+        of a DataTable with custom paging, see create_explore_table_page for the parameters
+
+        :return: df explore table (same columns as create_explore_table)
+        """
+        propertyView_dfs = select_propertyView_dfs(df_dict, complete_partial_radio)
+        df = pd.concat(
+            [df[df["sample.id"].isin(samples)] for df in propertyView_dfs],
+            ignore_index=True,
+            axis=0,
         )
-        propertyView_df = pd.concat(propertyView_dfs, ignore_index=True, axis=0)
-        df = self._merge_variantView_with_propertyView(df, propertyView_df)
+        df = self._merge_profiles_with_propertyView(
+            self._get_explore_profiles(
+                df_dict, complete_partial_radio, reference_id, samples
+            ),
+            df,
+        )
+        df = sort_table_df(filter_table_df(df, filter_query), sort_by)
         df = df[self.table_columns]
         if df.empty:
             df = pd.DataFrame(columns=self.table_columns)
         return df
 
+    def _create_compare_table(
+        self,
+        profile_dfs: list[pd.DataFrame],
+        propertyView_dfs: list[pd.DataFrame],
+        samples: np.ndarray,
+    ) -> pd.DataFrame:
+        """
+        :return: compare table with profiles and properties of samples, sorted by sample name
+        """
+        propertyView = pd.concat(
+            propertyView_dfs, ignore_index=True, axis=0
+        ).drop_duplicates("sample.id")
+        df = self._merge_profiles_with_propertyView(
+            self._select_profiles(profile_dfs, samples), propertyView
+        )
+        df = df[df[self.table_columns[1]].notna()]
+        return df.sort_values("sample.name", kind="mergesort")[
+            self.table_columns
+        ].reset_index(drop=True)
+
     def create_compare_table_left_and_right(
-        self, variantView_dfs: list[pd.DataFrame], propertyView_dfs: list[pd.DataFrame]
+        self,
+        profile_dfs: list[pd.DataFrame],
+        propertyView_dfs: list[pd.DataFrame],
+        variant_index_dfs: list[pd.DataFrame],
     ) -> pd.DataFrame:
         """
         to allow a complete mutation PROFILE filtering must be done by samples
         and not directly by mutations
 
+        :param profile_dfs: precomputed profile dfs, see select_profile_dfs
+        :param variant_index_dfs: variant_index dfs of column variant_col
         :return: compare table for mutations unique for left or right selection
         """
-        samples = self.get_samples_by_mutation(propertyView_dfs, variantView_dfs)
-        variantView_dfs = [df[df["sample.id"].isin(samples)] for df in variantView_dfs]
-        table_df = self.concat_and_merge_tables(variantView_dfs, propertyView_dfs)
-        table_df = self.combine_labels_by_sample_and_rename_columns(
-            table_df, self.aa_nt_radio
-        )
-        return table_df
+        samples = self.get_samples_by_mutation(propertyView_dfs, variant_index_dfs)
+        return self._create_compare_table(profile_dfs, propertyView_dfs, samples)
 
     def create_compare_table_both(
         self,
-        variantView_dfs: list[pd.DataFrame],
+        profile_dfs: list[pd.DataFrame],
         propertyView_dfs_left: list[pd.DataFrame],
         propertyView_dfs_right: list[pd.DataFrame],
-    ) -> (pd.DataFrame, set[int], set[int]):
+        variant_index_dfs: list[pd.DataFrame],
+    ) -> (pd.DataFrame, np.ndarray, np.ndarray):
         """
         to allow a complete mutation PROFILE filtering must be done by samples
         and not directly by mutations
 
+        :param profile_dfs: precomputed profile dfs, see select_profile_dfs
+        :param variant_index_dfs: variant_index dfs of column variant_col
         :return: compare table for mutations shared by both selections
         :return: samples of left selection with mutation contained in both selections
         :return: samples of right selection with mutation contained in both selections
         """
         samples_left_both = self.get_samples_by_mutation(
             propertyView_dfs_left,
-            variantView_dfs,
+            variant_index_dfs,
         )
         samples_right_both = self.get_samples_by_mutation(
             propertyView_dfs_right,
-            variantView_dfs,
-        )
-        samples = samples_left_both.union(samples_right_both)
-
-        variantView_dfs = [df[df["sample.id"].isin(samples)] for df in variantView_dfs]
-        table_df_l = self.concat_and_merge_tables(
-            variantView_dfs, propertyView_dfs_left
-        )
-        table_df_r = self.concat_and_merge_tables(
-            variantView_dfs, propertyView_dfs_right
+            variant_index_dfs,
         )
-        table_df = pd.concat([table_df_l, table_df_r], ignore_index=True, axis=0)
-        table_df = self.combine_labels_by_sample_and_rename_columns(
-            table_df, self.aa_nt_radio
+        samples = unique_sample_ids([samples_left_both, samples_right_both])
+        table_df = self._create_compare_table(
+            profile_dfs, propertyView_dfs_left + propertyView_dfs_right, samples
         )
         return table_df, samples_left_both, samples_right_both
 
@@ -385,31 +591,17 @@ class OverviewTable:
 
     def _filter_for_samples_and_group_by_variant(
         self,
-        samples: set,
+        samples: np.ndarray,
         mut: list,
-        variantView_dfs: list[pd.DataFrame],
+        variant_index_dfs: list[pd.DataFrame],
         col_name: str,
     ) -> pd.DataFrame:
         """
-        filter variantView by samples and mutations and group by variant, count samples per variant
+        count samples per variant for selected samples and mutations
         """
-        filtered_variantView_df = pd.concat(
-            [
-                df[df["sample.id"].isin(samples) & df[self.variant_col].isin(mut)][
-                    [self.variant_col, "sample.id"]
-                ]
-                for df in variantView_dfs
-            ],
-            ignore_index=True,
-            axis=0,
-        )
-        grouped_df = (
-            filtered_variantView_df.groupby([self.variant_col])
-            .size()
-            .reset_index()
-            .rename(columns={0: col_name})
-        )
-        return grouped_df
+        return count_samples_by_value(
+            variant_index_dfs, self.variant_col, mut, samples
+        ).rename(columns={"count": col_name})
 
     def _sort_by_sum_of_both_frequencies(
         self, variantView_df_overview_both: pd.DataFrame
@@ -434,19 +626,21 @@ class OverviewTable:
     def count_shared_mutation_in_left_and_right_selection(
         self,
         mut_value_both: list[str],
-        samples_left: set[int],
-        samples_right: set[int],
-        variantView_dfs: list[pd.DataFrame],
+        samples_left: np.ndarray,
+        samples_right: np.ndarray,
+        variant_index_dfs: list[pd.DataFrame],
     ) -> pd.DataFrame:
         """
         count nb seq in both for left and right selection --> used in actualize_overview_table
+
+        :param variant_index_dfs: variant_index dfs of column variant_col
         """
         variantView_df_both_left = self._filter_for_samples_and_group_by_variant(
-            samples_left, mut_value_both, variantView_dfs, "freq l"
+            samples_left, mut_value_both, variant_index_dfs, "freq l"
         )
 
         variantView_df_both_right = self._filter_for_samples_and_group_by_variant(
-            samples_right, mut_value_both, variantView_dfs, "freq r"
+            samples_right, mut_value_both, variant_index_dfs, "freq r"
         )
         variantView_df_overview_both = pd.merge(
             variantView_df_both_left,
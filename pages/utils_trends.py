@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+# Newton steps of the Poisson regression, converges within a few steps for daily counts
+POISSON_MAX_ITERATIONS = 50
+POISSON_TOLERANCE = 1e-10
+
+
+def _group_sums(
+    group_codes: np.ndarray, n_groups: int, values: np.ndarray
+) -> np.ndarray:
+    """
+    :return: sum of values per group, array of length n_groups
+    """
+    return np.bincount(group_codes, weights=values, minlength=n_groups)
+
+
+def linear_regression_slopes(
+    x: np.ndarray, y: np.ndarray, group_codes: np.ndarray, n_groups: int
+) -> np.ndarray:
+    """
+    least squares slopes of y over x for all groups at once,
+    closed form from the grouped sums n, Σx, Σy, Σxy and Σx²
+    same slopes as scipy.stats.linregress per group
+
+    :param x: day offsets, integers keep the sums exact
+    :param y: number of sequences per day
+    :param group_codes: group of each row, 0 <= group_codes < n_groups
+    :return: slope per group, 0 for groups with one day or constant y
+    """
+    n = np.bincount(group_codes, minlength=n_groups)
+    sum_x = _group_sums(group_codes, n_groups, x)
+    sum_y = _group_sums(group_codes, n_groups, y)
+    sum_xy = _group_sums(group_codes, n_groups, x * y)
+    sum_xx = _group_sums(group_codes, n_groups, x * x)
+    numerator = n * sum_xy - sum_x * sum_y
+    denominator = n * sum_xx - sum_x * sum_x
+    slopes = np.zeros(n_groups)
+    np.divide(numerator, denominator, out=slopes, where=denominator > 0)
+    return slopes
+
+
+def poisson_growth_rates(
+    x: np.ndarray, y: np.ndarray, group_codes: np.ndarray, n_groups: int
+) -> np.ndarray:
+    """
+    growth rates of a log-linear Poisson regression y ~ exp(a + b * x) for all groups at once,
+    Newton steps on the grouped sums of all groups together
+
+    :param x: day offsets
+    :param y: number of sequences per day
+    :param group_codes: group of each row, 0 <= group_codes < n_groups
+    :return: daily growth rate b per group, 0 for groups with one day
+    """
+    n = np.bincount(group_codes, minlength=n_groups)
+    sum_y = _group_sums(group_codes, n_groups, y)
+    # centered x: a is the log mean of the group, a and b are uncorrelated at the start
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = x - (_group_sums(group_codes, n_groups, x) / n)[group_codes]
+        a = np.log(sum_y / n)
+    b = np.zeros(n_groups)
+    for _ in range(POISSON_MAX_ITERATIONS):
+        mu = np.exp(a[group_codes] + b[group_codes] * x)
+        residual = y - mu
+        gradient_a = _group_sums(group_codes, n_groups, residual)
+        gradient_b = _group_sums(group_codes, n_groups, x * residual)
+        hessian_aa = _group_sums(group_codes, n_groups, mu)
+        hessian_ab = _group_sums(group_codes, n_groups, x * mu)
+        hessian_bb = _group_sums(group_codes, n_groups, x * x * mu)
+        determinant = hessian_aa * hessian_bb - hessian_ab * hessian_ab
+        step_a = np.zeros(n_groups)
+        step_b = np.zeros(n_groups)
+        solvable = determinant > 0
+        np.divide(
+            hessian_bb * gradient_a - hessian_ab * gradient_b,
+            determinant,
+            out=step_a,
+            where=solvable,
+        )
+        np.divide(
+            hessian_aa * gradient_b - hessian_ab * gradient_a,
+            determinant,
+            out=step_b,
+            where=solvable,
+        )
+        a += step_a
+        b += step_b
+        if not n_groups or np.abs(step_b).max() < POISSON_TOLERANCE:
+            break
+    return b
+
+
+# trend statistics of the "Increase" views, all with the signature of linear_regression_slopes
+TREND_FUNCTIONS = {
+    "slope": linear_regression_slopes,
+    "poisson_growth_rate": poisson_growth_rates,
+}
+
+
+def calculate_trends(
+    df: pd.DataFrame,
+    group_columns: list[str],
+    y_column: str,
+    trend: str = "slope",
+) -> np.ndarray:
+    """
+    trend of y_column over COLLECTION_DATE for every group of group_columns
+
+    :param df: df with one row per group and COLLECTION_DATE
+    :param trend: key of TREND_FUNCTIONS
+    :return: trend per group, in the order of df.groupby(group_columns)
+    """
+    group_codes = df.groupby(group_columns).ngroup().to_numpy()
+    n_groups = int(group_codes.max()) + 1 if len(group_codes) else 0
+    # day offsets to the first date, small integers keep the sums exact
+    dates = pd.to_datetime(df["COLLECTION_DATE"])
+    x = (dates - dates.min()).dt.days.to_numpy().astype(float)
+    y = df[y_column].to_numpy().astype(float)
+    return TREND_FUNCTIONS[trend](x, y, group_codes, n_groups)
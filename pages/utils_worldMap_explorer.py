@@ -7,7 +7,9 @@ import time
 import pandas as pd
 from plotly import graph_objects as go
 import plotly.express as px
-from scipy.stats import linregress
+
+from pages.utils_sample_index import unique_sample_ids
+from pages.utils_trends import calculate_trends
 
 
 class VariantMapAndPlots(object):
@@ -18,12 +20,12 @@ class VariantMapAndPlots(object):
     world_dfs: list of world dfs of defined reference, len 1 for "complete", len 2 for "partial"
         with columns ["COUNTRY", "COLLECTION_DATE", "SEQ_TECH", "sample_id_list", "variant.label",
         "number_sequences", "element.symbol", "gene:variant"]
-        column sample_id_list: comma seperated sample ids e.g. "3,45,67" or "3"
+        column sample_id_list: sorted int32 array of sample ids e.g. array([3, 45, 67])
     countries: list of user selected countries
     seq_techs: list of user selected sequencing technologies
     mutations: list of user selected mutations gene:variant
     min_date: minimum date of date sider (hard coded!)
-    dates: list all dates in interval
+    date_range: (first date, last date) of interval
     color_dict: {gene:color}
     df_location: df with ISO_Code, lat, lon and name of all countries
     """
@@ -65,38 +67,35 @@ class VariantMapAndPlots(object):
         self.mutations = mutations
         self.seq_techs = seq_techs
         self.min_date = date_slider.min_date
-        self.dates = self.define_interval_dates(date_slider, dates, interval)
+        self.date_range = self.define_interval_date_range(date_slider, dates, interval)
         self.color_dict = color_dict
         self.df_location = location_coordinates[
             ["name", "ISO_Code", "lat", "lon"]
         ].rename(columns={"name": "COUNTRY"})
 
-    def define_interval_dates(
+    def define_interval_date_range(
         self, date_slider, dates: list, interval: int = 30
-    ) -> list[datetime.date]:
+    ) -> (datetime.date, datetime.date):
         """
-        :return: list of dates between second date and second_date-interval
-                or between "newest" COLLECTION_DATE and last 30 days
-        """
-        dates = date_slider.get_all_dates_in_interval(dates, interval)
-        if len(dates) == 0:
-            dates_in_world_df = sorted(
-                list(
-                    {
-                        i
-                        for s in [set(df["COLLECTION_DATE"]) for df in self.world_dfs]
-                        for i in s
-                    }
-                )
+        :return: (first date, second date) of the interval days up to the second date
+                or of the interval days up to the "newest" COLLECTION_DATE
+        """
+        date_range = date_slider.get_date_range_in_interval(dates, interval)
+        if date_range is None and interval and interval > 0:
+            # world dfs are sorted by COLLECTION_DATE
+            last_date = max(
+                (
+                    df["COLLECTION_DATE"].iloc[-1]
+                    for df in self.world_dfs
+                    if not df.empty
+                ),
+                default=date_slider.max_date,
             )
-            dates = [
-                dat
-                for dat in [
-                    dates_in_world_df[-1] - timedelta(days=x)
-                    for x in reversed(range(interval))
-                ]
-            ]
-        return dates
+            date_range = (
+                DateSlider.get_date_x_days_before(last_date, interval - 1),
+                last_date,
+            )
+        return date_range
 
     def filter_df(self, world_df: pd.DataFrame, countries: list[str]) -> pd.DataFrame:
         """
@@ -106,61 +105,43 @@ class VariantMapAndPlots(object):
         :return: filter df by date, seq tech, variant, countries
         """
         if countries:
-            df = world_df[
-                world_df["COLLECTION_DATE"].isin(self.dates)
-                & world_df["SEQ_TECH"].isin(self.seq_techs)
-                & world_df["gene:variant"].isin(self.mutations)
-                & world_df["COUNTRY"].isin(countries)
+            df = DateSlider.slice_by_date_range(world_df, self.date_range)
+            df = df[
+                df["SEQ_TECH"].isin(self.seq_techs)
+                & df["gene:variant"].isin(self.mutations)
+                & df["COUNTRY"].isin(countries)
             ]
         else:
             df = pd.DataFrame(columns=world_df.columns)
         df = df.astype({"number_sequences": "int32"})
         return df
 
-    def add_slope_column(self, df: pd.DataFrame) -> pd.DataFrame:
+    def get_increase_df(self, filtered_dfs, trend: str = "slope") -> pd.DataFrame:
         """
-        add slope column to df for increase df, slope calculated on nb seq per date
-        """
-        slopes = []
-        for i in range(len(df["number_sequences"])):
-            dates = [(date - self.min_date).days for date in df["COLLECTION_DATE"][i]]
-            seq_nb = df["number_sequences"][i]
-            if len(set(seq_nb)) == 1:
-                slopes.append(0)
-            else:
-                slopes.append(linregress(dates, seq_nb).slope)
-        df["slope"] = slopes
-        df = df.astype({"slope": float})
-        return df
-
-    def get_increase_df(self, filtered_dfs) -> pd.DataFrame:
-        """
-        shows change in frequency of the different mutations, calculate lin regression with scipy.stats module and
-        returns the slope of the regression line (x:range (interval)), y:number of sequences per day in selected interval
+        shows change in frequency of the different mutations, calculate lin regression
+        and returns the slope of the regression line (x:range (interval)), y:number of sequences per day in selected interval
         for choropleth map select slope with greatest increase
 
+        :param trend: trend statistic of column slope, key of TREND_FUNCTIONS
+            e.g. "slope" (linear regression) or "poisson_growth_rate"
         :return: increase df
         """
+        group_columns = ["COUNTRY", "variant.label", "element.symbol"]
         df = pd.concat(filtered_dfs, ignore_index=True, axis=0).reset_index(drop=True)
         df = (
-            df.groupby(
-                ["COUNTRY", "variant.label", "element.symbol", "COLLECTION_DATE"]
-            )
+            df.groupby(group_columns + ["COLLECTION_DATE"])
             .sum(numeric_only=True)
             .reset_index()
         )
+        # all groups at once from the number of sequences per day
+        slopes = calculate_trends(df, group_columns, "number_sequences", trend)
         df = (
-            df.groupby(["COUNTRY", "variant.label", "element.symbol"])
-            .agg(
-                {
-                    "number_sequences": lambda x: list(x),
-                    "COLLECTION_DATE": lambda x: list(x),
-                }
-            )
+            df.groupby(group_columns)
+            .agg({"number_sequences": list, "COLLECTION_DATE": list})
             .reset_index()
         )
-
-        df = self.add_slope_column(df)
+        df["slope"] = slopes
+        df = df.astype({"slope": float})
         return df
 
     def concat_filtered_dfs(self, filtered_dfs) -> pd.DataFrame:
@@ -236,21 +217,10 @@ class WorldMap(VariantMapAndPlots):
         concatenated_filtered_df = pd.concat(
             self.filtered_dfs, ignore_index=True, axis=0
         )
-        countries = []
-        number_sequences = []
-        for name, group in concatenated_filtered_df.groupby("COUNTRY"):
-            sample_set = {
-                item
-                for sublist in [
-                    sample.split(",") for sample in group["sample_id_list"].unique()
-                ]
-                for item in sublist
-            }
-            countries.append(name)
-            number_sequences.append(len(sample_set))
-        return pd.DataFrame(
-            list(zip(countries, number_sequences)),
-            columns=["COUNTRY", "number_sequences"],
+        return (
+            concatenated_filtered_df.groupby("COUNTRY")["sample_id_list"]
+            .agg(lambda sample_id_lists: len(unique_sample_ids(sample_id_lists)))
+            .reset_index(name="number_sequences")
         )
 
     def get_world_map_df(self, method: str) -> (pd.DataFrame, str):
@@ -402,27 +372,24 @@ class DetailPlots(VariantMapAndPlots):
         :return: number of samples in world_df after same filtering
                     + filter for mutations
         """
-        filtered_samples = set()
-        mut_filtered_samples = set()
+        filtered_samples = []
+        mut_filtered_samples = []
         for world_df in self.world_dfs:
-            filtered_df = world_df[
-                world_df["COLLECTION_DATE"].isin(self.dates)
-                & world_df["SEQ_TECH"].isin(self.seq_techs)
-                & world_df["COUNTRY"].isin(countries)
-                & world_df["element.symbol"].isin(genes)
-            ].copy()
-            filtered_df.sample_id_list = filtered_df.sample_id_list.map(
-                lambda x: x.split(",")
-            )
-            for sample_list in filtered_df["sample_id_list"].tolist():
-                filtered_samples.update(sample_list)
+            filtered_df = DateSlider.slice_by_date_range(world_df, self.date_range)
+            filtered_df = filtered_df[
+                filtered_df["SEQ_TECH"].isin(self.seq_techs)
+                & filtered_df["COUNTRY"].isin(countries)
+                & filtered_df["element.symbol"].isin(genes)
+            ]
+            filtered_samples.extend(filtered_df["sample_id_list"])
 
             df_filterd_mut = filtered_df[
                 filtered_df["gene:variant"].isin(self.mutations)
             ]
-            for sample_list in df_filterd_mut["sample_id_list"].tolist():
-                mut_filtered_samples.update(sample_list)
-        return len(filtered_samples), len(mut_filtered_samples)
+            mut_filtered_samples.extend(df_filterd_mut["sample_id_list"])
+        return len(unique_sample_ids(filtered_samples)), len(
+            unique_sample_ids(mut_filtered_samples)
+        )
 
     def calculate_ticks_from_dates(
         self, dates: set[datetime.date], date_numbers: set[int]
@@ -650,7 +617,13 @@ class DetailPlots(VariantMapAndPlots):
         if df.empty:
             df = pd.DataFrame(
                 data=[
-                    [self.location_name, self.dates[-1], "no_mutations", "no_gene", 0]
+                    [
+                        self.location_name,
+                        self.date_range[1],
+                        "no_mutations",
+                        "no_gene",
+                        0,
+                    ]
                 ],
                 columns=[
                     "COUNTRY",
@@ -733,7 +706,8 @@ class DetailPlots(VariantMapAndPlots):
         df = self.get_scatter_df()
 
         tickvals_date, ticktext_date = self.calculate_ticks_from_dates(
-            set(self.dates), set(df["date_numbers"])
+            set(DateSlider.get_dates_of_range(self.date_range)),
+            set(df["date_numbers"]),
         )
         # this try/except block is a hack that catches randomly appearing errors of data with wrong type,
         # unclear why this is working
@@ -748,26 +722,23 @@ class DetailPlots(VariantMapAndPlots):
         :return: samples from world_dfs filtered by date, seq tech, country and genes
                 for stacked bar plot
         """
-        samples = set()
+        sample_id_lists = []
         for world_df in self.world_dfs:
-            df = world_df[
-                world_df["COLLECTION_DATE"].isin(self.dates)
-                & world_df["SEQ_TECH"].isin(self.seq_techs)
-                & (world_df["COUNTRY"] == country)
-                & world_df["element.symbol"].isin(self.genes)
+            df = DateSlider.slice_by_date_range(world_df, self.date_range)
+            df = df[
+                df["SEQ_TECH"].isin(self.seq_techs)
+                & (df["COUNTRY"] == country)
+                & df["element.symbol"].isin(self.genes)
             ]
-            df.sample_id_list = df.sample_id_list.map(lambda x: x.split(","))
-            samples = samples.union(
-                {item for sublist in df["sample_id_list"] for item in sublist}
-            )
-        return samples
+            sample_id_lists.extend(df["sample_id_list"])
+        return set(unique_sample_ids(sample_id_lists).tolist())
 
     def get_df_for_stacked_bar_plot(self, country: str = None) -> pd.DataFrame:
         """
         df processing:
         1. for detail plot: country = clicked country,
            for map (not used right now) filter for country
-        2. split sample_id str into list of sample_ids
+        2. sample_id_list arrays
         3. explode table --> one row per sample_id, renamed from sample_id_list to sample.id
         4. add count column with value 1 for all rows
         5. add rows for every combination of sample and mutation if not in df of 4., count=0
@@ -795,9 +766,9 @@ class DetailPlots(VariantMapAndPlots):
         df = df[["sample_id_list", "gene:variant", "element.symbol"]]
 
         # one row per variant and sample
-        df["sample_id_list"] = df["sample_id_list"].apply(lambda x: x.split(","))
         df = df.explode("sample_id_list")
         df = df.rename(columns={"sample_id_list": "sample.id"})
+        df = df.astype({"sample.id": int})
         # count row needed for decision if variant is present in sample (def change)
         df["count"] = 1
 
@@ -903,6 +874,11 @@ class DetailPlots(VariantMapAndPlots):
         return fig
 
 
+# int32 day ordinals (date.toordinal) of COLLECTION_DATE in propertyView,
+# date filters compare integers instead of datetime.date objects
+DATE_ORDINAL_COLUMN = "COLLECTION_DATE_ORDINAL"
+
+
 class DateSlider:
     """
     handles dates and date slider below map
@@ -967,35 +943,92 @@ class DateSlider:
         """
         return (second_date - first_date).days
 
+    @staticmethod
+    def get_dates_of_range(date_range: tuple) -> list[datetime.date]:
+        """
+        :param date_range: (first date, last date) OR None for no dates
+        :return: list of all dates of date_range
+        """
+        if date_range is None:
+            return []
+        first_date, last_date = date_range
+        return [
+            first_date + timedelta(days=x)
+            for x in range(DateSlider.get_days_between_date(first_date, last_date) + 1)
+        ]
+
+    @staticmethod
+    def get_date_range(
+        first_date: datetime.time, second_date: datetime.time
+    ) -> (datetime.date, datetime.date):
+        """
+        :return: (day after first_date, second_date) OR None if second_date <= first_date
+        """
+        if second_date <= first_date:
+            return None
+        return first_date + timedelta(days=1), second_date
+
     @staticmethod
     def get_all_dates(
         first_date: datetime.time, second_date: datetime.time
     ) -> list[datetime.date]:
-        days = DateSlider.get_days_between_date(first_date, second_date)
-        date_list = [
-            d for d in [second_date - timedelta(days=x) for x in reversed(range(days))]
-        ]
-        return date_list
+        return DateSlider.get_dates_of_range(
+            DateSlider.get_date_range(first_date, second_date)
+        )
+
+    @staticmethod
+    def slice_by_date_range(df: pd.DataFrame, date_range: tuple) -> pd.DataFrame:
+        """
+        :param df: df sorted by COLLECTION_DATE, e.g. world_df
+        :param date_range: (first date, last date) OR None for no dates
+        :return: rows of df with COLLECTION_DATE in date_range, found by binary search
+        """
+        if date_range is None:
+            return df.iloc[0:0]
+        start = df["COLLECTION_DATE"].searchsorted(date_range[0], side="left")
+        stop = df["COLLECTION_DATE"].searchsorted(date_range[1], side="right")
+        return df.iloc[start:stop]
+
+    @staticmethod
+    def date_range_mask(date_ordinals: pd.Series, date_range: tuple) -> pd.Series:
+        """
+        date filter of dfs not sorted by COLLECTION_DATE, e.g. propertyView
+        :param date_ordinals: DATE_ORDINAL_COLUMN of propertyView
+        :param date_range: (first date, last date) OR None for no dates
+        :return: boolean mask, True for dates in date_range
+        """
+        if date_range is None:
+            return pd.Series(False, index=date_ordinals.index)
+        days = date_ordinals.to_numpy()
+        return pd.Series(
+            (days >= date_range[0].toordinal()) & (days <= date_range[1].toordinal()),
+            index=date_ordinals.index,
+        )
+
+    def get_date_range_in_interval(
+        self, dates: list[int], interval: int
+    ) -> (datetime.date, datetime.date):
+        """
+        uses second date and interval for preparing date range, starts earliest at min_date
+        :param dates: [first_date, second_date] of date slider as unix timestamps
+        :return date_range: (first date, second date) OR None if no date is in interval
+        """
+        second_date = DateSlider.unix_to_date(dates[1])
+        if not interval or interval < 0 or second_date < self.min_date:
+            return None
+        first_date = DateSlider.get_date_x_days_before(second_date, interval - 1)
+        return max(first_date, self.min_date), second_date
 
     def get_all_dates_in_interval(
-        self, dates: list[datetime.date], interval: int
+        self, dates: list[int], interval: int
     ) -> list[datetime.date]:
         """
         uses second date and interval for preparing date list
         :return date_list: list of dates (datetime.date)
         """
-        second_date = DateSlider.unix_to_date(dates[1])
-        if interval is None:
-            interval = 0
-        if DateSlider.get_date_x_days_before(second_date, interval) < self.min_date:
-            interval = (second_date - self.min_date).days + 1
-        date_list = [
-            d
-            for d in [
-                second_date - timedelta(days=x) for x in reversed(range(interval))
-            ]
-        ]
-        return date_list
+        return DateSlider.get_dates_of_range(
+            self.get_date_range_in_interval(dates, interval)
+        )
 
     def get_date_list_by_range(self) -> list[datetime.date]:
         """
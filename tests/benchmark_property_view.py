@@ -0,0 +1,141 @@
+"""
+benchmark of data.create_property_view against the former row-wise implementation
+
+generated propertyView with the properties of the mpox DB, run with
+    python -m tests.benchmark_property_view --samples 1000000
+"""
+import argparse
+from datetime import datetime
+from time import perf_counter
+
+from data import create_property_view
+from data import STRINGTYPE
+import numpy as np
+import pandas as pd
+
+PROPERTIES = {
+    "COLLECTION_DATE": "value_date",
+    "RELEASE_DATE": "value_date",
+    "IMPORTED": "value_date",
+    "LENGTH": "value_integer",
+    "COUNTRY": "value_text",
+    "GENOME_COMPLETENESS": "value_text",
+    "GEO_LOCATION": "value_text",
+    "HOST": "value_text",
+    "ISOLATE": "value_text",
+    "SEQ_TECH": "value_text",
+}
+
+
+def create_property_view_rowwise(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    create_property_view before vectorization, reference for output and runtime
+    """
+    df["value_text"] = df.apply(
+        lambda row: row["value_date"]
+        if row["property.name"] in ["COLLECTION_DATE", "RELEASE_DATE", "IMPORTED"]
+        else row["value_text"],
+        axis=1,
+    )
+    df = df.drop(columns=["value_date"], axis=1)
+    df["value_text"] = df.apply(
+        lambda row: row["value_integer"]
+        if row["property.name"] in ["LENGTH"]
+        else row["value_text"],
+        axis=1,
+    )
+    df = df.drop(columns=["value_integer"], axis=1)
+    cols = ["sample.id", "sample.name"]
+    df = df.set_index(["property.name"] + cols).unstack("property.name")
+    df = df.value_text.rename_axis([None], axis=1).reset_index()
+    df["COLLECTION_DATE"].fillna(df["RELEASE_DATE"], inplace=True)
+    df = df.dropna(subset=["COLLECTION_DATE"])
+    df["COLLECTION_DATE"] = df["COLLECTION_DATE"].apply(
+        lambda d: datetime.strptime(d, "%Y-%m-%d").date()
+    )
+    df["SEQ_TECH"] = df["SEQ_TECH"].replace([np.nan, ""], "undefined")
+    df["COUNTRY"] = df["COUNTRY"].replace([np.nan, ""], "undefined")
+    df["LENGTH"] = df["LENGTH"].astype(float).astype("Int64")
+    return df
+
+
+def generate_propertyView(nb_samples: int, seed: int = 0) -> pd.DataFrame:
+    """
+    long format propertyView with one row per sample and property,
+    some properties are missing (no row) or empty like in the DB
+
+    :return: df with columns
+        ['sample.id', 'sample.name', 'property.name', 'value_integer', 'value_text', 'value_date']
+    """
+    rng = np.random.default_rng(seed)
+    sample_ids = np.arange(1, nb_samples + 1)
+    days = pd.date_range("2022-05-01", "2023-03-01").strftime("%Y-%m-%d").to_numpy()
+    values = {
+        "COLLECTION_DATE": days,
+        "RELEASE_DATE": days,
+        "IMPORTED": days,
+        "LENGTH": np.arange(197100, 197220).astype(str),
+        "COUNTRY": np.array(["Germany", "USA", "Brazil", "Peru", ""]),
+        "GENOME_COMPLETENESS": np.array(["complete", "partial"]),
+        "GEO_LOCATION": np.array(["Germany", "USA: CA", "Peru: Lima", ""]),
+        "HOST": np.array(["Homo sapiens", ""]),
+        "ISOLATE": np.array(["MPXV/Germany/2022/RKI158", "MPXV/USA/2022/MA001"]),
+        "SEQ_TECH": np.array(["Illumina", "Oxford Nanopore", "Ion Torrent", ""]),
+    }
+    dfs = []
+    for property_name, column in PROPERTIES.items():
+        # ~10% of the samples have no collection date, 1% lack any other property
+        present = rng.random(nb_samples) >= (
+            0.1 if property_name == "COLLECTION_DATE" else 0.01
+        )
+        ids = sample_ids[present]
+        df = pd.DataFrame(
+            {
+                "sample.id": ids.astype("int32"),
+                "sample.name": np.char.add("OP", ids.astype(str)),
+                "property.name": property_name,
+                "value_integer": None,
+                "value_text": None,
+                "value_date": None,
+            }
+        )
+        df[column] = rng.choice(values[property_name], len(ids))
+        dfs.append(df)
+    df = pd.concat(dfs, ignore_index=True).sort_values("sample.id", kind="stable")
+    return df.reset_index(drop=True).astype(
+        {
+            column: STRINGTYPE
+            for column in [
+                "sample.name",
+                "property.name",
+                "value_integer",
+                "value_text",
+                "value_date",
+            ]
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=1000000)
+    args = parser.parse_args()
+    df = generate_propertyView(args.samples)
+    print(f"propertyView: {len(df)} rows, {args.samples} samples")
+
+    start = perf_counter()
+    new_df = create_property_view(df.copy())
+    new_time = perf_counter() - start
+    print(f"create_property_view: {new_time:.2f} sec.")
+
+    start = perf_counter()
+    old_df = create_property_view_rowwise(df.copy())
+    old_time = perf_counter() - start
+    print(f"row-wise create_property_view: {old_time:.2f} sec.")
+
+    pd.testing.assert_frame_equal(new_df, old_df, check_exact=True)
+    print(f"identical output, speedup {old_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import unittest
 
 from data import load_all_sql_files
 
+from pages.utils_worldMap_explorer import DATE_ORDINAL_COLUMN
 from pages.utils_worldMap_explorer import DateSlider
 
 DB_DUMP_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "sql_dumps")
@@ -65,3 +66,19 @@ class TestDateSlider(unittest.TestCase):
             date(2023, 1, 1),
         ]
         self.assertListEqual(date_list, correct_dates)
+
+    def test_date_range_mask(self):
+        propertyView = self.processed_df_dict["propertyView"]["complete"]
+        date_range = (date(2022, 7, 1), date(2022, 8, 15))
+        mask = DateSlider.date_range_mask(propertyView[DATE_ORDINAL_COLUMN], date_range)
+        self.assertListEqual(
+            list(mask),
+            [
+                date_range[0] <= d <= date_range[1]
+                for d in propertyView["COLLECTION_DATE"]
+            ],
+        )
+        assert 0 < mask.sum() < len(propertyView)
+        assert not DateSlider.date_range_mask(
+            propertyView[DATE_ORDINAL_COLUMN], None
+        ).any()
@@ -1,9 +1,36 @@
 from datetime import date
 import os
+import shutil
+import tempfile
 import unittest
 
+from data import ARROW_TYPES
+from data import create_property_view
+from data import DataFrameLoader
+from data import get_database_connection
+from data import get_deleted_sample_ids
+from data import get_high_water_mark
+from data import get_reference_ids
+from data import INTTYPE
 from data import load_all_sql_files
+from data import preprocess_tables
+from data import STRINGTYPE
+from data import update_processed_df_dict
+import pandas as pd
+from pandas._testing import assert_frame_equal
+import pyarrow as pa
+from sqlalchemy import text
 
+from pages.utils_sample_index import unique_sample_ids
+from pages.utils_snapshot import iter_partitions
+from pages.utils_snapshot import load_snapshot
+from pages.utils_snapshot import publish_snapshot
+from pages.utils_snapshot import read_manifest
+from pages.utils_snapshot import to_nested_dict
+from pages.utils_snapshot import write_snapshot
+from pages.utils_worldMap_explorer import DATE_ORDINAL_COLUMN
+from tests.benchmark_property_view import create_property_view_rowwise
+from tests.benchmark_property_view import generate_propertyView
 from tests.test_db_properties import DbProperties
 
 DB_DUMP_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "sql_dumps")
@@ -106,15 +133,7 @@ class TestDbPreprocessing(unittest.TestCase):
                         ]
                     )
 
-                    samples = set(
-                        [
-                            item
-                            for sublist in [
-                                x.split(",") for x in world_df_country["sample_id_list"]
-                            ]
-                            for item in sublist
-                        ]
-                    )
+                    samples = unique_sample_ids(world_df_country["sample_id_list"])
                     assert (
                         len(samples)
                         == DbProperties.samples_dict_cds_per_country[country][
@@ -207,3 +226,403 @@ class TestDbPreprocessing(unittest.TestCase):
                         completeness
                     ]
                 )
+
+    def test_snapshot(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            version = write_snapshot(self.processed_df_dict, snapshot_dir)
+            # second write publishes a new version, the first one is kept for running workers
+            new_version = write_snapshot(self.processed_df_dict, snapshot_dir)
+            assert read_manifest(snapshot_dir)["version"] == new_version
+            assert sorted(os.listdir(snapshot_dir)) == [
+                version,
+                new_version,
+                "manifest.json",
+            ]
+
+            snapshot_df_dict = load_snapshot(snapshot_dir)
+            assert list(snapshot_df_dict["variantView"]["complete"].keys()) == [2, 4]
+            for keys, df in iter_partitions(self.processed_df_dict):
+                snapshot_df = snapshot_df_dict
+                for key in keys:
+                    snapshot_df = snapshot_df[key]
+                # propertyView column labels have string dtype after unstacking
+                df = df.set_axis(list(df.columns), axis=1)
+                assert_frame_equal(snapshot_df, df, check_exact=True)
+
+    def test_snapshot_versions_in_use_are_kept(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            versions = [write_snapshot(self.processed_df_dict, snapshot_dir)]
+            # worker loaded the first version without reading any partition yet
+            snapshot_df_dict = load_snapshot(snapshot_dir)
+            versions += [
+                write_snapshot(self.processed_df_dict, snapshot_dir) for _ in range(2)
+            ]
+            assert sorted(os.listdir(snapshot_dir)) == versions + ["manifest.json"]
+            propertyView = self.processed_df_dict["propertyView"]["complete"]
+            assert_frame_equal(
+                snapshot_df_dict["propertyView"]["complete"],
+                propertyView.set_axis(list(propertyView.columns), axis=1),
+                check_exact=True,
+            )
+            # versions released by all workers are removed by the next rebuild
+            del snapshot_df_dict
+            versions.append(write_snapshot(self.processed_df_dict, snapshot_dir))
+            assert sorted(os.listdir(snapshot_dir)) == versions[-2:] + ["manifest.json"]
+
+    def test_incomplete_snapshot_is_not_loaded(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            version = write_snapshot(self.processed_df_dict, snapshot_dir)
+            version_path = os.path.join(snapshot_dir, version)
+            os.remove(os.path.join(version_path, os.listdir(version_path)[0]))
+            assert load_snapshot(snapshot_dir) is None
+            # version directory removed, manifest still points to it
+            shutil.rmtree(version_path)
+            assert load_snapshot(snapshot_dir) is None
+
+    def test_publish_snapshot(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            with tempfile.TemporaryDirectory() as shm_dir:
+                assert publish_snapshot(snapshot_dir, shm_dir) is None
+                version = write_snapshot(self.processed_df_dict, snapshot_dir)
+                assert publish_snapshot(snapshot_dir, shm_dir) == version
+                # already published version is not copied again
+                assert publish_snapshot(snapshot_dir, shm_dir) == version
+                assert sorted(os.listdir(shm_dir)) == [version, "manifest.json"]
+
+                shm_df_dict = load_snapshot(shm_dir)
+                propertyView = self.processed_df_dict["propertyView"]["complete"]
+                shm_propertyView = shm_df_dict["propertyView"]["complete"]
+                assert_frame_equal(
+                    shm_propertyView,
+                    propertyView.set_axis(list(propertyView.columns), axis=1),
+                    check_exact=True,
+                )
+                # numeric columns point into the mapped file instead of a private copy
+                assert not shm_propertyView["sample.id"].to_numpy().flags.writeable
+
+    def test_rows_to_record_batch(self):
+        # DB returns integer ids and NULLs, variant.id is stored as STRINGTYPE
+        rows = [(1, "sample_1", 10), (2, "sample_2", None)]
+        schema = pa.schema(
+            [
+                ("sample.id", ARROW_TYPES[INTTYPE]),
+                ("sample.name", ARROW_TYPES[STRINGTYPE]),
+                ("variant.id", ARROW_TYPES[STRINGTYPE]),
+            ]
+        )
+        batch = DataFrameLoader.rows_to_record_batch(rows, schema)
+        assert batch.schema == schema
+        assert batch.to_pydict() == {
+            "sample.id": [1, 2],
+            "sample.name": ["sample_1", "sample_2"],
+            "variant.id": ["10", None],
+        }
+
+    def test_create_property_view_matches_rowwise(self):
+        df = generate_propertyView(2000)
+        propertyView = create_property_view(df.copy())
+        assert_frame_equal(
+            propertyView.drop(columns=DATE_ORDINAL_COLUMN),
+            create_property_view_rowwise(df.copy()),
+            check_exact=True,
+        )
+        assert propertyView[DATE_ORDINAL_COLUMN].dtype == INTTYPE
+        self.assertListEqual(
+            list(propertyView[DATE_ORDINAL_COLUMN]),
+            [d.toordinal() for d in propertyView["COLLECTION_DATE"]],
+        )
+
+    def test_mutation_cube(self):
+        for completeness in ["complete", "partial"]:
+            propertyView = self.processed_df_dict["propertyView"][completeness]
+            for reference in [2, 4]:
+                variantView = self.processed_df_dict["variantView"][completeness][
+                    reference
+                ]["cds"]
+                mutation_cube = self.processed_df_dict["mutation_cube"][completeness][
+                    reference
+                ]
+                self.assertListEqual(
+                    list(mutation_cube.columns),
+                    ["element.symbol", "gene:variant", "SEQ_TECH", "COUNTRY", "count"],
+                )
+                merged_df = variantView.merge(propertyView, on="sample.id")
+                assert mutation_cube["count"].sum() == len(merged_df)
+                assert len(mutation_cube) == len(
+                    merged_df.drop_duplicates(["gene:variant", "SEQ_TECH", "COUNTRY"])
+                )
+
+    def test_profiles(self):
+        for completeness in ["complete", "partial"]:
+            for reference in [2, 4]:
+                variantViews = self.processed_df_dict["variantView"][completeness][
+                    reference
+                ]
+                profiles = self.processed_df_dict["profiles"][completeness][reference]
+                self.assertListEqual(
+                    list(profiles.columns),
+                    [
+                        "sample.id",
+                        "sample.name",
+                        "reference.id",
+                        "REFERENCE_ACCESSION",
+                        "AA_PROFILE",
+                        "NUC_PROFILE",
+                    ],
+                )
+                assert profiles["sample.id"].is_unique
+                assert set(profiles["sample.id"]) == set(
+                    variantViews["cds"]["sample.id"]
+                ).union(variantViews["source"]["sample.id"])
+                for seq_type, variant_column, profile_column in [
+                    ("cds", "gene:variant", "AA_PROFILE"),
+                    ("source", "variant.label", "NUC_PROFILE"),
+                ]:
+                    assert profiles[profile_column].dtype == "category"
+                    variants = (
+                        variantViews[seq_type]
+                        .groupby("sample.id")[variant_column]
+                        .agg(set)
+                    )
+                    for sample_id, profile in zip(
+                        profiles["sample.id"], profiles[profile_column]
+                    ):
+                        if sample_id in variants.index:
+                            assert set(profile.split(",")) == variants[sample_id]
+                        else:
+                            assert pd.isna(profile)
+
+    def test_incremental_update(self):
+        loader = DataFrameLoader(self.db_name)
+        loaded_df_dict = loader.load_db_from_test_db()
+        reference_ids = get_reference_ids(loaded_df_dict)
+        sample_ids = sorted(loaded_df_dict["propertyView"]["sample.id"].unique())
+        high_water_mark = int(sample_ids[len(sample_ids) // 2])
+        changed_sample_id = int(sample_ids[0])
+        # previous build: first half of samples, one sample was imported with other values
+        previous_df_dict = {
+            table: df[df["sample.id"] <= high_water_mark].reset_index(drop=True)
+            for table, df in loaded_df_dict.items()
+        }
+        propertyView = previous_df_dict["propertyView"]
+        propertyView["value_text"] = propertyView["value_text"].mask(
+            (propertyView["sample.id"] == changed_sample_id)
+            & (propertyView["property.name"] == "COUNTRY"),
+            "Atlantis",
+        )
+        variantView = previous_df_dict["variantView"]
+        previous_df_dict["variantView"] = variantView[
+            (variantView["sample.id"] != changed_sample_id)
+            | (variantView.index % 2 == 0)
+        ]
+        previous_df_dict = preprocess_tables(previous_df_dict, reference_ids)
+        assert get_high_water_mark(previous_df_dict)["sample.id"] == high_water_mark
+        # new samples and changed sample, as queried from DB
+        delta_df_dict = loader.load_db_from_test_db({"sample.id": high_water_mark})
+        assert set(delta_df_dict["propertyView"]["sample.id"]) == {
+            sample_id for sample_id in sample_ids if sample_id > high_water_mark
+        }
+        delta_df_dict = {
+            table: df[
+                (df["sample.id"] > high_water_mark)
+                | (df["sample.id"] == changed_sample_id)
+            ].reset_index(drop=True)
+            for table, df in loaded_df_dict.items()
+        }
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            write_snapshot(previous_df_dict, snapshot_dir)
+            updated_df_dict = update_processed_df_dict(
+                to_nested_dict(load_snapshot(snapshot_dir)), delta_df_dict
+            )
+        full_df_dict = preprocess_tables(
+            {table: df.copy() for table, df in loaded_df_dict.items()}, reference_ids
+        )
+        self.assert_same_partitions(updated_df_dict, full_df_dict)
+
+    def test_incremental_update_of_modified_and_deleted_samples(self):
+        loader = DataFrameLoader(self.db_name)
+        loaded_df_dict = loader.load_db_from_test_db()
+        reference_ids = get_reference_ids(loaded_df_dict)
+        previous_df_dict = preprocess_tables(
+            {table: df.copy() for table, df in loaded_df_dict.items()}, reference_ids
+        )
+        high_water_mark = get_high_water_mark(previous_df_dict, date.today())
+        propertyView = loaded_df_dict["propertyView"]
+        country_rows = propertyView[propertyView["property.name"] == "COUNTRY"]
+        modified_sample_id = int(country_rows["sample.id"].iloc[0])
+        country = country_rows["value_text"].iloc[0]
+        sample_name = country_rows["sample.name"].iloc[0]
+        deleted_sample_id = int(country_rows["sample.id"].iloc[1])
+        db_connection = get_database_connection(self.db_name)
+        # metadata correction of an imported sample, as written by pathosonar
+        with db_connection.begin() as connection:
+            connection.execute(
+                text(
+                    "UPDATE propertyView SET value_text = 'Atlantis'"
+                    " WHERE `sample.id` = :sample_id AND `property.name` = 'COUNTRY';"
+                ),
+                sample_id=modified_sample_id,
+            )
+            connection.execute(
+                text(
+                    "INSERT INTO propertyView (`sample.id`, `sample.name`, `property.id`,"
+                    " `property.name`, `propery.querytype`, `property.datatype`,"
+                    " value_date) VALUES (:sample_id, :sample_name, 16, 'MODIFIED',"
+                    " 'date', 'date', :modified);"
+                ),
+                sample_id=modified_sample_id,
+                sample_name=sample_name,
+                modified=date.today().isoformat(),
+            )
+        try:
+            delta_df_dict = loader.load_db_from_test_db(high_water_mark)
+            db_sample_ids = loader.load_sample_ids()
+            modified_df_dict = loader.load_db_from_test_db()
+        finally:
+            with db_connection.begin() as connection:
+                connection.execute(
+                    text(
+                        "UPDATE propertyView SET value_text = :country"
+                        " WHERE `sample.id` = :sample_id"
+                        " AND `property.name` = 'COUNTRY';"
+                    ),
+                    sample_id=modified_sample_id,
+                    country=country,
+                )
+                connection.execute(
+                    text(
+                        "DELETE FROM propertyView"
+                        " WHERE `sample.id` = :sample_id"
+                        " AND `property.name` = 'MODIFIED';"
+                    ),
+                    sample_id=modified_sample_id,
+                )
+        assert set(delta_df_dict["propertyView"]["sample.id"]) == {modified_sample_id}
+        # sample deleted from DB
+        db_sample_ids = db_sample_ids[db_sample_ids != deleted_sample_id]
+        deleted_sample_ids = get_deleted_sample_ids(previous_df_dict, db_sample_ids)
+        self.assertListEqual(list(deleted_sample_ids), [deleted_sample_id])
+        full_df_dict = preprocess_tables(
+            {
+                table: df[df["sample.id"] != deleted_sample_id].reset_index(drop=True)
+                for table, df in modified_df_dict.items()
+            },
+            reference_ids,
+        )
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            write_snapshot(previous_df_dict, snapshot_dir, high_water_mark)
+            updated_df_dict = update_processed_df_dict(
+                to_nested_dict(load_snapshot(snapshot_dir)),
+                delta_df_dict,
+                deleted_sample_ids,
+            )
+        self.assert_same_partitions(updated_df_dict, full_df_dict)
+        propertyView = pd.concat(updated_df_dict["propertyView"].values())
+        assert "MODIFIED" not in propertyView.columns
+        self.assertListEqual(
+            list(
+                propertyView.loc[
+                    propertyView["sample.id"] == modified_sample_id, "COUNTRY"
+                ]
+            ),
+            ["Atlantis"],
+        )
+        assert deleted_sample_id not in set(propertyView["sample.id"])
+
+    def test_incremental_update_of_deleted_samples_only(self):
+        loader = DataFrameLoader(self.db_name)
+        loaded_df_dict = loader.load_db_from_test_db()
+        reference_ids = get_reference_ids(loaded_df_dict)
+        previous_df_dict = preprocess_tables(
+            {table: df.copy() for table, df in loaded_df_dict.items()}, reference_ids
+        )
+        # no new or modified samples since the last build
+        delta_df_dict = loader.load_db_from_test_db(
+            get_high_water_mark(previous_df_dict, date.today())
+        )
+        assert delta_df_dict["propertyView"].empty
+        deleted_sample_id = int(loaded_df_dict["propertyView"]["sample.id"].iloc[0])
+        db_sample_ids = loader.load_sample_ids()
+        deleted_sample_ids = get_deleted_sample_ids(
+            previous_df_dict, db_sample_ids[db_sample_ids != deleted_sample_id]
+        )
+        self.assertListEqual(list(deleted_sample_ids), [deleted_sample_id])
+        full_df_dict = preprocess_tables(
+            {
+                table: df[df["sample.id"] != deleted_sample_id].reset_index(drop=True)
+                for table, df in loaded_df_dict.items()
+            },
+            reference_ids,
+        )
+        updated_df_dict = update_processed_df_dict(
+            previous_df_dict, delta_df_dict, deleted_sample_ids
+        )
+        self.assert_same_partitions(updated_df_dict, full_df_dict)
+
+    def test_create_property_view_of_delta_without_property(self):
+        # delta of an incremental rebuild, no changed sample has SEQ_TECH or RELEASE_DATE
+        df = pd.DataFrame(
+            [
+                [1, "sample_1", "COLLECTION_DATE", None, None, "2022-06-01"],
+                [1, "sample_1", "GENOME_COMPLETENESS", None, "complete", None],
+                [1, "sample_1", "COUNTRY", None, "Germany", None],
+            ],
+            columns=[
+                "sample.id",
+                "sample.name",
+                "property.name",
+                "value_integer",
+                "value_text",
+                "value_date",
+            ],
+        )
+        propertyView = create_property_view(df)
+        self.assertListEqual(list(propertyView["SEQ_TECH"]), ["undefined"])
+        self.assertListEqual(list(propertyView["COUNTRY"]), ["Germany"])
+        self.assertListEqual(list(propertyView["COLLECTION_DATE"]), [date(2022, 6, 1)])
+        assert propertyView["RELEASE_DATE"].isna().all()
+        assert create_property_view(df.iloc[:0]).empty
+
+    def assert_same_partitions(self, updated_df_dict: dict, full_df_dict: dict):
+        for keys, df in iter_partitions(full_df_dict):
+            updated_df = updated_df_dict
+            for key in keys:
+                updated_df = updated_df[key]
+            if keys[0] in ["variantView", "mutation_cube"]:
+                # same rows, order of appended samples differs
+                columns = list(df.columns)
+                df = df.sort_values(columns).reset_index(drop=True)
+                updated_df = updated_df.sort_values(columns).reset_index(drop=True)
+            df = df.set_axis(list(df.columns), axis=1)
+            updated_df = updated_df.set_axis(list(updated_df.columns), axis=1)
+            if "sample_id_list" in df.columns:
+                df["sample_id_list"] = df["sample_id_list"].map(list)
+                updated_df["sample_id_list"] = updated_df["sample_id_list"].map(list)
+            assert_frame_equal(
+                updated_df, df, check_dtype=False, check_index_type=False, obj=keys
+            )
+
+    def test_preprocess_tables_in_pool(self):
+        loaded_df_dict = DataFrameLoader(self.db_name).load_db_from_test_db()
+        processed_df_dict = preprocess_tables(
+            loaded_df_dict, get_reference_ids(loaded_df_dict), jobs=2
+        )
+        self.assertListEqual(
+            [keys for keys, _df in iter_partitions(processed_df_dict)],
+            [keys for keys, _df in iter_partitions(self.processed_df_dict)],
+        )
+        for keys, df in iter_partitions(self.processed_df_dict):
+            pool_df = processed_df_dict
+            for key in keys:
+                pool_df = pool_df[key]
+            if "sample_id_list" in df.columns:
+                df = df.assign(sample_id_list=df["sample_id_list"].map(list))
+                pool_df = pool_df.assign(
+                    sample_id_list=pool_df["sample_id_list"].map(list)
+                )
+            assert_frame_equal(
+                pool_df.set_axis(list(pool_df.columns), axis=1),
+                df.set_axis(list(df.columns), axis=1),
+                check_exact=True,
+                obj=keys,
+            )
@@ -53,6 +53,7 @@ class DbProperties:
         "LENGTH",
         "RELEASE_DATE",
         "SEQ_TECH",
+        "COLLECTION_DATE_ORDINAL",
     ]
 
     source_variants = {
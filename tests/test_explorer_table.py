@@ -3,8 +3,10 @@ import os
 import unittest
 
 from data import load_all_sql_files
+import pandas as pd
 from parameterized import parameterized
 
+from pages.utils_tables import parse_filter_query
 from pages.utils_tables import TableFilter
 from pages.utils_worldMap_explorer import DateSlider
 from tests.test_db_properties import DbProperties
@@ -117,3 +119,109 @@ class TestExplorerTable(unittest.TestCase):
         )
         assert table_df.empty
         self.assertListEqual(list(table_df.columns), self.final_cols)
+
+    def _get_page(self, page_current, page_size, sort_by=None, filter_query=""):
+        samples = self.table_explorer.get_explore_samples(
+            self.processed_df_dict,
+            "partial",
+            self.seq_techs,
+            2,
+            self.date_list,
+            self.countries,
+        )
+        return self.table_explorer.create_explore_table_page(
+            self.processed_df_dict,
+            "partial",
+            2,
+            samples,
+            page_current,
+            page_size,
+            sort_by,
+            filter_query,
+        )
+
+    @staticmethod
+    def _profiles_as_sets(df):
+        df = df.copy()
+        for column in ["NUC_PROFILE", "AA_PROFILE"]:
+            df[column] = df[column].map(
+                lambda x: frozenset(x.split(",")) if isinstance(x, str) else x
+            )
+        return df.reset_index(drop=True)
+
+    def test_table_pages(self):
+        full_table_df = self.table_explorer.create_explore_table(
+            self.processed_df_dict,
+            "partial",
+            self.seq_techs,
+            2,
+            self.date_list,
+            self.countries,
+        ).sort_values("sample.name")
+        pages = []
+        for page_current in range(3):
+            page_df, page_count = self._get_page(page_current, 100)
+            assert page_count == 3
+            self.assertListEqual(list(page_df.columns), self.final_cols)
+            pages.append(page_df)
+        assert [len(page_df) for page_df in pages] == [100, 100, 30]
+        assert self._get_page(3, 100)[0].empty
+        self.assertTrue(
+            self._profiles_as_sets(pd.concat(pages)).equals(
+                self._profiles_as_sets(full_table_df)
+            )
+        )
+
+    def test_table_page_sorting_filtering(self):
+        page_df, page_count = self._get_page(
+            0,
+            500,
+            [{"column_id": "LENGTH", "direction": "desc"}],
+            "{COUNTRY} scontains Germany && {LENGTH} > 100",
+        )
+        assert page_count == 1
+        assert not page_df.empty
+        assert set(page_df["COUNTRY"]) == {"Germany"}
+        assert page_df["LENGTH"].is_monotonic_decreasing
+        page_df, _ = self._get_page(0, 500, None, '{AA_PROFILE} contains "OPG197:T22K"')
+        assert not page_df.empty
+        assert all("OPG197:T22K" in x.split(",") for x in page_df["AA_PROFILE"])
+
+    def test_table_export(self):
+        sort_by = [{"column_id": "COUNTRY", "direction": "desc"}]
+        filter_query = "{LENGTH} > 100"
+        samples = self.table_explorer.get_explore_samples(
+            self.processed_df_dict,
+            "partial",
+            self.seq_techs,
+            2,
+            self.date_list,
+            self.countries,
+        )
+        export_df = self.table_explorer.create_explore_table_export(
+            self.processed_df_dict, "partial", 2, samples, sort_by, filter_query
+        )
+        self.assertListEqual(list(export_df.columns), self.final_cols)
+        # all pages of the table in the same order
+        pages = []
+        page_current, page_count = 0, 1
+        while page_current < page_count:
+            page_df, page_count = self._get_page(
+                page_current, 100, sort_by, filter_query
+            )
+            pages.append(page_df)
+            page_current += 1
+        assert page_count > 1
+        self.assertTrue(
+            self._profiles_as_sets(export_df).equals(
+                self._profiles_as_sets(pd.concat(pages))
+            )
+        )
+
+    def test_parse_filter_query(self):
+        self.assertListEqual(
+            parse_filter_query(
+                '{COUNTRY} icontains "germany" && {LENGTH} ge 5 && {HOST} is blank'
+            ),
+            [("COUNTRY", "contains", "germany", False), ("LENGTH", ">=", "5", True)],
+        )
@@ -128,6 +128,7 @@ class TestFilterUtils(unittest.TestCase):
                 "LENGTH",
                 "RELEASE_DATE",
                 "SEQ_TECH",
+                "COLLECTION_DATE_ORDINAL",
             ],
             "partial": 69,
         }
@@ -450,13 +451,15 @@ class TestFilterUtils(unittest.TestCase):
         }
 
         propertyView = self.processed_df_dict["propertyView"]["complete"]
-        variantView = self.processed_df_dict["variantView"]["complete"][2][aa_nt_radio]
+        gene_index = self.processed_df_dict["variant_index"]["complete"][2][
+            aa_nt_radio
+        ]["element.symbol"]
         gene_value = (
             self.gene_value_cds if aa_nt_radio == "cds" else self.gene_value_source
         )
         min_date = "2022-08-01"
         filtered_propertyView = filter_propertyView_by_seqtech_and_gene(
-            variantView,
+            gene_index,
             propertyView,
             self.seqtech_value,
             gene_value,
@@ -473,7 +476,7 @@ class TestFilterUtils(unittest.TestCase):
         )
 
         filtered_propertyView = filter_propertyView_by_seqtech_and_gene(
-            variantView,
+            gene_index,
             propertyView,
             self.seqtech_value,
             gene_value,
@@ -0,0 +1,55 @@
+import unittest
+
+import pandas as pd
+
+from pages.utils_mutation_signature import count_tri_mutation_types
+from pages.utils_mutation_signature import create_snp_type_counts
+
+
+class TestMutationSignature(unittest.TestCase):
+    """
+    test mutation signature counts of aggregated substitutions
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # substitutions of the references "ACGTAC" and "TTCA" with their flanking bases
+        cls.snp_counts = pd.DataFrame(
+            {
+                "reference.accession": [
+                    "NC_063383.1",
+                    "NC_063383.1",
+                    "NC_063383.1",
+                    "MT903344.1",
+                ],
+                "variant.ref": ["C", "T", "A", "C"],
+                "variant.alt": ["T", "G", "G", "A"],
+                "nt_before": ["A", "G", "", "T"],
+                "nt_after": ["G", "A", "C", "A"],
+                "count": [3, 2, 4, 1],
+            }
+        )
+
+    def test_count_tri_mutation_types(self):
+        final_dict = count_tri_mutation_types(self.snp_counts)
+        assert final_dict["NC_063383.1"]["C>T"]["AC>TG"] == 3
+        assert final_dict["NC_063383.1"]["T>G"]["GT>GA"] == 2
+        assert final_dict["MT903344.1"]["C>A"]["TC>AA"] == 1
+        for accession, counts in [("NC_063383.1", 5), ("MT903344.1", 1)]:
+            assert len(final_dict[accession]) == 6
+            assert (
+                sum(sum(types.values()) for types in final_dict[accession].values())
+                == counts
+            )
+
+    def test_create_snp_type_counts(self):
+        df = create_snp_type_counts(self.snp_counts).set_index(
+            ["genome_assembly", "mutation"]
+        )["count"]
+        assert df["NC_063383.1", "C>T"] == 3
+        assert df["NC_063383.1", "AC>AT"] == 3
+        assert df["NC_063383.1", "CG>TG"] == 3
+        assert df["NC_063383.1", "AC>TG"] == 3
+        # no base before the substitution -> end change equals single change
+        assert df["NC_063383.1", "A>G"] == 8
+        assert pd.isna(df["MT903344.1", "A>G"])
@@ -0,0 +1,131 @@
+from datetime import date
+import fnmatch
+import unittest
+
+import pandas as pd
+from pandas._testing import assert_frame_equal
+
+from pages.utils_result_cache import date_range
+from pages.utils_result_cache import remove_results
+from pages.utils_result_cache import result_key
+from pages.utils_result_cache import ResultCache
+
+
+class DictRedis:
+    """
+    redis commands used by the result cache, stored in a dict
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key.encode())
+
+    def set(self, key, value, ex=None):
+        self.data[key.encode()] = value
+
+    def scan_iter(self, match, count=None):
+        return [key for key in self.data if fnmatch.fnmatch(key.decode(), match)]
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+
+class TestResultCache(unittest.TestCase):
+    """
+    test canonical keys, size based eviction and the shared tier of the result cache
+    """
+
+    def setUp(self):
+        self.calls = []
+
+    def compute(self, value):
+        self.calls.append(value)
+        return pd.DataFrame({"sample.name": ["a", "b"], "COUNTRY": [value, value]})
+
+    def test_canonical_key(self):
+        key = result_key(
+            "v1",
+            "explore_samples",
+            {
+                "countries": ["USA", "Germany"],
+                "dates": date_range([date(2022, 6, 3), date(2022, 6, 1)]),
+                "reference": 2,
+            },
+        )
+        assert key.startswith("mpxradar:result:v1:explore_samples:")
+        assert key == result_key(
+            "v1",
+            "explore_samples",
+            {
+                "reference": 2,
+                "dates": [date(2022, 6, 1), date(2022, 6, 3)],
+                "countries": ["Germany", "USA"],
+            },
+        )
+        assert key != result_key(
+            "v2",
+            "explore_samples",
+            {
+                "reference": 2,
+                "dates": [date(2022, 6, 1), date(2022, 6, 3)],
+                "countries": ["Germany", "USA"],
+            },
+        )
+        assert key != result_key(
+            "v1",
+            "explore_samples",
+            {
+                "reference": 2,
+                "dates": [date(2022, 6, 1), date(2022, 6, 3)],
+                "countries": ["Germany"],
+            },
+        )
+
+    def test_local_tier(self):
+        result_cache = ResultCache(None, DictRedis())
+        assert result_cache.redis_client is None
+        df = result_cache.get_or_compute(
+            "table", lambda: self.compute("USA"), countries=["USA", "Germany"]
+        )
+        df["COUNTRY"] = "changed"
+        cached_df = result_cache.get_or_compute(
+            "table", lambda: self.compute("USA"), countries=["Germany", "USA"]
+        )
+        assert_frame_equal(cached_df, self.compute("USA"))
+        assert self.calls == ["USA", "USA"]
+
+    def test_size_based_eviction(self):
+        result_cache = ResultCache(None)
+        result_cache.get_or_compute("table", lambda: self.compute("a"), country="a")
+        result_cache.max_bytes = result_cache._local_bytes * 2
+        result_cache.get_or_compute("table", lambda: self.compute("b"), country="b")
+        result_cache.get_or_compute("table", lambda: self.compute("a"), country="a")
+        # "b" is the least recently used result
+        result_cache.get_or_compute("table", lambda: self.compute("c"), country="c")
+        assert len(result_cache._local) == 2
+        assert result_cache._local_bytes <= result_cache.max_bytes
+        result_cache.get_or_compute("table", lambda: self.compute("a"), country="a")
+        result_cache.get_or_compute("table", lambda: self.compute("b"), country="b")
+        assert self.calls == ["a", "b", "c", "b"]
+
+    def test_shared_tier(self):
+        redis_client = DictRedis()
+        worker_1 = ResultCache("v1", redis_client)
+        worker_2 = ResultCache("v1", redis_client)
+        worker_1.get_or_compute("table", lambda: self.compute("a"), country="a")
+        assert_frame_equal(
+            worker_2.get_or_compute("table", lambda: self.compute("a"), country="a"),
+            self.compute("a"),
+        )
+        assert self.calls == ["a", "a"]
+        # a new dataset version invalidates all results
+        worker_3 = ResultCache("v2", redis_client)
+        worker_3.get_or_compute("table", lambda: self.compute("a"), country="a")
+        assert len(redis_client.data) == 2
+        assert remove_results(redis_client, "v2") == 1
+        assert len(redis_client.data) == 1
+        worker_4 = ResultCache("v1", redis_client)
+        worker_4.get_or_compute("table", lambda: self.compute("a"), country="a")
+        assert self.calls == ["a", "a", "a", "a"]
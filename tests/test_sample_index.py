@@ -0,0 +1,116 @@
+from datetime import date
+import unittest
+
+import numpy as np
+import pandas as pd
+from pandas._testing import assert_frame_equal
+
+from pages.utils_sample_index import count_samples_by_value
+from pages.utils_sample_index import create_sample_index
+from pages.utils_sample_index import intersect_samples
+from pages.utils_sample_index import select_samples
+from pages.utils_sample_index import select_samples_in_range
+from pages.utils_sample_index import unique_sample_ids
+
+
+class TestSampleIndex(unittest.TestCase):
+    """
+    test inverted sample index and set operations on sample id arrays
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.variantView = pd.DataFrame(
+            {
+                "sample.id": [7, 3, 3, 5, 7, 9, 3],
+                "gene:variant": [
+                    "OPG001:A1B",
+                    "OPG001:A1B",
+                    "OPG002:C2D",
+                    "OPG002:C2D",
+                    "OPG002:C2D",
+                    "OPG003:E3F",
+                    "OPG001:A1B",
+                ],
+            }
+        )
+        cls.index_df = create_sample_index(cls.variantView, "gene:variant")
+
+    def test_create_sample_index(self):
+        self.assertListEqual(
+            list(self.index_df["gene:variant"]),
+            ["OPG001:A1B", "OPG002:C2D", "OPG003:E3F"],
+        )
+        self.assertListEqual(
+            [list(ids) for ids in self.index_df["sample_id_list"]],
+            [[3, 7], [3, 5, 7], [9]],
+        )
+        assert self.index_df["sample_id_list"][0].dtype == np.int32
+
+    def test_select_samples(self):
+        self.assertListEqual(
+            list(
+                select_samples(
+                    [self.index_df], "gene:variant", ["OPG001:A1B", "OPG003:E3F"]
+                )
+            ),
+            [3, 7, 9],
+        )
+        assert len(select_samples([self.index_df], "gene:variant", [])) == 0
+
+    def test_select_samples_in_range(self):
+        date_index = create_sample_index(
+            pd.DataFrame(
+                {
+                    "sample.id": [7, 3, 5, 9, 1],
+                    "COLLECTION_DATE": [
+                        date(2022, 7, 1),
+                        date(2022, 7, 3),
+                        date(2022, 7, 3),
+                        date(2022, 7, 8),
+                        date(2022, 6, 30),
+                    ],
+                }
+            ),
+            "COLLECTION_DATE",
+        )
+        self.assertListEqual(
+            list(
+                select_samples_in_range(
+                    [date_index], "COLLECTION_DATE", date(2022, 7, 1), date(2022, 7, 3)
+                )
+            ),
+            [3, 5, 7],
+        )
+        assert (
+            len(
+                select_samples_in_range(
+                    [date_index], "COLLECTION_DATE", date(2022, 7, 4), date(2022, 7, 7)
+                )
+            )
+            == 0
+        )
+
+    def test_set_operations(self):
+        self.assertListEqual(
+            list(unique_sample_ids([np.array([1, 4]), np.array([2, 4, 8])])),
+            [1, 2, 4, 8],
+        )
+        self.assertListEqual(
+            list(intersect_samples(np.array([1, 4, 8]), np.array([2, 4, 8, 9]))), [4, 8]
+        )
+        assert len(intersect_samples(np.array([1]), np.array([], dtype="int32"))) == 0
+
+    def test_count_samples_by_value(self):
+        df = count_samples_by_value(
+            [self.index_df],
+            "gene:variant",
+            ["OPG001:A1B", "OPG002:C2D", "OPG003:E3F"],
+            np.array([3, 5]),
+        )
+        assert_frame_equal(
+            df,
+            pd.DataFrame(
+                {"gene:variant": ["OPG001:A1B", "OPG002:C2D"], "count": [1, 2]}
+            ),
+        )
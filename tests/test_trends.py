@@ -0,0 +1,84 @@
+from datetime import date
+import unittest
+
+import numpy as np
+import pandas as pd
+from scipy.stats import linregress
+
+from pages.utils_trends import calculate_trends
+from pages.utils_trends import linear_regression_slopes
+from pages.utils_trends import poisson_growth_rates
+
+
+class TestTrends(unittest.TestCase):
+    """
+    test trend statistics computed for all groups at once
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # group 0: increasing, group 1: one day, group 2: constant, group 3: decreasing
+        cls.x = np.array([0, 1, 3, 7, 5, 0, 2, 4, 1, 2, 6, 9], dtype=float)
+        cls.y = np.array([1, 2, 2, 9, 4, 3, 3, 3, 8, 6, 3, 1], dtype=float)
+        cls.group_codes = np.array([0, 0, 0, 0, 1, 2, 2, 2, 3, 3, 3, 3])
+
+    def test_linear_regression_slopes(self):
+        slopes = linear_regression_slopes(self.x, self.y, self.group_codes, 4)
+        for group in [0, 3]:
+            mask = self.group_codes == group
+            self.assertAlmostEqual(
+                slopes[group], linregress(self.x[mask], self.y[mask]).slope, places=12
+            )
+        assert slopes[1] == 0
+        assert slopes[2] == 0
+        assert (
+            len(
+                linear_regression_slopes(
+                    np.empty(0), np.empty(0), np.empty(0, dtype=int), 0
+                )
+            )
+            == 0
+        )
+
+    def test_poisson_growth_rates(self):
+        # exact exponential growth: counts doubling every day
+        x = np.arange(6, dtype=float)
+        rates = poisson_growth_rates(
+            np.concatenate([x, [3.0]]),
+            np.concatenate([2**x, [5.0]]),
+            np.array([0, 0, 0, 0, 0, 0, 1]),
+            2,
+        )
+        self.assertAlmostEqual(rates[0], np.log(2), places=10)
+        assert rates[1] == 0
+        rates = poisson_growth_rates(self.x, self.y, self.group_codes, 4)
+        assert rates[0] > 0
+        assert rates[3] < 0
+        self.assertAlmostEqual(rates[2], 0, places=10)
+
+    def test_calculate_trends(self):
+        df = pd.DataFrame(
+            {
+                "COUNTRY": ["USA", "Germany", "USA", "Germany", "USA"],
+                "COLLECTION_DATE": [
+                    date(2022, 7, 3),
+                    date(2022, 7, 1),
+                    date(2022, 7, 1),
+                    date(2022, 7, 2),
+                    date(2022, 7, 2),
+                ],
+                "number_sequences": [6, 1, 2, 3, 4],
+            }
+        )
+        # groups in groupby order: Germany, USA
+        np.testing.assert_allclose(
+            calculate_trends(df, ["COUNTRY"], "number_sequences"), [2.0, 2.0]
+        )
+        np.testing.assert_allclose(
+            calculate_trends(
+                df, ["COUNTRY"], "number_sequences", trend="poisson_growth_rate"
+            )[0],
+            poisson_growth_rates(
+                np.array([0.0, 1.0]), np.array([1.0, 3.0]), np.array([0, 0]), 1
+            )[0],
+        )